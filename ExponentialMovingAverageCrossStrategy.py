@@ -0,0 +1,34 @@
+from indicator_cache import exponential_moving_average
+from indicators import RollingEma, ema_matrix
+from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+
+class ExponentialMovingAverageCrossStrategy(MovingAverageCrossStrategy):
+    """MovingAverageCrossStrategy on exponential instead of simple
+    moving averages, ewm(span=window, adjust=False).mean(). The signals
+    keep the 'short_mavg' and 'long_mavg' column names, so the
+    portfolios and reports work on them unchanged.
+
+    Requires:
+    symbol - A stock symbol on which to form a strategy on.
+    bars - A DataFrame of bars for the above symbol, or a bars.Bars.
+    short_window - Span of the short exponential moving average.
+    long_window - Span of the long exponential moving average.
+    cache - The IndicatorCache to take moving averages from, by default
+        the one shared by all strategies.
+    lazy - Whether to defer generate_signals until the signals are
+        first read, instead of running it here.
+    stop_loss - Optionally the fractional loss from the entry close
+        that exits a trade early."""
+
+    def moving_average(self, close, window):
+        return exponential_moving_average(close, window, self.cache)
+
+    def moving_average_arrays(self, close, short_out, long_out):
+        # Both spans in a single pass over the bars
+        means = ema_matrix(close, [self.short_window, self.long_window])
+        short_out[:] = means[:, 0]
+        long_out[:] = means[:, 1]
+        return short_out, long_out
+
+    def rolling_average(self, window):
+        return RollingEma(window)
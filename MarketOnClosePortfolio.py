@@ -1,4 +1,5 @@
 from portfolio import Portfolio
+from portfolio_engine import all_in_portfolio
 import pandas as pd
 import numpy as np
 
@@ -9,49 +10,89 @@ class MarketOnClosePortfolio(Portfolio):
 
     Requires:
     symbol - A stock symbol which forms the basis of the portfolio.
-    bars - A DataFrame of bars for a symbol set.
-    signals - A pandas DataFrame of signals (1, 0, -1) for each symbol.
-    initial_capital - The amount in cash at the start of the portfolio."""
+    bars - A DataFrame of bars for a symbol set, or a bars.Bars.
+    signals - A pandas DataFrame of signals (1, 0, -1) for each symbol,
+        or the dict of arrays from generate_signal_arrays.
+    initial_capital - The amount in cash at the start of the portfolio.
+    lazy - Whether to defer generate_positions until the positions are
+        first read, instead of running it here.
 
-    def __init__(self, symbol, bars, signals, initial_capital=100000.0):
+    bars and signals may be None when the portfolio is only fed through
+    on_bar. signals may also be a lazy.LazyPipeline, whose 'positions'
+    are then only computed when the portfolio is generated."""
+
+    def __init__(self, symbol, bars, signals, initial_capital=100000.0, lazy=False):
         self.symbol = symbol
         self.bars = bars
         self.signals = signals
         self.initial_capital = float(initial_capital)
-        self.positions = self.generate_positions()
+        self.reset_stream()
+        if signals is not None and not lazy:
+            self.positions = self.generate_positions()
+
+    def __getattr__(self, name):
+        # Only reached while the positions of a lazy portfolio are unset
+        if name == 'positions' and self.__dict__.get('signals') is not None:
+            self.positions = self.generate_positions()
+            return self.positions
+        raise AttributeError(name)
+
+    def reset_stream(self):
+        """Clears the on_bar state back to an all-cash portfolio."""
+        self._shares = 0.0
+        self._cash = self.initial_capital
+        self._last_total = np.nan
+
+    def _index(self):
+        # Signals given as a dict of arrays carry no index of their own
+        index = getattr(self.signals, 'index', None)
+        return self.bars.index if index is None else index
 
     def generate_positions(self):
-        positions = pd.DataFrame(index=self.signals.index).fillna(0.0)
+        if isinstance(self.signals, dict):
+            return 100 * np.asarray(self.signals['signal'])
+        positions = pd.DataFrame(index=self._index()).fillna(0.0)
         positions[self.symbol] = 100 * self.signals['signal']  # This strategy buys 100 shares
         return positions
 
+    def generate_portfolio_arrays(self):
+        """Array counterpart of generate_portfolio, returning the dict of
+        'positions', 'cash', 'holdings', 'total' and 'returns' arrays
+        without building a DataFrame."""
+        return all_in_portfolio(np.asarray(self.bars['Close'], dtype=np.float64),
+                                np.asarray(self.signals['positions'], dtype=np.float64),
+                                self.initial_capital)
+
     def generate_portfolio(self):
-        portfolio = pd.DataFrame(index=self.signals.index,
-                                 data=self.generate_portfolio_detail(),
-                                 columns=['positions', 'cash'])
-        portfolio.fillna(method='ffill', inplace=True)
-        portfolio['holdings'] = portfolio['positions'] * self.bars['Close']
-        portfolio['total'] = portfolio['holdings'] + portfolio['cash']
-        portfolio['returns'] = portfolio['total'].pct_change()
+        portfolio = pd.DataFrame(index=self._index(),
+                                 data=self.generate_portfolio_arrays(),
+                                 columns=['positions', 'cash', 'holdings', 'total', 'returns'])
         return portfolio
 
+    def on_bar(self, bar, signal):
+        """Fills the order in signal['positions'] at bar['Close'] and
+        returns the portfolio row for this bar, equal to the row
+        generate_portfolio produces for it on the full history."""
+        close = bar['Close']
+        order = signal['positions']
+        if order == 1:
+            self._shares = np.floor(self._cash / close)
+            self._cash -= self._shares * close
+        elif order == -1:
+            self._cash += self._shares * close
+            self._shares = 0.0
+        holdings = self._shares * close
+        total = holdings + self._cash
+        returns = total / self._last_total - 1.0
+        self._last_total = total
+        return {'positions': self._shares, 'cash': self._cash,
+                'holdings': holdings, 'total': total, 'returns': returns}
+
     def generate_portfolio_detail(self):
-        portfolio = self.signals[self.signals['positions'] != 0].fillna(0.0)
-        portfolio['Close'] = self.bars['Close']
-        portfolio['cash'] = np.nan
-
-        current_position = 0.0
-        current_capital = self.initial_capital
-        for index, row in portfolio.iterrows():
-            if row['positions'] == 1:
-                shares_to_buy = np.floor(current_capital / row['Close'])
-                current_capital -= shares_to_buy * row['Close']
-                current_position = shares_to_buy
-            elif row['positions'] == -1:
-                shares_to_sell = current_position  # sell all of shares
-                current_position = 0
-                current_capital += shares_to_sell * row['Close']
-            row['positions'] = current_position
-            row['cash'] = current_capital
-        print(portfolio)
+        """Returns the shares held and cash left after each trading order."""
+        portfolio = self.generate_portfolio()
+        orders = np.asarray(self.signals['positions'])
+        traded = (orders != 0) & ~np.isnan(orders)
+        portfolio = portfolio.loc[traded, ['positions', 'cash']]
+        portfolio['Close'] = pd.Series(np.asarray(self.bars['Close']), index=self._index())
         return portfolio
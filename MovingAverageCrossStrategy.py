@@ -1,43 +1,170 @@
 import pandas as pd
 import numpy as np
+from indicator_cache import moving_average
+from indicators import RollingMean, prefix_sum, rolling_mean, run_lengths
+from kernels import stop_loss_signal
 from strategy import Strategy
 
 class MovingAverageCrossStrategy(Strategy):
     """
     Requires:
     symbol - A stock symbol on which to form a strategy on.
-    bars - A DataFrame of bars for the above symbol.
+    bars - A DataFrame of bars for the above symbol, or a bars.Bars.
     short_window - Lookback period for short moving average.
-    long_window - Lookback period for long moving average."""
+    long_window - Lookback period for long moving average.
+    cache - The IndicatorCache to take moving averages from, by default
+        the one shared by all strategies.
+    lazy - Whether to defer generate_signals until the signals are
+        first read, instead of running it here.
+    stop_loss - Optionally the fractional loss from the entry close
+        (e.g. 0.05) that exits a trade early, see
+        kernels.stop_loss_signal. The signal then stays flat until the
+        crossover goes to 0 and back to 1.
 
-    def __init__(self, symbol, bars, short_window=100, long_window=400):
+    bars may be None when the strategy is only fed through on_bar."""
+
+    def __init__(self, symbol, bars, short_window=100, long_window=400, cache=None, lazy=False,
+                 stop_loss=None):
         self.symbol = symbol
         self.bars = bars
         self.short_window = short_window
         self.long_window = long_window
-        self.signals = self.generate_signals()
+        self.cache = cache
+        self.stop_loss = stop_loss
+        self.reset_stream()
+        if bars is not None and not lazy:
+            self.signals = self.generate_signals()
+
+    def __getattr__(self, name):
+        # Only reached while the signals of a lazy strategy are unset
+        if name == 'signals' and self.__dict__.get('bars') is not None:
+            self.signals = self.generate_signals()
+            return self.signals
+        raise AttributeError(name)
+
+    def moving_average(self, close, window):
+        """Returns the moving average Series of close over window used by
+        generate_signals. Crossover variants override this together with
+        moving_average_arrays and rolling_average."""
+        return moving_average(close, window, self.cache)
+
+    def moving_average_arrays(self, close, short_out, long_out):
+        """Writes the short and long moving averages of the close array
+        into short_out and long_out, both sharing one prefix sum, and
+        returns them."""
+        prefix = prefix_sum(close)
+        runs = run_lengths(close)
+        return (rolling_mean(close, self.short_window, prefix, short_out, runs),
+                rolling_mean(close, self.long_window, prefix, long_out, runs))
+
+    def rolling_average(self, window):
+        """Returns the incremental moving average used by on_bar."""
+        return RollingMean(window)
+
+    def reset_stream(self):
+        """Clears the on_bar state, so the next bar is treated as the first."""
+        self._short = self.rolling_average(self.short_window)
+        self._long = self.rolling_average(self.long_window)
+        self._bar_count = 0
+        self._last_signal = None
+        self._holding = False
+        self._stopped = False
+        self._entry = 0.0
 
     def generate_signals(self):
         """Returns the DataFrame of symbols containing the signals
         to go long, short or hold (1, -1 or 0)."""
         signals = pd.DataFrame(index=self.bars.index)
         signals['signal'] = 0.0
+        close = self.bars['Close']
+        if not isinstance(close, pd.Series):
+            close = pd.Series(close, index=signals.index, name='Close')
 
-        # Create the set of short and long simple moving averages over the
+        # Create the set of short and long moving averages over the
         # respective periods
-        signals['short_mavg'] = self.bars['Close'].rolling(window=self.short_window, min_periods=1).mean()
-        signals['long_mavg'] = self.bars['Close'].rolling(window=self.long_window, min_periods=1).mean()
+        signals['short_mavg'] = self.moving_average(close, self.short_window)
+        signals['long_mavg'] = self.moving_average(close, self.long_window)
 
         # Create a 'signal' (invested or not invested) when the short moving average crosses the long
         # moving average, but only for the period greater than the shortest moving average window
-        signals['signal'][self.short_window:] = np.where(
-            signals['short_mavg'][self.short_window:] > signals['long_mavg'][self.short_window:], 1.0, 0.0)
+        signal = np.where(signals['short_mavg'] > signals['long_mavg'], 1.0, 0.0)
+        signal[:self.short_window] = 0.0
+        if self.stop_loss is not None:
+            signal = stop_loss_signal(close.values, signal, self.stop_loss)
+        signals['signal'] = signal
 
         # Take the difference of the signals in order to generate actual trading orders
         signals['positions'] = signals['signal'].diff()
 
         return signals
 
+    def generate_signal_arrays(self, out=None):
+        """Array counterpart of generate_signals, without building a
+        DataFrame. The moving averages come from one prefix sum of the
+        closes, with flat windows tying exactly as in generate_signals,
+        so both give the same signals and orders. Every output is
+        written into out when given, so a loop over many symbols or
+        windows can reuse the same buffers.
+
+        out - Optionally a dict of preallocated 'signal', 'short_mavg',
+            'long_mavg' and 'positions' arrays, one value per bar, e.g.
+            float32 for Bars in single precision.
+
+        Returns the dict of arrays."""
+        close = self.bars['Close']
+        if out is None:
+            dtype = np.result_type(np.asarray(close).dtype, np.float32)
+            out = dict((name, np.empty(len(close), dtype=dtype))
+                       for name in ('signal', 'short_mavg', 'long_mavg', 'positions'))
+        short_mavg, long_mavg = self.moving_average_arrays(close, out['short_mavg'], out['long_mavg'])
+
+        signal = out['signal']
+        np.greater(short_mavg, long_mavg, out=signal)
+        signal[:self.short_window] = 0.0
+        if self.stop_loss is not None:
+            signal[:] = stop_loss_signal(close, signal, self.stop_loss)
+        positions = out['positions']
+        if len(signal):
+            positions[0] = np.nan
+            np.subtract(signal[1:], signal[:-1], out=positions[1:])
+        return out
+
+    def on_bar(self, bar):
+        """Returns the row of signals for the next bar in O(1), equal to
+        the row generate_signals produces for it on the full history."""
+        short_mavg = self._short.update(bar['Close'])
+        long_mavg = self._long.update(bar['Close'])
+        if self._bar_count >= self.short_window and short_mavg > long_mavg:
+            signal = 1.0
+        else:
+            signal = 0.0
+        self._bar_count += 1
+        if self.stop_loss is not None:
+            signal = self._apply_stop_loss(bar['Close'], signal)
+
+        # Like diff(), there is no order on the very first bar
+        if self._last_signal is None:
+            positions = np.nan
+        else:
+            positions = signal - self._last_signal
+        self._last_signal = signal
+        return {'signal': signal, 'short_mavg': short_mavg,
+                'long_mavg': long_mavg, 'positions': positions}
+
+    def _apply_stop_loss(self, close, signal):
+        # One step of kernels.stop_loss_signal
+        if signal > 0:
+            if not self._holding and not self._stopped:
+                self._holding = True
+                self._entry = close
+            if self._holding and close <= self._entry * (1.0 - self.stop_loss):
+                self._holding = False
+                self._stopped = True
+        else:
+            self._holding = False
+            self._stopped = False
+        return 1.0 if self._holding else 0.0
+
     def get_signals(self):
         return self.signals
 
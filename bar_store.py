@@ -0,0 +1,243 @@
+# bar_store.py
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiled, profiler
+
+
+def yahoo_source(symbol, start, end, frequency):
+    """Fetches daily bars from Yahoo Finance through pandas_datareader."""
+    from pandas_datareader import data
+    return data.DataReader(symbol, "yahoo", start, end)
+
+
+def quandl_source(symbol, start, end, frequency):
+    """Fetches a Quandl dataset such as 'WIKI/AAPL', collapsed to the
+    requested frequency."""
+    import quandl
+    return quandl.get(symbol, collapse=frequency, start_date=start, end_date=end)
+
+
+DEFAULT_SOURCES = {
+    'yahoo': yahoo_source,
+    'quandl': quandl_source,
+}
+
+# Pandas period of each frequency name the sources take
+PERIODS = {'daily': 'D', 'weekly': 'W', 'monthly': 'M', 'quarterly': 'Q', 'annual': 'Y'}
+
+
+def last_complete_bar(frequency, now=None):
+    """Returns the day before the period of now at frequency begins,
+    e.g. yesterday for daily bars and the last day of the previous month
+    for monthly ones, and yesterday for any other frequency. Bars dated
+    later may still change, like today's bar before the close, so they
+    are never cached."""
+    now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+    return now.to_period(PERIODS.get(frequency, 'D')).start_time - pd.Timedelta(days=1)
+
+
+class BarStore(object):
+    """A local cache of bars in front of the data vendors.
+
+    Bars are kept per (source, frequency, symbol) as one .npy file per
+    column plus the int64 timestamps of the index, and are read back
+    memory-mapped. The store remembers which date range has already been
+    requested, so a later request for a wider range only fetches the
+    missing head or tail from the source. Bars of the current period
+    (see last_complete_bar) are returned but not cached, and fetched
+    again by every request reaching them.
+
+    Requires:
+    root - Directory holding the cached bars.
+    sources - Optional mapping of source name to a callable
+        fetch(symbol, start, end, frequency) returning a DataFrame of bars
+        indexed by date, added to (or replacing) the default sources."""
+
+    def __init__(self, root=None, sources=None):
+        if root is None:
+            root = os.environ.get('BACKTESTER_BAR_STORE',
+                                  os.path.join(os.path.expanduser('~'), '.back_tester', 'bars'))
+        self.root = root
+        self.sources = dict(DEFAULT_SOURCES)
+        if sources:
+            self.sources.update(sources)
+
+    def register_source(self, name, fetch):
+        self.sources[name] = fetch
+
+    @profiled('BarStore.get')
+    def get(self, symbol, source, start=None, end=None, frequency='daily'):
+        """Returns the DataFrame of bars for symbol between start and end
+        (inclusive), fetching only the part not cached yet. A start of
+        None means the whole available history, an end of None means
+        up to today."""
+        start = None if start is None else pd.Timestamp(start)
+        end = pd.Timestamp.today().normalize() if end is None else pd.Timestamp(end)
+        path = self._path(symbol, source, frequency)
+        meta = self._read_meta(path)
+
+        # Only complete bars are cached, later ones are fetched every time
+        complete = min(end, last_complete_bar(frequency))
+        if meta is None:
+            missing = [(start, end)]
+            covered = (start, complete)
+        else:
+            covered_start = None if meta['start'] is None else pd.Timestamp(meta['start'])
+            covered_end = pd.Timestamp(meta['end'])
+            missing = []
+            if covered_start is not None and (start is None or start < covered_start):
+                missing.append((start, covered_start))
+            if end > covered_end:
+                missing.append((covered_end, end))
+            covered = (None if start is None or covered_start is None else min(start, covered_start),
+                       max(complete, covered_end))
+
+        partial = None
+        if missing:
+            fetch = self.sources[source]
+            with profiler.stage('fetch:%s' % source, symbol):
+                frames = [fetch(symbol, a, b, frequency) for a, b in missing]
+            frames = [frame for frame in frames if frame is not None and len(frame)]
+            partial = [frame[frame.index > covered[1]] for frame in frames]
+            partial = pd.concat(partial) if any(len(frame) for frame in partial) else None
+            frames = [frame[frame.index <= covered[1]] for frame in frames]
+            # Refetching only bars of the current period leaves the cache
+            # as it is
+            if meta is None or covered != (covered_start, covered_end):
+                if meta is not None:
+                    meta, cached = self._read_current(path, meta)
+                    frames.insert(0, cached)
+                meta = self._write(path, frames, covered[0], covered[1])
+
+        meta, bars = self._read_current(path, meta, start, end)
+        if partial is not None:
+            partial = partial[~partial.index.duplicated(keep='last')].sort_index()
+            bars = pd.concat([bars, partial.loc[:end]])
+        return bars
+
+    def load_arrays(self, symbol, source, frequency='daily'):
+        """Returns the cached int64 timestamps and a dict of memory-mapped
+        column arrays for symbol, without copying them into a DataFrame."""
+        path = self._path(symbol, source, frequency)
+        meta = self._read_meta(path)
+        if meta is None:
+            raise KeyError('No cached bars for %s from %s (%s)' % (symbol, source, frequency))
+        directory = os.path.join(path, meta['version'])
+        timestamps = np.load(os.path.join(directory, 'index.npy'), mmap_mode='r')
+        columns = dict((name, np.load(os.path.join(directory, 'column_%d.npy' % i), mmap_mode='r'))
+                       for i, name in enumerate(meta['columns']))
+        return timestamps, columns
+
+    def _path(self, symbol, source, frequency):
+        return os.path.join(self.root, source, frequency, symbol.replace('/', '_'))
+
+    def _read_meta(self, path):
+        """Returns the meta of the cached bars in path, or None when
+        there are none or they do not hold the rows meta lists, e.g. a
+        store written before the bars were versioned."""
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            directory = os.path.join(path, meta['version'])
+            lengths = [len(np.load(os.path.join(directory, 'index.npy'), mmap_mode='r'))]
+            lengths += [len(np.load(os.path.join(directory, 'column_%d.npy' % i), mmap_mode='r'))
+                        for i in range(len(meta['columns']))]
+        except (IOError, ValueError, KeyError):
+            return None
+        if lengths != [meta['rows']] * len(lengths):
+            return None
+        return meta
+
+    def _read_current(self, path, meta, start=None, end=None):
+        """Reads the bars of meta, or of the version meta.json names
+        by then if other writers removed it in the meantime.
+
+        Returns (meta, bars)."""
+        while True:
+            try:
+                return meta, self._read_frame(path, meta, start, end)
+            except FileNotFoundError:
+                meta = self._read_meta(path)
+                if meta is None:
+                    raise
+
+    def _read_frame(self, path, meta, start=None, end=None):
+        directory = os.path.join(path, meta['version'])
+        timestamps = np.load(os.path.join(directory, 'index.npy'), mmap_mode='r')
+        lo = 0 if start is None else np.searchsorted(timestamps, pd.Timestamp(start).value, side='left')
+        hi = len(timestamps) if end is None else np.searchsorted(timestamps, pd.Timestamp(end).value, side='right')
+        index = pd.DatetimeIndex(np.array(timestamps[lo:hi]).view('datetime64[ns]'), name=meta['index_name'])
+        data = {}
+        for i, name in enumerate(meta['columns']):
+            column = np.load(os.path.join(directory, 'column_%d.npy' % i), mmap_mode='r')
+            data[name] = np.array(column[lo:hi])
+        return pd.DataFrame(data, index=index, columns=meta['columns'])
+
+    def _write(self, path, frames, start, end):
+        """Writes the bars of frames as a new version of path and
+        returns its meta."""
+        frames = [frame for frame in frames if frame is not None and len(frame)]
+        bars = pd.concat(frames) if frames else pd.DataFrame(index=pd.DatetimeIndex([]))
+        bars = bars[~bars.index.duplicated(keep='last')].sort_index()
+        os.makedirs(path, exist_ok=True)
+
+        # Every write goes to a fresh version directory, and meta.json,
+        # naming it, is replaced last. Readers so see either the old or
+        # the new bars in full, never a mix, and processes caching the
+        # same bars at once never write into each other's files
+        directory = tempfile.mkdtemp(prefix='v', dir=path)
+        try:
+            timestamps = bars.index.values.astype('datetime64[ns]').view(np.int64)
+            np.save(os.path.join(directory, 'index.npy'), timestamps)
+            for i, name in enumerate(bars.columns):
+                np.save(os.path.join(directory, 'column_%d.npy' % i), np.asarray(bars[name]))
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                replaced = json.load(f)
+        except (IOError, ValueError):
+            replaced = None
+        meta = {'version': os.path.basename(directory),
+                'previous': None if replaced is None else replaced.get('version'),
+                'columns': [str(name) for name in bars.columns],
+                'index_name': bars.index.name,
+                'start': None if start is None else start.isoformat(),
+                'end': end.isoformat(),
+                'rows': len(bars)}
+        self._replace(path, 'meta.json', lambda f: f.write(json.dumps(meta).encode()))
+        if replaced is not None:
+            self._remove_version(path, replaced)
+        return meta
+
+    def _remove_version(self, path, meta):
+        # meta was just replaced. Its version is kept for readers that
+        # read it a moment ago, only the version before it goes (or the
+        # files of a store written before versions). A version still
+        # being written is never named by a meta, so never removed
+        if 'version' not in meta:
+            for name in ['index.npy'] + ['column_%d.npy' % i for i in range(len(meta['columns']))]:
+                try:
+                    os.remove(os.path.join(path, name))
+                except OSError:
+                    pass
+        elif meta.get('previous'):
+            shutil.rmtree(os.path.join(path, meta['previous']), ignore_errors=True)
+
+    def _replace(self, path, name, write):
+        fd, temporary = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(temporary, os.path.join(path, name))
+        except BaseException:
+            os.remove(temporary)
+            raise
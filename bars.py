@@ -0,0 +1,82 @@
+# bars.py
+
+import numpy as np
+import pandas as pd
+
+
+class Bars(object):
+    """A compact, array-backed alternative to the bars DataFrame that
+    Strategy and Portfolio classes accept in its place.
+
+    The index is kept as int64 nanosecond timestamps and every field
+    ('Open', 'Close', ...) as one contiguous array, so bars['Close']
+    returns a plain array without any pandas overhead. With
+    dtype=np.float32 the fields take half the memory of the float64
+    DataFrame.
+
+    Requires:
+    timestamps - The int64 nanosecond timestamps of the bars.
+    fields - A dict of field name to array of values, one per bar.
+    symbol - Optionally the symbol the bars belong to."""
+
+    __slots__ = ('timestamps', 'fields', 'symbol')
+
+    def __init__(self, timestamps, fields, symbol=None):
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.fields = fields
+        self.symbol = symbol
+        for name, values in fields.items():
+            if len(values) != len(self.timestamps):
+                raise ValueError("Field %r has %d values for %d bars"
+                                 % (name, len(values), len(self.timestamps)))
+
+    @classmethod
+    def from_frame(cls, frame, dtype=np.float64, columns=None, symbol=None):
+        """Converts a DataFrame of bars, keeping only columns if given.
+        dtype=np.float32 selects the compact single precision mode."""
+        columns = list(frame.columns) if columns is None else columns
+        timestamps = frame.index.values.astype('datetime64[ns]').view(np.int64)
+        fields = dict((name, np.ascontiguousarray(frame[name].values, dtype=dtype))
+                      for name in columns)
+        return cls(timestamps, fields, symbol)
+
+    def to_frame(self):
+        """Returns the bars as a DataFrame indexed by date."""
+        return pd.DataFrame(self.fields, index=self.index, columns=self.columns)
+
+    @property
+    def index(self):
+        """A DatetimeIndex viewing the timestamps, for the DataFrame
+        based code paths."""
+        return pd.DatetimeIndex(self.timestamps.view('datetime64[ns]'), name='Date')
+
+    @property
+    def columns(self):
+        return list(self.fields)
+
+    @property
+    def dtype(self):
+        """The dtype of the price fields."""
+        return next(iter(self.fields.values())).dtype if self.fields else np.dtype(np.float64)
+
+    @property
+    def nbytes(self):
+        return self.timestamps.nbytes + sum(values.nbytes for values in self.fields.values())
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def __getitem__(self, name):
+        return self.fields[name]
+
+    def slice(self, start, stop):
+        """Returns the bars start:stop as views of these arrays."""
+        return Bars(self.timestamps[start:stop],
+                    dict((name, values[start:stop]) for name, values in self.fields.items()),
+                    self.symbol)
+
+    def __repr__(self):
+        return 'Bars(%s, %d bars, %s, %s)' % (self.symbol, len(self), self.columns, self.dtype)
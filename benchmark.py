@@ -0,0 +1,177 @@
+# benchmark.py
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from MarketOnClosePortfolio import MarketOnClosePortfolio
+from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+from random_forcast import MarketOnOpenPortfolio, RandomForecastingStrategy
+
+
+def synthetic_bars(n_bars, seed=0, start='2000-01-01', freq='min',
+                   price=100.0, drift=0.0, volatility=0.001):
+    """Generates a DataFrame of OHLCV bars whose closes follow a
+    geometric Brownian motion, so benchmarks need no data vendor.
+
+    Requires:
+    n_bars - Number of bars to generate.
+    seed - Seed of the random generator, the same seed gives the same bars.
+    start - Timestamp of the first bar.
+    freq - Spacing of the bars, e.g. 'min' or 'D'.
+    price - Opening price of the first bar.
+    drift - Mean log return per bar.
+    volatility - Standard deviation of the log return per bar."""
+    rng = np.random.default_rng(seed)
+    log_returns = rng.normal(drift - 0.5 * volatility ** 2, volatility, n_bars)
+    close = price * np.exp(np.cumsum(log_returns))
+    open_ = np.empty(n_bars)
+    open_[0] = price
+    open_[1:] = close[:-1]
+    spread = np.abs(rng.normal(0.0, volatility, (2, n_bars)))
+    bars = pd.DataFrame({'Open': open_,
+                         'High': np.maximum(open_, close) * (1.0 + spread[0]),
+                         'Low': np.minimum(open_, close) * (1.0 - spread[1]),
+                         'Close': close,
+                         'Volume': rng.lognormal(10.0, 1.0, n_bars).round(),
+                         'Adj Close': close},
+                        index=pd.date_range(start, periods=n_bars, freq=freq, name='Date'))
+    return bars
+
+
+def _ma_signals(bars):
+    return MovingAverageCrossStrategy('SYN', bars, short_window=50, long_window=200).get_signals()
+
+
+def _random_signals(bars):
+    return RandomForecastingStrategy('SYN', bars).generate_signals()
+
+
+# Each stage gets the bars and the output of the stage it depends on
+STAGES = [
+    ('ma_signals', None,
+     lambda bars, prev: _ma_signals(bars)),
+    ('random_signals', None,
+     lambda bars, prev: _random_signals(bars)),
+    ('market_on_close_portfolio', 'ma_signals',
+     lambda bars, prev: MarketOnClosePortfolio('SYN', bars, prev).generate_portfolio()),
+    ('portfolio_detail', 'ma_signals',
+     lambda bars, prev: MarketOnClosePortfolio('SYN', bars, prev).generate_portfolio_detail()),
+    ('market_on_open_portfolio', 'random_signals',
+     lambda bars, prev: MarketOnOpenPortfolio('SYN', bars, prev).backtest_portfolio()),
+]
+
+
+def _measure(func, bars, prev, repeat):
+    """Returns the best wall time of repeat runs, the wall time of a
+    first, untimed warm-up run (which pays for JIT compilation and cold
+    caches) and the peak traced memory of one additional run, with any
+    printing silenced."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        result = func(bars, prev)
+        first = time.perf_counter() - t0
+
+        best = float('inf')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            result = func(bars, prev)
+            best = min(best, time.perf_counter() - t0)
+
+        # Memory is traced in a separate run so that tracing overhead
+        # does not distort the timings
+        tracemalloc.start()
+        func(bars, prev)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, first, peak, result
+
+
+def run(sizes, repeat=3, stages=None, seed=0):
+    """Runs every stage on synthetic bars of each size and returns a list
+    of result records."""
+    if not stages:
+        stages = [stage[0] for stage in STAGES]
+    needed = set(stages) | set(depends_on for name, depends_on, func in STAGES if name in stages)
+    records = []
+    for n_bars in sizes:
+        bars = synthetic_bars(n_bars, seed=seed)
+        outputs = {}
+        for name, depends_on, func in STAGES:
+            if name not in needed:
+                continue
+            seconds, first, peak, outputs[name] = _measure(func, bars, outputs.get(depends_on), repeat)
+            if name not in stages:
+                continue
+            records.append({'stage': name,
+                            'rows': n_bars,
+                            'seconds': seconds,
+                            'first_seconds': first,
+                            'peak_bytes': peak,
+                            'rows_per_sec': n_bars / seconds if seconds > 0 else float('inf')})
+            print('%-28s %12d rows %10.4fs %10.1f MB %14.0f rows/s' %
+                  (name, n_bars, seconds, peak / 1e6, records[-1]['rows_per_sec']))
+    return records
+
+
+def save(records, path, label=None):
+    """Appends the records to a JSON lines results file, tagged with the
+    run time, label and library versions."""
+    run_info = {'run': datetime.datetime.now().isoformat(),
+                'label': label,
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__}
+    with open(path, 'a') as f:
+        for record in records:
+            record = dict(run_info, **record)
+            f.write(json.dumps(record) + '\n')
+
+
+def compare(records, path, threshold=0.2):
+    """Compares records against the latest run per (stage, rows) stored
+    in a results file and returns the entries that got slower by more
+    than threshold (a fraction)."""
+    baseline = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            baseline[(record['stage'], record['rows'])] = record
+    regressions = []
+    for record in records:
+        old = baseline.get((record['stage'], record['rows']))
+        if old is not None and record['seconds'] > old['seconds'] * (1.0 + threshold):
+            regressions.append((record, old))
+            print('REGRESSION %s at %d rows: %.4fs -> %.4fs' %
+                  (record['stage'], record['rows'], old['seconds'], record['seconds']))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the backtesting stages on synthetic bars.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6],
+                        help='numbers of bars to benchmark, up to 10**8 given enough memory')
+    parser.add_argument('--stages', nargs='+', choices=[stage[0] for stage in STAGES],
+                        help='only run these stages')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage, the best is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.jsonl', help='results file to append to')
+    parser.add_argument('--label', help='name stored with this run, e.g. a git commit')
+    parser.add_argument('--compare', help='results file to check this run against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='slowdown fraction reported as a regression')
+    args = parser.parse_args()
+
+    records = run(args.sizes, args.repeat, args.stages, args.seed)
+    regressions = compare(records, args.compare, args.threshold) if args.compare else []
+    save(records, args.output, args.label)
+    sys.exit(1 if regressions else 0)
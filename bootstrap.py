@@ -0,0 +1,149 @@
+# bootstrap.py
+
+import numpy as np
+import pandas as pd
+
+from metrics import sharpe_ratio
+from parallel import map_tasks, seeded_chunks
+
+
+def block_bootstrap_indices(rng, n_resamples, n_bars, block_length):
+    """Draws an (n_resamples x n_bars) matrix of circular moving block
+    bootstrap indices: every resample is a chain of blocks of
+    block_length consecutive bars starting at random bars, wrapping
+    around the end of the series."""
+    n_blocks = -(-n_bars // block_length)
+    starts = rng.integers(0, n_bars, (n_resamples, n_blocks, 1))
+    indices = (starts + np.arange(block_length)) % n_bars
+    return indices.reshape(n_resamples, n_blocks * block_length)[:, :n_bars]
+
+
+def stationary_bootstrap_indices(rng, n_resamples, n_bars, block_length):
+    """Draws an (n_resamples x n_bars) matrix of stationary bootstrap
+    indices (Politis and Romano): blocks start at random bars and have
+    geometrically distributed lengths with mean block_length, wrapping
+    around the end of the series."""
+    new_block = rng.random((n_resamples, n_bars)) < 1.0 / block_length
+    new_block[:, 0] = True
+    starts = rng.integers(0, n_bars, (n_resamples, n_bars))
+    bar = np.arange(n_bars)
+    # Position of the start of the block every bar belongs to
+    block_start = np.maximum.accumulate(np.where(new_block, bar, 0), axis=1)
+    return (np.take_along_axis(starts, block_start, axis=1) + bar - block_start) % n_bars
+
+
+SAMPLERS = {
+    'stationary': stationary_bootstrap_indices,
+    'block': block_bootstrap_indices,
+}
+
+
+def _statistics(resampled, mean, periods_per_year, risk_free):
+    # Each row is one resample, metrics take bars along the first axis
+    growth = np.log1p(resampled).sum(axis=1)
+    sharpe = sharpe_ratio(resampled.T, periods_per_year, risk_free)
+    # The null resamples have the mean return removed, which shifts the
+    # mean but leaves the standard deviation as it is
+    std = resampled.std(axis=1, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        null_sharpe = sharpe - mean / std * np.sqrt(periods_per_year)
+    null_growth = np.log1p(resampled - mean).sum(axis=1)
+    return np.column_stack([sharpe, np.expm1(growth), null_sharpe, np.expm1(null_growth)])
+
+
+def _run_chunk(args, task):
+    seed, n_resamples = task
+    returns, method, block_length, periods_per_year, risk_free = args
+    rng = np.random.default_rng(seed)
+    indices = SAMPLERS[method](rng, n_resamples, len(returns), block_length)
+    return _statistics(returns[indices], returns.mean(), periods_per_year, risk_free)
+
+
+def _clean(returns):
+    returns = np.asarray(returns, dtype=np.float64)
+    return returns[~np.isnan(returns)]
+
+
+def bootstrap_returns(returns, n_resamples=10000, method='stationary', block_length=20,
+                      seed=0, periods_per_year=252, risk_free=0.0, chunk_size=None,
+                      processes=None, max_cells=2 ** 22):
+    """Resamples a strategy's bar returns with a block bootstrap, which
+    keeps the short-range dependence of the returns within blocks, and
+    computes the Sharpe ratio and total return of every resample.
+
+    Every resample is also evaluated with the mean return subtracted,
+    the null hypothesis of no edge, giving the distributions the
+    p-values of significance are read from.
+
+    Resamples are drawn and evaluated as index matrices in chunks of
+    chunk_size, each chunk with its own generator spawned from seed, so
+    the same seed and chunk_size give the same results however many
+    processes run the chunks.
+
+    Requires:
+    returns - The bar returns, e.g. portfolio['returns'] from
+        generate_portfolio or backtest_portfolio. NaNs are dropped.
+    n_resamples - Number of bootstrap resamples.
+    method - 'stationary' (random block lengths) or 'block' (fixed).
+    block_length - The (mean) block length in bars.
+    seed - Seed of the random draws.
+    periods_per_year - Number of bars per year, for annualising.
+    risk_free - Annual risk free rate subtracted from the returns.
+    chunk_size - Resamples per chunk, by default as many as fit in
+        max_cells elements.
+    processes - Number of worker processes, None for one per core and
+        1 to run in this process.
+
+    Returns a DataFrame with the sharpe, total_return, null_sharpe and
+    null_total_return of every resample."""
+    if method not in SAMPLERS:
+        raise ValueError("Unknown bootstrap method %r" % method)
+    if n_resamples < 1:
+        raise ValueError("Need at least one resample, got %d" % n_resamples)
+    returns = _clean(returns)
+    tasks = seeded_chunks(n_resamples, seed, len(returns), chunk_size, max_cells)
+    chunks = map_tasks(_run_chunk, tasks, (returns, method, block_length, periods_per_year, risk_free),
+                       processes)
+    return pd.DataFrame(np.concatenate(chunks),
+                        columns=['sharpe', 'total_return', 'null_sharpe', 'null_total_return'])
+
+
+def significance(returns, resamples, periods_per_year=252, risk_free=0.0, confidence=0.95):
+    """Summarises bootstrap_returns resamples of returns.
+
+    Returns a dict holding the observed sharpe and total_return, their
+    one-sided p-values (the share of null resamples doing at least as
+    well, counting the observation itself) and the bootstrap confidence
+    intervals of both at the given level."""
+    returns = _clean(returns)
+    observed_sharpe = sharpe_ratio(returns, periods_per_year, risk_free)
+    observed_return = np.expm1(np.log1p(returns).sum())
+    n = len(resamples)
+    tail = (1.0 - confidence) / 2.0
+    return {'sharpe': observed_sharpe,
+            'sharpe_p_value': (1.0 + np.sum(resamples['null_sharpe'].values >= observed_sharpe)) / (n + 1.0),
+            'sharpe_interval': tuple(np.nanquantile(resamples['sharpe'].values, [tail, 1.0 - tail])),
+            'total_return': observed_return,
+            'total_return_p_value': (1.0 + np.sum(resamples['null_total_return'].values >= observed_return))
+                                    / (n + 1.0),
+            'total_return_interval': tuple(np.nanquantile(resamples['total_return'].values,
+                                                          [tail, 1.0 - tail]))}
+
+
+if __name__ == "__main__":
+    import time
+
+    from benchmark import synthetic_bars
+    from MarketOnClosePortfolio import MarketOnClosePortfolio
+    from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+
+    # Ten years of daily bars with a small upward drift
+    bars = synthetic_bars(2520, seed=3, freq='D', drift=0.0004, volatility=0.01)
+    mac = MovingAverageCrossStrategy('SYN', bars, short_window=20, long_window=100)
+    returns = MarketOnClosePortfolio('SYN', bars, mac.get_signals()).generate_portfolio()['returns']
+
+    t0 = time.perf_counter()
+    resamples = bootstrap_returns(returns, 10000, seed=42)
+    print('10000 resamples in %.2fs' % (time.perf_counter() - t0))
+    for key, value in significance(returns, resamples).items():
+        print('%-24s %s' % (key, value))
@@ -0,0 +1,154 @@
+# checkpoint.py
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from chunked import ChunkedBacktest
+
+
+CHECKPOINT = 'checkpoint.npz'
+RESULTS = 'results.csv'
+COLUMNS = ['short_mavg', 'long_mavg', 'signal', 'orders', 'positions', 'cash',
+           'holdings', 'total', 'returns']
+
+
+def save_checkpoint(backtest, path, last_timestamp, results_bytes=0):
+    """Writes the state a ChunkedBacktest carries between blocks to path
+    (an .npz file), replacing any previous checkpoint atomically.
+
+    Requires:
+    backtest - The ChunkedBacktest after its last block.
+    path - The checkpoint file.
+    last_timestamp - The int64 nanosecond timestamp of the last bar run.
+    results_bytes - Size of the results file this state belongs to."""
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f,
+                 prefix_tail=backtest.prefix_tail,
+                 last_close=backtest.last_close,
+                 last_run=backtest.last_run,
+                 short_window=backtest.short_window,
+                 long_window=backtest.long_window,
+                 initial_capital=backtest.initial_capital,
+                 bar_count=backtest.bar_count,
+                 last_signal=backtest.last_signal,
+                 position=backtest.position,
+                 cash=backtest.cash,
+                 last_total=backtest.last_total,
+                 last_timestamp=np.int64(last_timestamp),
+                 results_bytes=results_bytes)
+    os.replace(path + '.tmp', path)
+
+
+def load_checkpoint(path):
+    """Reads a checkpoint written by save_checkpoint.
+
+    Returns (backtest, last_timestamp, results_bytes), backtest being a
+    ChunkedBacktest ready to process the bars after last_timestamp."""
+    with np.load(path) as state:
+        backtest = ChunkedBacktest(int(state['short_window']), int(state['long_window']),
+                                   float(state['initial_capital']))
+        backtest.prefix_tail = state['prefix_tail']
+        backtest.last_close = float(state['last_close'])
+        backtest.last_run = int(state['last_run'])
+        backtest.bar_count = int(state['bar_count'])
+        backtest.last_signal = float(state['last_signal'])
+        backtest.position = float(state['position'])
+        backtest.cash = float(state['cash'])
+        backtest.last_total = float(state['last_total'])
+        return backtest, int(state['last_timestamp']), int(state['results_bytes'])
+
+
+def update_backtest(directory, bars, short_window=100, long_window=400,
+                    initial_capital=100000.0):
+    """Brings the stored MovingAverageCrossStrategy / all-in
+    MarketOnClosePortfolio run in directory up to date with bars.
+
+    Only the bars after the last one in the checkpoint are run, starting
+    from the saved moving average tails, run of equal closes, signal,
+    position, cash and equity, and their rows are appended to the stored signals and equity
+    curve (results.csv). The cost of a nightly update is so proportional
+    to the new bars, not to the whole history, and the stored curve
+    equals a full rerun exactly. Without a checkpoint the whole of bars
+    is run.
+
+    bars may overlap the bars already run, e.g. the full history from
+    BarStore.get, as earlier bars are skipped. A results file left
+    longer than its checkpoint by an interrupted update is cut back to
+    it first, so a failed update can simply be rerun.
+
+    Requires:
+    directory - The directory holding the run's checkpoint and results.
+    bars - A DataFrame of bars with a 'Close' column.
+    short_window - Lookback period for short moving average.
+    long_window - Lookback period for long moving average.
+    initial_capital - The amount in cash at the start of the portfolio.
+
+    Returns a DataFrame of the appended rows."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    checkpoint_path = os.path.join(directory, CHECKPOINT)
+    results_path = os.path.join(directory, RESULTS)
+    timestamps = bars.index.values.astype('datetime64[ns]').view(np.int64)
+
+    if os.path.exists(checkpoint_path):
+        backtest, last_timestamp, results_bytes = load_checkpoint(checkpoint_path)
+        if (backtest.short_window, backtest.long_window, backtest.initial_capital) != \
+                (short_window, long_window, float(initial_capital)):
+            raise ValueError("Checkpoint in %s was made with other parameters" % directory)
+        bars = bars.iloc[np.searchsorted(timestamps, last_timestamp, side='right'):]
+        timestamps = timestamps[len(timestamps) - len(bars):]
+    else:
+        backtest = ChunkedBacktest(short_window, long_window, initial_capital)
+        results_bytes = 0
+
+    if os.path.exists(results_path):
+        with open(results_path, 'r+b') as f:
+            f.truncate(results_bytes)
+    if not len(bars):
+        return pd.DataFrame(columns=COLUMNS, index=bars.index)
+
+    portfolio = backtest.process(bars['Close'].values)
+    frame = pd.DataFrame(portfolio, index=bars.index, columns=COLUMNS)
+    frame.to_csv(results_path, mode='a', header=results_bytes == 0)
+    save_checkpoint(backtest, checkpoint_path, timestamps[-1], os.path.getsize(results_path))
+    return frame
+
+
+def load_results(directory):
+    """Reads the stored signals and equity curve of a run back as a
+    DataFrame."""
+    return pd.read_csv(os.path.join(directory, RESULTS), index_col=0, parse_dates=True,
+                       float_precision='round_trip')
+
+
+if __name__ == "__main__":
+    # Run ten years of daily bars, then append one day at a time and
+    # check the stored curve against a full rerun
+    import tempfile
+    import time
+
+    from benchmark import synthetic_bars
+    from indicators import prefix_sum, rolling_mean
+    from portfolio_engine import all_in_portfolio
+    from sweep import crossover_orders
+
+    directory = tempfile.mkdtemp()
+    bars = synthetic_bars(2520 + 20, seed=5, freq='D', volatility=0.01)
+
+    t0 = time.perf_counter()
+    update_backtest(directory, bars.iloc[:2520], 20, 100)
+    t1 = time.perf_counter()
+    for day in range(2521, len(bars) + 1):
+        update_backtest(directory, bars.iloc[:day], 20, 100)
+    t2 = time.perf_counter()
+    print('initial run: %.4fs, nightly update: %.4fs' % (t1 - t0, (t2 - t1) / 20))
+
+    close = bars['Close'].values
+    prefix = prefix_sum(close)
+    signal, orders = crossover_orders(rolling_mean(close, 20, prefix)[:, np.newaxis],
+                                      rolling_mean(close, 100, prefix)[:, np.newaxis], 20)
+    expected = all_in_portfolio(close, orders[:, 0])
+    stored = load_results(directory)
+    print('stored curve matches: %s' % np.array_equal(stored['total'].values, expected['total']))
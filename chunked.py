@@ -0,0 +1,152 @@
+# chunked.py
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from indicators import hold_flat_windows, run_lengths
+from portfolio_engine import all_in_portfolio
+
+
+def iter_csv_chunks(path, chunk_size=10 ** 6):
+    """Streams a CSV file of bars (dates in the first column) as
+    DataFrames of at most chunk_size rows."""
+    for chunk in pd.read_csv(path, index_col=0, parse_dates=True, chunksize=chunk_size,
+                             float_precision='round_trip'):
+        yield chunk
+
+
+def iter_store_chunks(store, symbol, source, frequency='daily', chunk_size=10 ** 6):
+    """Streams the bars cached in a BarStore as DataFrames of at most
+    chunk_size rows, copying only one block at a time out of the
+    memory-mapped columns."""
+    timestamps, columns = store.load_arrays(symbol, source, frequency)
+    for start in range(0, len(timestamps), chunk_size):
+        stop = start + chunk_size
+        index = pd.DatetimeIndex(np.array(timestamps[start:stop]).view('datetime64[ns]'))
+        yield pd.DataFrame(dict((name, np.array(values[start:stop])) for name, values in columns.items()),
+                           index=index)
+
+
+class ChunkedBacktest(object):
+    """MovingAverageCrossStrategy traded through the all-in
+    MarketOnClosePortfolio accounting, fed one block of bars at a time.
+
+    Between blocks only the tail of the price prefix sums needed by the
+    longer of the two windows, the last close and the length of its run
+    of equal closes, the last signal, the position, the cash and the
+    last equity value are kept, so memory is bounded by the block size.
+    The moving averages use the same prefix-sum arithmetic as
+    indicators.rolling_mean, flat windows included, and the orders go
+    through all_in_portfolio, so the results equal those of
+    MovingAverageCrossStrategy and MarketOnClosePortfolio.
+
+    Requires:
+    short_window - Lookback period for short moving average.
+    long_window - Lookback period for long moving average.
+    initial_capital - The amount in cash at the start of the portfolio."""
+
+    def __init__(self, short_window=100, long_window=400, initial_capital=100000.0):
+        self.short_window = short_window
+        self.long_window = long_window
+        self.initial_capital = float(initial_capital)
+        self.prefix_tail = np.zeros(1)
+        self.last_close = np.nan
+        self.last_run = 0
+        self.bar_count = 0
+        self.last_signal = 0.0
+        self.position = 0.0
+        self.cash = self.initial_capital
+        self.last_total = np.nan
+
+    def process(self, close):
+        """Runs the next block of close prices and returns a dict of its
+        'short_mavg', 'long_mavg', 'signal', 'orders', 'positions',
+        'cash', 'holdings', 'total' and 'returns' arrays."""
+        close = np.asarray(close, dtype=np.float64)
+        n_bars = len(close)
+        first = self.bar_count
+
+        # prefix[k] is the sum of the first (first - offset + k) prices,
+        # continuing the cumulative sum exactly where the last block ended
+        prefix = np.concatenate((self.prefix_tail[:-1],
+                                 np.cumsum(np.concatenate((self.prefix_tail[-1:], close)))))
+        offset = len(self.prefix_tail) - 1
+        end = np.arange(first + 1, first + n_bars + 1)
+        runs = run_lengths(close, self.last_close, self.last_run)
+
+        means = []
+        for window in (self.short_window, self.long_window):
+            start = np.maximum(end - window, 0)
+            counts = (end - start).astype(np.float64)
+            mean = (prefix[end - first + offset] - prefix[start - first + offset]) / counts
+            means.append(hold_flat_windows(mean, close, runs, window, first))
+        short_mavg, long_mavg = means
+
+        signal = np.where(short_mavg > long_mavg, 1.0, 0.0)
+        signal[:max(0, self.short_window - first)] = 0.0
+        orders = np.diff(signal, prepend=self.last_signal)
+        if first == 0 and n_bars:
+            orders[0] = 0.0
+
+        portfolio = all_in_portfolio(close, orders, self.cash, self.position)
+        if n_bars:
+            portfolio['returns'][0] = portfolio['total'][0] / self.last_total - 1.0
+            self.prefix_tail = prefix[-min(max(self.short_window, self.long_window), len(prefix)):]
+            self.last_close = close[-1]
+            self.last_run = runs[-1]
+            self.bar_count += n_bars
+            self.last_signal = signal[-1]
+            self.position = portfolio['positions'][-1]
+            self.cash = portfolio['cash'][-1]
+            self.last_total = portfolio['total'][-1]
+
+        portfolio.update({'short_mavg': short_mavg, 'long_mavg': long_mavg,
+                          'signal': signal, 'orders': orders})
+        return portfolio
+
+
+def chunked_backtest(chunks, output_path, short_window=100, long_window=400,
+                     initial_capital=100000.0):
+    """Runs a ChunkedBacktest over an iterable of bar DataFrames, e.g.
+    from iter_csv_chunks or iter_store_chunks, appending each block's
+    equity curve to the CSV file at output_path as it goes.
+
+    Returns the ChunkedBacktest holding the final state."""
+    backtest = ChunkedBacktest(short_window, long_window, initial_capital)
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    for bars in chunks:
+        portfolio = backtest.process(bars['Close'].values)
+        frame = pd.DataFrame(portfolio, index=bars.index,
+                             columns=['signal', 'positions', 'cash', 'holdings', 'total', 'returns'])
+        frame.to_csv(output_path, mode='a', header=backtest.bar_count == len(bars))
+    return backtest
+
+
+if __name__ == "__main__":
+    # Stream a synthetic year of minute bars through in blocks and check
+    # the result against the in-memory arrays
+    import tempfile
+    import time
+
+    from benchmark import synthetic_bars
+    from indicators import prefix_sum, rolling_mean
+    from sweep import crossover_orders
+
+    directory = tempfile.mkdtemp()
+    bars = synthetic_bars(525600, seed=3)
+    bars.to_csv(os.path.join(directory, 'bars.csv'))
+
+    t0 = time.perf_counter()
+    backtest = chunked_backtest(iter_csv_chunks(os.path.join(directory, 'bars.csv'), 50000),
+                                os.path.join(directory, 'equity.csv'), 50, 200)
+    print('chunked run: %.2fs' % (time.perf_counter() - t0))
+
+    close = bars['Close'].values
+    prefix = prefix_sum(close)
+    signal, orders = crossover_orders(rolling_mean(close, 50, prefix)[:, np.newaxis],
+                                      rolling_mean(close, 200, prefix)[:, np.newaxis], 50)
+    expected = all_in_portfolio(close, orders[:, 0])
+    print('final equity matches: %s' % (backtest.last_total == expected['total'][-1]))
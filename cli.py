@@ -0,0 +1,188 @@
+# cli.py
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BarStore
+from loader import load_symbols
+from metrics import performance_metrics
+
+
+# Registered Strategy/Portfolio pairs. Classes are given as
+# 'module:class' and only imported when a run uses them, so listing or
+# running one pair never imports the modules of the others
+PAIRS = {
+    'ma_cross': {'strategy': 'MovingAverageCrossStrategy:MovingAverageCrossStrategy',
+                 'portfolio': 'MarketOnClosePortfolio:MarketOnClosePortfolio',
+                 'method': 'generate_portfolio',
+                 'report': True},
+    'ema_cross': {'strategy': 'ExponentialMovingAverageCrossStrategy:ExponentialMovingAverageCrossStrategy',
+                  'portfolio': 'MarketOnClosePortfolio:MarketOnClosePortfolio',
+                  'method': 'generate_portfolio',
+                  'report': True},
+    'random_forecast': {'strategy': 'random_forcast:RandomForecastingStrategy',
+                        'portfolio': 'random_forcast:MarketOnOpenPortfolio',
+                        'method': 'backtest_portfolio',
+                        'report': False},
+}
+
+
+def register_pair(name, strategy, portfolio, method='generate_portfolio', report=False):
+    """Registers a Strategy/Portfolio pair under name.
+
+    Requires:
+    name - The name configs refer to the pair by.
+    strategy - The Strategy class as 'module:class', constructed as
+        Strategy(symbol, bars, **strategy_params).
+    portfolio - The Portfolio class as 'module:class', constructed as
+        Portfolio(symbol, bars, signals, **portfolio_params).
+    method - The portfolio method returning the portfolio DataFrame,
+        which must hold a 'total' column.
+    report - Whether the signals carry the short_mavg / long_mavg
+        columns report.render_report plots."""
+    PAIRS[name] = {'strategy': strategy, 'portfolio': portfolio,
+                   'method': method, 'report': report}
+
+
+def load_class(path):
+    """Imports 'module:class' and returns the class."""
+    module_name, _, class_name = path.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def expand_grid(params):
+    """Returns every combination of a dict of parameter values, where a
+    list gives the values to sweep and anything else a fixed value."""
+    names = sorted(params)
+    values = [params[name] if isinstance(params[name], list) else [params[name]] for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def _run_name(symbol, params):
+    name = '_'.join([symbol] + ['%s=%s' % (key, params[key]) for key in sorted(params)])
+    return ''.join(c if c.isalnum() or c in '=_-.' else '_' for c in name)
+
+
+def run_config(config, output=None, plot=None, max_workers=None):
+    """Runs the backtests described by a config dict and writes the
+    results without any interaction.
+
+    The config holds:
+    pair - Name of a registered Strategy/Portfolio pair.
+    symbols - The symbols to backtest.
+    source, start, end, frequency - Passed to BarStore.get.
+    store - Optional BarStore root directory.
+    strategy_params - Strategy keyword arguments, lists are swept.
+    portfolio_params - Portfolio keyword arguments, lists are swept.
+    periods_per_year - Bars per year for the metrics, default 252.
+    seed - Optional seed of numpy's global random generator.
+    save_portfolios - Whether to write every portfolio DataFrame.
+    plot - Whether to render a report image per run.
+    processes - Worker processes rendering the reports.
+    max_workers - Number of symbols downloaded at once.
+    output - Directory the results are written to.
+
+    output, plot and max_workers override the config values. Every
+    (symbol, strategy params, portfolio params) run adds one row to
+    summary.csv, and symbols that fail to load are listed in errors.csv.
+
+    Returns the summary DataFrame."""
+    pair = PAIRS[config['pair']]
+    output = output or config.get('output', 'results')
+    plot = config.get('plot', False) if plot is None else plot
+    max_workers = max_workers or config.get('max_workers', 4)
+    if plot and not pair['report']:
+        raise ValueError("Pair %r has no report to plot" % config['pair'])
+    os.makedirs(output, exist_ok=True)
+
+    strategy_class = load_class(pair['strategy'])
+    portfolio_class = load_class(pair['portfolio'])
+    strategy_grid = expand_grid(config.get('strategy_params', {}))
+    portfolio_grid = expand_grid(config.get('portfolio_params', {}))
+    if 'seed' in config:
+        np.random.seed(config['seed'])
+
+    store = BarStore(config.get('store'))
+    source = config.get('source', 'yahoo')
+
+    def load(symbol):
+        return store.get(symbol, source, config.get('start'), config.get('end'),
+                         config.get('frequency', 'daily'))
+
+    rows = []
+    errors = []
+    reports = []
+    for symbol, bars in load_symbols(config['symbols'], load, max_workers):
+        if isinstance(bars, Exception):
+            print('Could not load %s: %s' % (symbol, bars), file=sys.stderr)
+            errors.append({'symbol': symbol, 'error': repr(bars)})
+            continue
+        for strategy_params, portfolio_params in itertools.product(strategy_grid, portfolio_grid):
+            strategy = strategy_class(symbol, bars, **strategy_params)
+            # Strategies that compute their signals when constructed
+            # hand them out through get_signals, others generate them now
+            signals = getattr(strategy, 'get_signals', strategy.generate_signals)()
+            portfolio = portfolio_class(symbol, bars, signals, **portfolio_params)
+            result = getattr(portfolio, pair['method'])()
+
+            params = dict(strategy_params, **portfolio_params)
+            name = _run_name(symbol, params)
+            total = result['total']
+            row = {'pair': config['pair'], 'symbol': symbol, 'bars': len(bars),
+                   'final_equity': total.iloc[-1],
+                   'total_return': total.iloc[-1] / portfolio.initial_capital - 1.0}
+            row.update(params)
+            row.update(performance_metrics(total.values, periods_per_year=config.get('periods_per_year', 252))
+                       [['sharpe', 'sortino', 'cagr', 'max_drawdown', 'max_drawdown_duration']].iloc[0])
+            rows.append(row)
+
+            if config.get('save_portfolios', False):
+                result.to_csv(os.path.join(output, name + '.csv'))
+            if plot:
+                reports.append({'path': os.path.join(output, name + '.png'), 'bars': bars,
+                                'signals': signals, 'portfolio': result,
+                                'title': '%s %s' % (config['pair'], name)})
+
+    summary = pd.DataFrame(rows)
+    summary.to_csv(os.path.join(output, 'summary.csv'), index=False)
+    if errors:
+        pd.DataFrame(errors).to_csv(os.path.join(output, 'errors.csv'), index=False)
+    if reports:
+        # Only imported now, headless runs without plots never load matplotlib
+        from report import render_reports
+        render_reports(reports, config.get('processes'))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run registered Strategy/Portfolio pairs over many '
+                                                 'symbols and parameter sets from a JSON config.')
+    parser.add_argument('config', nargs='?', help='JSON config file, see run_config')
+    parser.add_argument('--output', help='directory to write the results to')
+    parser.add_argument('--plot', action='store_true', default=None, help='render a report per run')
+    parser.add_argument('--max-workers', type=int, help='symbols downloaded at once')
+    parser.add_argument('--list', action='store_true', help='list the registered pairs and exit')
+    args = parser.parse_args(argv)
+
+    if args.list or not args.config:
+        for name, pair in sorted(PAIRS.items()):
+            print('%-16s %s + %s' % (name, pair['strategy'], pair['portfolio']))
+        return 0
+    with open(args.config) as f:
+        config = json.load(f)
+    summary = run_config(config, args.output, args.plot, args.max_workers)
+    print(summary.to_string(index=False))
+    # Fail when any symbol could not be loaded
+    loaded = set(summary['symbol']) if len(summary) else set()
+    return 1 if set(config['symbols']) - loaded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# fill_models.py
+
+import numpy as np
+import pandas as pd
+
+from kernels import all_in_orders
+
+
+class FillModel(object):
+    """Describes how the orders of a portfolio are filled.
+
+    Requires:
+    name - Label of the model in the results.
+    price - The reference fill price: 'close', 'open' (the open of the
+        same bar, as MarketOnOpenPortfolio assumes), 'next_open' (the
+        order fills at the open of the following bar) or 'vwap' (the
+        typical price (High + Low + Close) / 3 as a VWAP proxy).
+    slippage - Fixed slippage in price per share, paid against the
+        direction of every trade.
+    slippage_bps - Proportional slippage in basis points of the price.
+    commission - Fixed commission per trade.
+    commission_bps - Proportional commission in basis points of the
+        traded notional."""
+
+    def __init__(self, name, price='close', slippage=0.0, slippage_bps=0.0,
+                 commission=0.0, commission_bps=0.0):
+        if price not in ('close', 'open', 'next_open', 'vwap'):
+            raise ValueError("Unknown fill price %r" % price)
+        self.name = name
+        self.price = price
+        self.slippage = slippage
+        self.slippage_bps = slippage_bps
+        self.commission = commission
+        self.commission_bps = commission_bps
+
+
+def evaluate_fill_models(bars, positions, models, initial_capital=100000.0, sizing='shares',
+                         mark='close'):
+    """Evaluates the same target positions under several fill models in
+    one vectorised pass, every model being one column of a
+    (bars x models) block of fill prices, holdings and costs.
+
+    With sizing 'shares' positions is the number of shares to hold. With
+    'all_in' it is a long/flat signal (> 0 long), and every entry spends
+    all cash left after the fixed commission on whole shares at the
+    model's fill price and its proportional commission, as
+    MarketOnClosePortfolio does at the close. That accounting runs
+    through kernels.all_in_orders, all models side by side.
+
+    Requires:
+    bars - A DataFrame of bars with 'Open' and 'Close' columns, plus
+        'High' and 'Low' for the 'vwap' price.
+    positions - The target of every bar, e.g. 100 * signals['signal'],
+        or the single column DataFrame from generate_positions.
+    models - A list of FillModel instances.
+    initial_capital - The amount in cash at the start of the portfolio.
+    sizing - 'shares' or 'all_in'.
+    mark - The price holdings are valued at, 'close' or 'open' (as
+        MarketOnOpenPortfolio does).
+
+    Returns a DataFrame with (model name, field) columns for the fields
+    positions, holdings, cash, costs, total and returns."""
+    models = list(models)
+    if not models:
+        raise ValueError("Need at least one fill model")
+    if sizing not in ('shares', 'all_in'):
+        raise ValueError("Unknown sizing %r" % sizing)
+    if mark not in ('close', 'open'):
+        raise ValueError("Unknown mark price %r" % mark)
+    if isinstance(positions, pd.DataFrame):
+        if positions.shape[1] != 1:
+            raise ValueError("Positions must hold a single symbol")
+        positions = positions.iloc[:, 0]
+    close = np.asarray(bars['Close'], dtype=np.float64)
+    target = np.nan_to_num(np.asarray(positions, dtype=np.float64))
+    if sizing == 'all_in':
+        target = (target > 0).astype(np.float64)
+    n_bars = len(close)
+    reference = {'close': close,
+                 'open': np.asarray(bars['Open'], dtype=np.float64)}
+    reference['next_open'] = reference['open']
+    if any(model.price == 'vwap' for model in models):
+        reference['vwap'] = (np.asarray(bars['High'], dtype=np.float64) +
+                             np.asarray(bars['Low'], dtype=np.float64) + close) / 3.0
+
+    # Stack the per-model inputs as (bars x models) blocks
+    base = np.column_stack([reference[model.price] for model in models])
+    held = np.repeat(target[:, np.newaxis], len(models), axis=1)
+    delayed = [j for j, model in enumerate(models) if model.price == 'next_open']
+    held[1:, delayed] = target[:-1, np.newaxis]
+    held[0, delayed] = 0.0
+    slippage = np.array([model.slippage for model in models])
+    slippage_bps = np.array([model.slippage_bps for model in models])
+    commission = np.array([model.commission for model in models])
+    commission_bps = np.array([model.commission_bps for model in models])
+
+    trades = np.diff(held, axis=0, prepend=0.0)
+    direction = np.sign(trades)
+    fill = base + direction * (slippage + base * slippage_bps / 1e4)
+    if sizing == 'all_in':
+        held, cash, costs = _all_in(trades, fill, commission, commission_bps, initial_capital)
+    else:
+        costs = (trades != 0.0) * commission + np.abs(trades) * fill * commission_bps / 1e4
+        cash = initial_capital - np.cumsum(trades * fill + costs, axis=0)
+
+    holdings = held * reference[mark][:, np.newaxis]
+    total = holdings + cash
+    returns = np.full_like(total, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = total[1:] / total[:-1] - 1.0
+
+    fields = ['positions', 'holdings', 'cash', 'costs', 'total', 'returns']
+    blocks = [held, holdings, cash, np.cumsum(costs, axis=0), total, returns]
+    columns = pd.MultiIndex.from_product([[model.name for model in models], fields])
+    stacked = np.stack(blocks, axis=2).reshape(n_bars, len(models) * len(fields))
+    return pd.DataFrame(stacked, index=bars.index, columns=columns)
+
+
+def _all_in(orders, fill, commission, commission_bps, initial_capital):
+    """Runs the all-in accounting of the (bars x models) orders, > 0 buy
+    and < 0 sell, and returns the shares held, cash and costs per bar."""
+    n_bars = len(orders)
+    rows = np.flatnonzero(orders.any(axis=1))
+    orders = orders[rows]
+    # The proportional commission is paid on top of a buy and taken off
+    # a sale, so it moves the price the cash is converted at
+    prices = fill[rows] * (1.0 + np.sign(orders) * commission_bps / 1e4)
+    fees = (orders != 0.0) * commission
+    shares, cash = all_in_orders(orders, prices, 0.0, initial_capital, fees)
+    traded = np.abs(np.diff(shares, axis=0))
+
+    # Every bar takes the state left by the last order at or before it
+    segment = np.searchsorted(rows, np.arange(n_bars), side='right')
+    costs = np.zeros(fill.shape)
+    costs[rows] = fees + traded * fill[rows] * commission_bps / 1e4
+    return shares[segment], cash[segment], costs
@@ -0,0 +1,163 @@
+# indicator_cache.py
+
+import collections
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from indicators import ema_matrix
+
+
+def _update(digest, values):
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = pd.util.hash_array(values.ravel())
+    values = np.ascontiguousarray(values)
+    digest.update(repr((values.dtype.str, values.shape)).encode())
+    digest.update(values.view(np.uint8))
+
+
+def fingerprint(data):
+    """Returns a hex digest identifying the values (and index, for
+    pandas objects) of an array, Series or DataFrame of bars."""
+    digest = hashlib.sha1()
+    if isinstance(data, pd.DataFrame):
+        digest.update(repr(list(data.columns)).encode())
+        _update(digest, data.index.values)
+        for column in data.columns:
+            _update(digest, data[column].values)
+    elif isinstance(data, pd.Series):
+        digest.update(repr(data.name).encode())
+        _update(digest, data.index.values)
+        _update(digest, data.values)
+    else:
+        _update(digest, data)
+    return digest.hexdigest()
+
+
+def _nbytes(value):
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        return int(np.sum(value.memory_usage(index=True)))
+    return int(getattr(value, 'nbytes', 0))
+
+
+class IndicatorCache(object):
+    """An in-memory LRU cache of indicator series keyed by
+    (bar-data fingerprint, indicator name, parameters).
+
+    Once the cached values exceed max_bytes the least recently used
+    entries are evicted, and written to spill_dir first when one is
+    given, so a later request loads them from disk instead of
+    recomputing. Cached values are shared and must not be modified.
+
+    Requires:
+    max_bytes - Memory budget of the in-memory entries.
+    spill_dir - Optional directory that evicted entries are spilled to."""
+
+    def __init__(self, max_bytes=256 * 2 ** 20, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        if spill_dir is not None and not os.path.isdir(spill_dir):
+            os.makedirs(spill_dir)
+
+    def get(self, data, indicator, params, compute):
+        """Returns the cached indicator for data, or calls compute() to
+        build and cache it.
+
+        Requires:
+        data - The bars or series the indicator is computed from.
+        indicator - Name of the indicator, e.g. 'sma'.
+        params - A tuple of the indicator parameters, e.g. (window,).
+        compute - A callable returning the indicator on a miss."""
+        key = (fingerprint(data), indicator, tuple(params))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        value = self._load_spilled(key)
+        if value is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            value = compute()
+            with self._lock:
+                self.misses += 1
+        self._insert(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'disk_hits': self.disk_hits,
+                    'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'nbytes': self.nbytes}
+
+    def clear(self):
+        """Drops the in-memory entries, leaving any spilled files."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _insert(self, key, value):
+        evicted = []
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = value
+                self.nbytes += _nbytes(value)
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_value = self._entries.popitem(last=False)
+                self.nbytes -= _nbytes(old_value)
+                self.evictions += 1
+                evicted.append((old_key, old_value))
+        for old_key, old_value in evicted:
+            self._spill(old_key, old_value)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, hashlib.sha1(repr(key).encode()).hexdigest() + '.pkl')
+
+    def _spill(self, key, value):
+        if self.spill_dir is None:
+            return
+        path = self._spill_path(key)
+        if not os.path.exists(path):
+            pd.to_pickle(value, path + '.tmp')
+            os.replace(path + '.tmp', path)
+
+    def _load_spilled(self, key):
+        if self.spill_dir is None or not os.path.exists(self._spill_path(key)):
+            return None
+        return pd.read_pickle(self._spill_path(key))
+
+
+# Shared by all strategies unless one is given explicitly
+default_cache = IndicatorCache()
+
+
+def moving_average(close, window, cache=None):
+    """Returns close.rolling(window=window, min_periods=1).mean() through
+    the indicator cache, so identical series are computed only once."""
+    if cache is None:
+        cache = default_cache
+    return cache.get(close, 'sma', (window,),
+                     lambda: close.rolling(window=window, min_periods=1).mean())
+
+
+def exponential_moving_average(close, span, cache=None):
+    """Returns close.ewm(span=span, adjust=False).mean() through the
+    indicator cache, computed with indicators.ema_matrix."""
+    if cache is None:
+        cache = default_cache
+    return cache.get(close, 'ema', (span,),
+                     lambda: pd.Series(ema_matrix(close.values, [span])[:, 0],
+                                       index=close.index, name=close.name))
@@ -0,0 +1,186 @@
+# indicators.py
+
+import numpy as np
+
+from kernels import ema_recurrence, rolling_var
+
+
+def prefix_sum(values):
+    """Returns the cumulative sum of values along the time axis with a
+    leading row of zeros, so the sum of values[i:j] is
+    prefix[j] - prefix[i]."""
+    values = np.asarray(values, dtype=np.float64)
+    prefix = np.zeros((len(values) + 1,) + values.shape[1:])
+    np.cumsum(values, axis=0, out=prefix[1:])
+    return prefix
+
+
+def run_lengths(values, last_value=np.nan, last_run=0):
+    """Returns the number of consecutive equal values along the time
+    axis ending at each bar, itself included.
+
+    Requires:
+    values - A 1-D array of prices or a 2-D (bars x symbols) block.
+    last_value - The value before values[0], when values continue an
+        earlier block.
+    last_run - The run length at that value."""
+    values = np.asarray(values, dtype=np.float64)
+    bar = np.arange(len(values)).reshape((-1,) + (1,) * (values.ndim - 1))
+    if not len(values):
+        return bar.copy()
+    # Bar at which the run through each bar began, the first one
+    # continuing the earlier run when it equals last_value
+    start = np.where(values[0] != last_value, 0, -np.asarray(last_run))
+    start = np.broadcast_to(start, values.shape[1:])
+    start = np.concatenate((start[np.newaxis],
+                            np.where(values[1:] != values[:-1], bar[1:], start[np.newaxis])))
+    np.maximum.accumulate(start, axis=0, out=start)
+    return bar - start + 1
+
+
+def hold_flat_windows(means, values, runs, window, first_bar=0):
+    """Sets the moving averages whose window holds a single repeated
+    value to that value, as rolling().mean() does, so flat prices give
+    exact ties instead of differing by the rounding of the sums.
+
+    Requires:
+    means - The moving averages of values, modified in place.
+    values - The prices the means are taken over.
+    runs - The run_lengths of values.
+    window - Lookback period of the moving average.
+    first_bar - Position of values[0] in the full history, when values
+        is a block of it."""
+    counts = np.minimum(np.arange(first_bar + 1, first_bar + len(values) + 1), window)
+    counts = counts.reshape((-1,) + (1,) * (np.ndim(values) - 1))
+    np.copyto(means, values, where=runs >= counts)
+    return means
+
+
+def rolling_mean(values, window, prefix=None, out=None, runs=None):
+    """Simple moving average over the time axis, matching
+    rolling(window=window, min_periods=1).mean().
+
+    Requires:
+    values - A 1-D array of prices or a 2-D (bars x symbols) block.
+    window - Lookback period of the moving average.
+    prefix - Optionally the prefix_sum of values, to share it between
+        several windows.
+    out - Optionally a preallocated array to write the means into, e.g.
+        a float32 buffer reused across calls.
+    runs - Optionally the run_lengths of values, shared like prefix."""
+    values = np.asarray(values, dtype=np.float64)
+    if prefix is None:
+        prefix = prefix_sum(values)
+    if runs is None:
+        runs = run_lengths(values)
+    n = len(prefix) - 1
+    if out is None:
+        out = np.empty(prefix[1:].shape)
+    # The first bars average all values so far, later ones the last window
+    head = min(window, n)
+    counts = np.arange(1, head + 1, dtype=np.float64)
+    if prefix.ndim > 1:
+        counts = counts.reshape((-1,) + (1,) * (prefix.ndim - 1))
+    np.divide(prefix[1:head + 1], counts, out=out[:head])
+    np.subtract(prefix[head + 1:], prefix[1:n - head + 1], out=out[head:])
+    out[head:] /= window
+    return hold_flat_windows(out, values, runs, window)
+
+
+def sma_matrix(close, windows):
+    """Returns a (bars x windows) matrix of simple moving averages of
+    close, all taken from a single prefix sum."""
+    prefix = prefix_sum(close)
+    means = np.empty((len(prefix) - 1, len(windows)))
+    for j, window in enumerate(windows):
+        means[:, j] = rolling_mean(close, window, prefix)
+    return means
+
+
+def var_matrix(close, windows, ddof=1):
+    """Returns a (bars x windows) matrix of rolling variances of close,
+    matching rolling(window=window, min_periods=1).var(ddof=ddof) to
+    rounding. Each window takes one pass over the bars, its sums sliding
+    over deviations from a value inside the window (see
+    kernels.rolling_var), so small windows over long histories keep
+    their precision. Bars with no more than ddof values are NaN."""
+    return rolling_var(close, windows, ddof)
+
+
+def std_matrix(close, windows, ddof=1):
+    """Returns a (bars x windows) matrix of rolling standard deviations,
+    see var_matrix."""
+    return np.sqrt(var_matrix(close, windows, ddof))
+
+
+def rolling_std(values, window, ddof=1):
+    """Rolling standard deviation of a single window, matching
+    rolling(window=window, min_periods=1).std(ddof=ddof)."""
+    return std_matrix(values, [window], ddof)[:, 0]
+
+
+def ema_matrix(close, spans):
+    """Returns a (bars x spans) matrix of exponential moving averages of
+    close, matching ewm(span=span, adjust=False).mean(). All spans are
+    updated together in a single pass over the bars, compiled when the
+    kernels backend is numba."""
+    alphas = 2.0 / (np.asarray(spans, dtype=np.float64) + 1.0)
+    return ema_recurrence(close, alphas)
+
+
+class RollingMean(object):
+    """Simple moving average updated one value at a time, matching
+    rolling(window=window, min_periods=1).mean() on the values seen so
+    far. A ring buffer of the last window values and their running sum
+    make every update O(1). Like rolling_mean, a window holding a single
+    repeated value averages to that value exactly."""
+
+    __slots__ = ('window', 'buffer', 'head', 'count', 'total', 'last', 'run')
+
+    def __init__(self, window):
+        self.window = window
+        self.buffer = [0.0] * window
+        self.head = 0
+        self.count = 0
+        self.total = 0.0
+        self.last = None
+        self.run = 0
+
+    def update(self, value):
+        """Adds value as the newest bar and returns the current mean."""
+        if self.count < self.window:
+            self.count += 1
+        else:
+            self.total -= self.buffer[self.head]
+        self.buffer[self.head] = value
+        self.total += value
+        self.head += 1
+        if self.head == self.window:
+            self.head = 0
+        self.run = self.run + 1 if value == self.last else 1
+        self.last = value
+        if self.run >= self.count:
+            return float(value)
+        return self.total / self.count
+
+
+class RollingEma(object):
+    """Exponential moving average updated one value at a time, matching
+    ewm(span=span, adjust=False).mean() on the values seen so far and
+    ema_matrix exactly."""
+
+    __slots__ = ('alpha', 'decay', 'norm', 'mean')
+
+    def __init__(self, span):
+        self.alpha = 2.0 / (span + 1.0)
+        self.decay = 1.0 - self.alpha
+        self.norm = self.decay + self.alpha
+        self.mean = None
+
+    def update(self, value):
+        """Adds value as the newest bar and returns the current mean."""
+        if self.mean is None:
+            self.mean = float(value)
+        else:
+            self.mean = (self.decay * self.mean + self.alpha * value) / self.norm
+        return self.mean
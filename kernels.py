@@ -0,0 +1,444 @@
+# kernels.py
+
+import importlib.util
+import os
+
+import numpy as np
+
+
+BACKENDS = ('auto', 'numba', 'numpy')
+
+# Selected backend, 'auto' uses numba whenever it is installed
+_backend = os.environ.get('BACKTESTER_KERNELS', 'auto')
+# Loop kernels compiled so far, by name
+_compiled = {}
+# The numba module, only imported on the first compiled kernel as the
+# import alone takes a few tenths of a second
+_numba = None
+_numba_installed = None
+
+
+def numba_available():
+    """Returns whether numba is installed, without importing it."""
+    global _numba_installed
+    if _numba_installed is None:
+        _numba_installed = importlib.util.find_spec('numba') is not None
+    return _numba_installed
+
+
+def _load_numba():
+    global _numba
+    if _numba is None:
+        import numba
+        _numba = numba
+    return _numba
+
+
+def set_backend(name):
+    """Selects the backend of the path-dependent kernels: 'numba' runs
+    them as compiled loops, 'numpy' as the pure NumPy path and 'auto'
+    picks numba when it is installed. Both give identical results."""
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError("Unknown kernel backend %r" % name)
+    if name == 'numba' and not numba_available():
+        raise ValueError("The numba backend needs numba to be installed")
+    _backend = name
+
+
+def get_backend():
+    """Returns the backend the kernels currently run on, 'numba' or
+    'numpy'."""
+    if _backend == 'numba' or (_backend == 'auto' and numba_available()):
+        return 'numba'
+    return 'numpy'
+
+
+def _dispatch(name, loop, vectorised):
+    """Returns the implementation of kernel name for the current backend,
+    importing numba and compiling loop with it on first use."""
+    if get_backend() == 'numpy':
+        return vectorised
+    kernel = _compiled.get(name)
+    if kernel is None:
+        kernel = _compiled[name] = _load_numba().njit(cache=True, nogil=True)(loop)
+    return kernel
+
+
+def _all_in_loop(orders, prices, fees, initial_position, initial_capital):
+    n_rows, n_configs = orders.shape
+    shares = np.empty((n_rows + 1, n_configs))
+    cash = np.empty((n_rows + 1, n_configs))
+    for j in range(n_configs):
+        current_position = initial_position
+        current_capital = initial_capital
+        shares[0, j] = current_position
+        cash[0, j] = current_capital
+        column = j if prices.shape[1] > 1 else 0
+        for k in range(n_rows):
+            order = orders[k, j]
+            price = prices[k, column]
+            if order > 0:
+                current_capital -= fees[k, j]
+                current_position = np.floor(current_capital / price)
+                current_capital -= current_position * price
+            elif order < 0:
+                current_capital += current_position * price
+                current_capital -= fees[k, j]
+                current_position = 0.0
+            shares[k + 1, j] = current_position
+            cash[k + 1, j] = current_capital
+    return shares, cash
+
+
+def _all_in_numpy(orders, prices, fees, initial_position, initial_capital):
+    n_rows, n_configs = orders.shape
+    shares = np.full((n_rows + 1, n_configs), initial_position)
+    cash = np.full((n_rows + 1, n_configs), initial_capital)
+
+    if n_configs == 1:
+        # Plain floats are much cheaper than 1-element arrays per order
+        current_position = initial_position
+        current_capital = initial_capital
+        for k, (order, price, fee) in enumerate(zip(orders[:, 0].tolist(), prices[:, 0].tolist(),
+                                                    fees[:, 0].tolist()), 1):
+            if order > 0:
+                current_capital -= fee
+                current_position = np.floor(current_capital / price)
+                current_capital -= current_position * price
+            elif order < 0:
+                current_capital += current_position * price
+                current_capital -= fee
+                current_position = 0.0
+            shares[k, 0] = current_position
+            cash[k, 0] = current_capital
+        return shares, cash
+
+    # Otherwise step through the orders with all configs side by side
+    prices = np.broadcast_to(prices, orders.shape)
+    for k in range(1, n_rows + 1):
+        current_position = shares[k - 1].copy()
+        current_capital = cash[k - 1].copy()
+        order = orders[k - 1]
+        price = prices[k - 1]
+        fee = fees[k - 1]
+        buy = order > 0
+        sell = order < 0
+        current_capital[buy] -= fee[buy]
+        bought = np.floor(current_capital[buy] / price[buy])
+        current_capital[buy] -= bought * price[buy]
+        current_position[buy] = bought
+        current_capital[sell] += current_position[sell] * price[sell]
+        current_capital[sell] -= fee[sell]
+        current_position[sell] = 0.0
+        shares[k] = current_position
+        cash[k] = current_capital
+    return shares, cash
+
+
+def all_in_orders(orders, prices, initial_position=0.0, initial_capital=100000.0, fees=None):
+    """Steps the all-in accounting of MarketOnClosePortfolio through a
+    sequence of orders: a buy spends all cash on floor(cash / price)
+    shares and a sell liquidates the whole holding. A fixed fee per
+    order is taken from the cash before a buy is sized and after a
+    sell.
+
+    Requires:
+    orders - A (orders x configs) array of orders, > 0 buy, < 0 sell.
+    prices - The fill prices of the orders, (orders x configs) or
+        (orders x 1) when all configs trade the same prices.
+    initial_position - Shares held before the first order.
+    initial_capital - Cash before the first order.
+    fees - Optionally the fee of every order, (orders x configs) or
+        broadcastable to it, none by default.
+
+    Returns (shares, cash), both (orders + 1 x configs), holding the
+    opening state followed by the state after each order."""
+    orders = np.ascontiguousarray(orders, dtype=np.float64)
+    if fees is None:
+        fees = np.zeros(orders.shape)
+    kernel = _dispatch('all_in', _all_in_loop, _all_in_numpy)
+    return kernel(orders, np.ascontiguousarray(prices, dtype=np.float64),
+                  np.ascontiguousarray(np.broadcast_to(fees, orders.shape), dtype=np.float64),
+                  float(initial_position), float(initial_capital))
+
+
+def _stop_loss_loop(close, signal, stop):
+    n_bars = len(close)
+    out = np.zeros(n_bars)
+    holding = False
+    stopped = False
+    entry = 0.0
+    for i in range(n_bars):
+        if signal[i] > 0:
+            if not holding and not stopped:
+                holding = True
+                entry = close[i]
+            if holding and close[i] <= entry * (1.0 - stop):
+                holding = False
+                stopped = True
+        else:
+            holding = False
+            stopped = False
+        if holding:
+            out[i] = 1.0
+    return out
+
+
+def _stop_loss_numpy(close, signal, stop):
+    n_bars = len(close)
+    long = signal > 0
+    # Every run of long signal is one trade entered at its first close
+    starts = np.flatnonzero(long & ~np.concatenate(([False], long[:-1])))
+    if len(starts) == 0:
+        return np.zeros(n_bars)
+    trade = np.cumsum(np.isin(np.arange(n_bars), starts)) - 1
+    entry = close[starts][np.maximum(trade, 0)]
+
+    # The first bar of each trade closing at or below its stop ends it
+    position = np.arange(n_bars)
+    hit = np.where(long & (trade >= 0) & (close <= entry * (1.0 - stop)), position, n_bars)
+    first_hit = np.minimum.reduceat(hit, starts)
+    out = long & (trade >= 0) & (position < first_hit[np.maximum(trade, 0)])
+    return out.astype(np.float64)
+
+
+def stop_loss_signal(close, signal, stop):
+    """Applies a stop-loss to a long-only 0/1 signal. A trade is entered
+    at the close of the first bar of every run of signal, and is exited
+    on the first later close that is stop (a fraction, e.g. 0.05) or more
+    below its entry price. After a stop the signal stays flat until the
+    underlying signal goes to 0 and back to 1.
+
+    Requires:
+    close - An array of close prices, one per bar.
+    signal - The 0/1 signal per bar, e.g. signals['signal'].
+    stop - The fractional loss from the entry price that exits a trade.
+
+    Returns the stopped 0/1 signal, its diff gives the orders."""
+    kernel = _dispatch('stop_loss', _stop_loss_loop, _stop_loss_numpy)
+    return kernel(np.ascontiguousarray(close, dtype=np.float64),
+                  np.nan_to_num(np.ascontiguousarray(signal, dtype=np.float64)),
+                  float(stop))
+
+
+def _ema_loop(values, alphas):
+    n_bars = len(values)
+    n_spans = len(alphas)
+    out = np.empty((n_bars, n_spans))
+    if n_bars == 0:
+        return out
+    decay = 1.0 - alphas
+    norm = decay + alphas
+    for j in range(n_spans):
+        out[0, j] = values[0]
+    # Bars outermost, so every span's update runs independently of the
+    # others and the rows are written contiguously
+    for i in range(1, n_bars):
+        for j in range(n_spans):
+            out[i, j] = (decay[j] * out[i - 1, j] + alphas[j] * values[i]) / norm[j]
+    return out
+
+
+def _ema_numpy(values, alphas):
+    # One pass over the bars with every span updated side by side. The
+    # alpha * value terms are all taken up front, into the rows the
+    # averages then replace, so each bar costs a few in-place updates
+    out = np.multiply.outer(values, alphas)
+    if len(values) == 0:
+        return out
+    decay = 1.0 - alphas
+    norm = decay + alphas
+    # Dividing by a norm of exactly 1, as it rounds to for the alphas of
+    # all spans in practice, changes nothing and is skipped
+    normalise = not np.all(norm == 1.0)
+    multiply, add, divide = np.multiply, np.add, np.divide
+    out[0] = values[0]
+    weighted = np.empty(len(alphas))
+    rows = iter(out)
+    previous = next(rows)
+    for row in rows:
+        multiply(decay, previous, weighted)
+        add(weighted, row, row)
+        if normalise:
+            divide(row, norm, row)
+        previous = row
+    return out
+
+
+def ema_recurrence(values, alphas):
+    """Runs the exponential moving average recurrence
+    mean[i] = (1 - alpha) * mean[i - 1] + alpha * values[i], starting
+    from values[0], for every alpha at once. This equals
+    ewm(alpha=alpha, adjust=False).mean() of values without NaNs.
+
+    Requires:
+    values - An array of prices, one per bar.
+    alphas - The smoothing factor of every output column.
+
+    Returns the (bars x alphas) matrix of averages."""
+    kernel = _dispatch('ema', _ema_loop, _ema_numpy)
+    return kernel(np.ascontiguousarray(values, dtype=np.float64),
+                  np.ascontiguousarray(alphas, dtype=np.float64))
+
+
+def _rolling_var_loop(values, windows, ddof):
+    n_bars = len(values)
+    out = np.empty((n_bars, len(windows)))
+    # Length of the run of equal values ending at every bar
+    run = np.ones(n_bars)
+    for i in range(1, n_bars):
+        if values[i] == values[i - 1]:
+            run[i] = run[i - 1] + 1.0
+    for j in range(len(windows)):
+        window = windows[j]
+        # Sums of the deviations (and their squares) from the first value
+        # of the block, over the bars of the previous block from each
+        # offset on, the part of the window that lies in that block. The
+        # first block has none, and the last offset never any
+        before = np.zeros((2, window + 1))
+        for start in range(0, n_bars, window):
+            centre = values[start]
+            if start:
+                total = 0.0
+                squares = 0.0
+                for t in range(window - 1, 0, -1):
+                    deviation = values[start - window + t] - centre
+                    total += deviation
+                    squares += deviation * deviation
+                    before[0, t] = total
+                    before[1, t] = squares
+            total = 0.0
+            squares = 0.0
+            for t in range(min(window, n_bars - start)):
+                i = start + t
+                deviation = values[i] - centre
+                total += deviation
+                squares += deviation * deviation
+                window_total = total + before[0, t + 1]
+                window_squares = squares + before[1, t + 1]
+                count = min(i + 1.0, window)
+                if count <= ddof:
+                    out[i, j] = np.nan
+                elif run[i] >= count:
+                    out[i, j] = 0.0
+                else:
+                    variance = (window_squares - window_total * window_total / count) / (count - ddof)
+                    out[i, j] = max(variance, 0.0)
+    return out
+
+
+def _rolling_var_numpy(values, windows, ddof):
+    n_bars = len(values)
+    # Filled a window per row, as contiguous rows are much cheaper to
+    # write than the columns of the result
+    out = np.empty((len(windows), n_bars))
+    if n_bars == 0:
+        return out.T.copy()
+    # Bars where a new run of equal values starts, and their positions
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    run = np.arange(n_bars) - np.repeat(starts, np.diff(np.append(starts, n_bars))) + 1.0
+    for j in range(len(windows)):
+        window = windows[j]
+        # Blocks of window bars, the last one padded, with the running
+        # sums of the deviations from each block's first value
+        n_blocks = -(-n_bars // window)
+        blocks = np.empty((n_blocks, window))
+        blocks.ravel()[:n_bars] = values
+        blocks.ravel()[n_bars:] = values[-1]
+        centre = blocks[:, :1].copy()
+        deviations = blocks - centre
+        total = np.cumsum(deviations, axis=1)
+        deviations *= deviations
+        squares = np.cumsum(deviations, axis=1)
+
+        # Plus those over the window's bars in the previous block, summed
+        # from its end back to each offset in the order of the loop
+        previous = blocks[:-1, :0:-1] - centre[1:]
+        total[1:, :-1] += np.cumsum(previous, axis=1)[:, ::-1]
+        previous *= previous
+        squares[1:, :-1] += np.cumsum(previous, axis=1)[:, ::-1]
+        total = total.ravel()[:n_bars]
+        squares = squares.ravel()[:n_bars]
+
+        # Full windows first, then the first bars with fewer values
+        head = min(window - 1, n_bars)
+        count = np.arange(1.0, head + 1.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = total * total
+            variance /= window
+            np.subtract(squares, variance, out=variance)
+            variance /= window - ddof
+            variance[:head] = (squares[:head] - total[:head] * total[:head] / count) / (count - ddof)
+        np.maximum(variance, 0.0, out=variance)
+        variance[head:][run[head:] >= window] = 0.0
+        variance[:head][run[:head] >= count] = 0.0
+        variance[:n_bars if window <= ddof else ddof] = np.nan
+        out[j] = variance
+    return np.ascontiguousarray(out.T)
+
+
+def rolling_var(values, windows, ddof=1):
+    """Rolling variance of values over every window at once, matching
+    rolling(window=window, min_periods=1).var(ddof=ddof) of values
+    without NaNs, in one pass over the bars per window. The bars are
+    split into blocks of window bars and the sums slide over deviations
+    from the first value of the block, a value inside every window
+    ending in it, so the result stays accurate to rounding even where
+    the variance is tiny next to the prices. Windows of equal values
+    have a variance of exactly 0, and bars with no more than ddof
+    values NaN.
+
+    Requires:
+    values - An array of prices, one per bar.
+    windows - The lookback period of every output column.
+    ddof - Delta degrees of freedom of the variance.
+
+    Returns the (bars x windows) matrix of variances."""
+    kernel = _dispatch('rolling_var', _rolling_var_loop, _rolling_var_numpy)
+    return kernel(np.ascontiguousarray(values, dtype=np.float64),
+                  np.ascontiguousarray(windows, dtype=np.int64), int(ddof))
+
+
+if __name__ == "__main__":
+    import time
+
+    # Run both backends on one million bars of random walk and check
+    # that they agree exactly
+    n_bars = 1000000
+    rng = np.random.default_rng(7)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.001, n_bars)))
+    signal = (np.sin(np.arange(n_bars) / 500.0) > 0).astype(np.float64)
+    orders = np.diff(signal, prepend=0.0)
+    rows = np.flatnonzero(orders)
+    configs = np.repeat(orders[rows, np.newaxis], 64, axis=1) * (rng.random((len(rows), 64)) > 0.1)
+
+    backends = ['numpy'] + (['numba'] if numba_available() else [])
+    results = {}
+    for backend in backends:
+        set_backend(backend)
+        # Warm up so compilation is not timed
+        stop_loss_signal(close[:10], signal[:10], 0.02)
+        all_in_orders(orders[rows[:2], np.newaxis], close[rows[:2], np.newaxis])
+        ema_recurrence(close[:10], np.array([0.5]))
+        rolling_var(close[:10], [2])
+        t0 = time.perf_counter()
+        stopped = stop_loss_signal(close, signal, 0.02)
+        t1 = time.perf_counter()
+        single = all_in_orders(orders[rows, np.newaxis], close[rows, np.newaxis])
+        t2 = time.perf_counter()
+        many = all_in_orders(configs, close[rows, np.newaxis])
+        t3 = time.perf_counter()
+        ema = ema_recurrence(close, 2.0 / (np.arange(2, 66) + 1.0))
+        t4 = time.perf_counter()
+        variance = rolling_var(close, [2, 20, 100])
+        t5 = time.perf_counter()
+        results[backend] = (stopped, single, many, ema, variance)
+        print('%s: stop-loss %.4fs, all-in %.4fs, all-in x64 %.4fs, ema x64 %.4fs, var x3 %.4fs'
+              % (backend, t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4))
+
+    if len(results) == 2:
+        a, b = results['numpy'], results['numba']
+        print('identical: %s' % all([np.array_equal(a[0], b[0]), np.array_equal(a[3], b[3]),
+                                     np.array_equal(a[4], b[4], equal_nan=True)] +
+                                    [np.array_equal(x, y) for x, y in zip(a[1] + a[2], b[1] + b[2])]))
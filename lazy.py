@@ -0,0 +1,85 @@
+# lazy.py
+
+import numpy as np
+import pandas as pd
+
+from indicators import prefix_sum, rolling_mean
+from portfolio_engine import all_in_portfolio
+
+
+class LazyPipeline(object):
+    """A graph of named outputs, each computed only when something reads
+    it and then cached. Reading one output computes just the outputs it
+    depends on, so a caller that only wants the final equity never
+    builds the columns nothing else needs.
+
+    Requires:
+    index - Optional index used when outputs are collected into a
+        DataFrame by frame()."""
+
+    def __init__(self, index=None):
+        self.index = index
+        self._nodes = {}
+        self._values = {}
+
+    def add(self, name, func, *dependencies):
+        """Adds output name, computed as func(*dependency values)."""
+        self._nodes[name] = (func, dependencies)
+        self._values.pop(name, None)
+        return self
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            func, dependencies = self._nodes[name]
+            self._values[name] = func(*[self[dependency] for dependency in dependencies])
+        return self._values[name]
+
+    def __contains__(self, name):
+        return name in self._nodes
+
+    def evaluated(self):
+        """Returns the names of the outputs computed so far."""
+        return sorted(self._values)
+
+    def release(self, *names):
+        """Drops cached outputs to free their memory, they are recomputed
+        if read again."""
+        for name in names:
+            self._values.pop(name, None)
+
+    def frame(self, names):
+        """Returns a DataFrame of just the named outputs."""
+        return pd.DataFrame(dict((name, self[name]) for name in names),
+                            index=self.index, columns=list(names))
+
+
+def ma_cross_pipeline(bars, short_window=100, long_window=400, initial_capital=100000.0):
+    """Builds MovingAverageCrossStrategy traded through the all-in
+    MarketOnClosePortfolio accounting as a LazyPipeline of arrays.
+
+    Outputs: close, short_mavg, long_mavg, signal, positions (the
+    orders), shares, cash, holdings, total, returns and final_equity,
+    e.g. pipeline['final_equity'] for a sweep that ranks on equity
+    alone."""
+    pipeline = LazyPipeline(bars.index)
+    pipeline.add('close', lambda: np.asarray(bars['Close'], dtype=np.float64))
+    pipeline.add('close_prefix', prefix_sum, 'close')
+    pipeline.add('short_mavg', lambda close, prefix: rolling_mean(close, short_window, prefix),
+                 'close', 'close_prefix')
+    pipeline.add('long_mavg', lambda close, prefix: rolling_mean(close, long_window, prefix),
+                 'close', 'close_prefix')
+
+    def signal(short_mavg, long_mavg):
+        signal = np.where(short_mavg > long_mavg, 1.0, 0.0)
+        signal[:short_window] = 0.0
+        return signal
+    pipeline.add('signal', signal, 'short_mavg', 'long_mavg')
+    pipeline.add('positions', lambda signal: np.diff(signal, prepend=np.nan), 'signal')
+
+    pipeline.add('portfolio', lambda close, positions: all_in_portfolio(close, positions, initial_capital),
+                 'close', 'positions')
+    pipeline.add('shares', lambda portfolio: portfolio['positions'], 'portfolio')
+    for name in ('cash', 'holdings', 'total', 'returns'):
+        pipeline.add(name, lambda portfolio, name=name: portfolio[name], 'portfolio')
+    pipeline.add('final_equity', lambda total: total[-1], 'total')
+    return pipeline
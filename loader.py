@@ -0,0 +1,126 @@
+# loader.py
+
+import concurrent.futures
+import functools
+import io
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import pandas as pd
+
+
+class RateLimiter(object):
+    """Spaces calls at least 1 / rate seconds apart across all threads
+    sharing it, e.g. one per data vendor.
+
+    Requires:
+    rate - Maximum number of calls per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def rate_limited(fetch, limiter):
+    """Wraps a BarStore source so every fetch first waits its turn on
+    limiter. Cache hits in the store never reach the source, so they are
+    not rate limited."""
+    @functools.wraps(fetch)
+    def wrapper(*args, **kwargs):
+        limiter.wait()
+        return fetch(*args, **kwargs)
+    return wrapper
+
+
+def transient_error(error):
+    """Returns whether a failed fetch is worth retrying: lost or refused
+    connections, timeouts and 5xx server errors. Other HTTP errors, such
+    as a 404 for an unknown symbol, fail the same way every time."""
+    # urllib's HTTPError carries the status as code, requests' errors on
+    # their response
+    status = getattr(error, 'code', None)
+    response = getattr(error, 'response', None)
+    if response is not None:
+        status = getattr(response, 'status_code', status)
+    if isinstance(status, int):
+        return status >= 500
+    return isinstance(error, (ConnectionError, TimeoutError, urllib.error.URLError))
+
+
+def retrying(fetch, retries=3, backoff=0.5, retry_if=transient_error):
+    """Wraps a BarStore source to retry failed fetches up to retries
+    times, waiting backoff, 2 * backoff, 4 * backoff, ... in between.
+    Only errors for which retry_if(error) is true are retried, the
+    others are raised at once."""
+    @functools.wraps(fetch)
+    def wrapper(*args, **kwargs):
+        for attempt in range(retries + 1):
+            try:
+                return fetch(*args, **kwargs)
+            except Exception as error:
+                if attempt == retries or not retry_if(error):
+                    raise
+                time.sleep(backoff * 2 ** attempt)
+    return wrapper
+
+
+def http_csv_source(base_url, timeout=30.0):
+    """Returns a BarStore source fetching '<base_url>/<symbol>.csv' with
+    start, end and frequency as query parameters, e.g. from an internal
+    bar server or a local HTTP stand-in. The CSV holds dates in the
+    first column."""
+    def fetch(symbol, start, end, frequency):
+        query = urllib.parse.urlencode(dict((key, value) for key, value in
+                                            (('start', start), ('end', end), ('frequency', frequency))
+                                            if value is not None))
+        url = '%s/%s.csv?%s' % (base_url.rstrip('/'), urllib.parse.quote(symbol, safe=''), query)
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return pd.read_csv(io.BytesIO(response.read()), index_col=0, parse_dates=True)
+    return fetch
+
+
+def load_symbols(symbols, load, max_workers=8):
+    """Loads many symbols concurrently and yields (symbol, bars) in the
+    order the downloads complete, so the caller can backtest early
+    symbols while later ones are still downloading.
+
+    At most max_workers loads (and so connections) run at once, and no
+    more than twice that many finished results wait for the caller.
+    Symbols whose load fails are yielded last as (symbol, exception).
+
+    Requires:
+    symbols - The symbols to load.
+    load - A callable load(symbol) returning its bars, e.g.
+        lambda symbol: store.get(symbol, 'yahoo', start, end).
+    max_workers - Number of concurrent loads."""
+    symbols = list(symbols)
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        pending = {}
+        position = 0
+        while position < len(symbols) or pending:
+            while position < len(symbols) and len(pending) < 2 * max_workers:
+                pending[executor.submit(load, symbols[position])] = symbols[position]
+                position += 1
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                symbol = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    yield symbol, future.result()
+                else:
+                    failed.append((symbol, error))
+    for symbol, error in failed:
+        yield symbol, error
@@ -1,10 +1,10 @@
 import datetime
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import pandas_datareader as pdr
-import mplcursors
 
+from bar_store import BarStore, yahoo_source
+from indicator_cache import moving_average
+from loader import RateLimiter, load_symbols, rate_limited, retrying
 from portfolio import Portfolio
 from strategy import Strategy
 
@@ -35,8 +35,8 @@ class MovingAverageCrossStrategy(Strategy):
 
         # Create the set of short and long simple moving averages over the
         # respective periods
-        signals[short_key] = self.bars['Close'].rolling(window=self.short_window, min_periods=1).mean()
-        signals[long_key] = self.bars['Close'].rolling(window=self.long_window, min_periods=1).mean()
+        signals[short_key] = moving_average(self.bars['Close'], self.short_window)
+        signals[long_key] = moving_average(self.bars['Close'], self.long_window)
 
         # Create a 'signal' (invested or not invested) when the short moving average crosses the long
         # moving average, but only for the period greater than the shortest moving average window
@@ -84,8 +84,13 @@ class MarketOnClosePortfolio(Portfolio):
         return portfolio
 
 
-def backtest_plot(symbol, shares, start_date, end_date, short_win, long_win, init_capital):
-    bars = pdr.DataReader(symbol, "yahoo", start_date, end_date)
+def backtest_plot(symbol, shares, start_date, end_date, short_win, long_win, init_capital, bars=None):
+    # Plotting modules are only imported when a plot is drawn
+    import mplcursors
+    import matplotlib.pyplot as plt
+
+    if bars is None:
+        bars = BarStore().get(symbol, 'yahoo', start_date, end_date)
     # Create a Moving Average Cross Strategy with 8 and 36, short/long MA windows
     mac = MovingAverageCrossStrategy(symbol, bars, short_window=short_win, long_window=long_win)
     signals = mac.generate_signals()
@@ -141,9 +146,21 @@ def backtest_plot(symbol, shares, start_date, end_date, short_win, long_win, ini
 if __name__ == "__main__":
     start = datetime.datetime(2020, 1, 1)
     end = datetime.datetime(2020, 4, 1)
-    backtest_plot('BTC-USD', 1, start, end, 6, 23, 10000)
-    backtest_plot('ETH-USD', 5, start, end, 6, 23, 10000)
-
-    backtest_plot('BTC-USD', 1, start, end, 8, 21, 10000)
-    backtest_plot('AMZN', 100, start, end, 8, 21, 10000)
+    runs = [('BTC-USD', 1, 6, 23),
+            ('ETH-USD', 5, 6, 23),
+            ('BTC-USD', 1, 8, 21),
+            ('AMZN', 100, 8, 21)]
+
+    # Download all symbols at once (at most two Yahoo requests a second)
+    # and plot each symbol's runs as soon as its bars arrive
+    store = BarStore()
+    store.register_source('yahoo', rate_limited(retrying(yahoo_source), RateLimiter(2)))
+    symbols = list(dict.fromkeys(run[0] for run in runs))
+    for symbol, bars in load_symbols(symbols, lambda s: store.get(s, 'yahoo', start, end), max_workers=4):
+        if isinstance(bars, Exception):
+            print('Could not load %s: %s' % (symbol, bars))
+            continue
+        for run_symbol, shares, short_win, long_win in runs:
+            if run_symbol == symbol:
+                backtest_plot(symbol, shares, start, end, short_win, long_win, 10000, bars)
     input('Press any key to exit..')
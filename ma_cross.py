@@ -1,15 +1,31 @@
 # ma_cross.py
 
 import datetime
-import mplcursors
-import matplotlib.pyplot as plt
 
-from pandas_datareader import data
+from bar_store import BarStore
+from profiling import profiled
+from report import headless, render_report
+from results_store import ResultsStore
 from MovingAverageCrossStrategy import MovingAverageCrossStrategy
 from MarketOnClosePortfolio import MarketOnClosePortfolio
 
 
-def plot(stratedgy, portfolio):
+@profiled('plot')
+def plot(stratedgy, portfolio, path=None):
+    """Shows the trades and equity curve in a window, or without a
+    display renders them to path (by default '<symbol>_ma_cross.png')
+    with report.render_report, thinned to what the image can show."""
+    if headless():
+        path = path or '%s_ma_cross.png' % stratedgy.symbol
+        render_report(path, stratedgy.bars, stratedgy.get_signals(), portfolio,
+                      title='%s ma_cross' % stratedgy.symbol)
+        print('plot written to %s' % path)
+        return
+
+    # Plotting modules are only imported when a plot is drawn
+    import mplcursors
+    import matplotlib.pyplot as plt
+
     signals = stratedgy.get_signals()
     short_mavg = stratedgy.get_short_mavg()
     long_mavg = stratedgy.get_long_mavg()
@@ -62,15 +78,21 @@ if __name__ == "__main__":
     initial_capital = 50000.0
     start_date = datetime.datetime(2010, 1, 1)
     end_date = datetime.datetime(2020, 1, 1)
-    bars = data.DataReader(symbol, "yahoo", start_date, end_date)
+    bars = BarStore().get(symbol, 'yahoo', start_date, end_date)
 
     # Create a Moving Average Cross Strategy instance with a short moving
     # average window of 100 days and a long window of 400 days
     mac = MovingAverageCrossStrategy(symbol, bars, short_window=short_window, long_window=long_window)
     signals = mac.get_signals()
 
-    # Create a portfolio of AAPL, with $100,000 initial capital
-    mcp = MarketOnClosePortfolio(symbol, bars, signals, initial_capital=initial_capital)
-    portfolio = mcp.generate_portfolio()
-    print(portfolio)
-    plot(mac, portfolio)
+    # Create a portfolio of AAPL, with $100,000 initial capital, unless
+    # the results store holds this run already
+    def backtest():
+        mcp = MarketOnClosePortfolio(symbol, bars, signals, initial_capital=initial_capital)
+        return mcp.generate_portfolio()
+
+    store = ResultsStore()
+    run = store.get_or_run('ma_cross', symbol, bars, {'short_window': short_window, 'long_window': long_window,
+                                                      'initial_capital': initial_capital}, backtest)
+    print('run %d: sharpe %.3f, total return %.2f%%' % (run['id'], run['sharpe'], 100.0 * run['total_return']))
+    plot(mac, store.load_curve(run))
@@ -0,0 +1,104 @@
+# metrics.py
+
+import numpy as np
+import pandas as pd
+
+
+def simple_returns(equity):
+    """Bar-period returns of a (bars x configs) block of equity curves,
+    one row shorter than equity."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return equity[1:] / equity[:-1] - 1.0
+
+
+def sharpe_ratio(returns, periods_per_year=252, risk_free=0.0):
+    """Annualised Sharpe ratio of every column of a block of returns."""
+    excess = returns - risk_free / periods_per_year
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return excess.mean(axis=0) / returns.std(axis=0, ddof=1) * np.sqrt(periods_per_year)
+
+
+def sortino_ratio(returns, periods_per_year=252, risk_free=0.0):
+    """Annualised Sortino ratio of every column of a block of returns,
+    using the root mean square of the negative returns as risk."""
+    excess = returns - risk_free / periods_per_year
+    downside = np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2, axis=0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return excess.mean(axis=0) / downside * np.sqrt(periods_per_year)
+
+
+def drawdowns(equity):
+    """Returns the maximum drawdown (as a fraction of the running peak)
+    and the longest time spent below a previous peak (in bars) of every
+    column of a block of equity curves."""
+    peak = np.maximum.accumulate(equity, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        max_drawdown = np.nanmax(1.0 - equity / peak, axis=0)
+    bar = np.arange(len(equity))[:, np.newaxis]
+    last_peak = np.maximum.accumulate(np.where(equity >= peak, bar, 0), axis=0)
+    return max_drawdown, (bar - last_peak).max(axis=0)
+
+
+def performance_metrics(equity, positions=None, periods_per_year=252,
+                        risk_free=0.0, max_cells=2 ** 24):
+    """Computes the usual performance metrics for many equity curves at
+    once, column by column, e.g. for every pair of a sweep or every path
+    of a Monte Carlo run.
+
+    Requires:
+    equity - A (bars x configs) block of total equity, or a DataFrame
+        with one column per config. A single curve may be 1-D.
+    positions - Optionally the matching block of positions held, used
+        for the hit rate, turnover and trade count.
+    periods_per_year - Number of bars per year, for annualising.
+    risk_free - Annual risk free rate subtracted from the returns.
+    max_cells - Columns are processed in blocks of at most this many
+        elements to bound the temporary memory.
+
+    Returns a DataFrame with one row per config and the columns sharpe,
+    sortino, cagr, max_drawdown, max_drawdown_duration (in bars),
+    hit_rate, turnover and trades. hit_rate is the fraction of bars with
+    a position open (any bar when positions are not given) that gained,
+    turnover the traded quantity per year relative to the mean absolute
+    position. Without positions turnover and trades are unknown, NaN."""
+    labels = equity.columns if isinstance(equity, pd.DataFrame) else None
+    equity = np.asarray(equity, dtype=np.float64)
+    if equity.ndim == 1:
+        equity = equity[:, np.newaxis]
+    if positions is not None:
+        positions = np.asarray(positions, dtype=np.float64).reshape(equity.shape)
+
+    n_bars, n_configs = equity.shape
+    years = (n_bars - 1) / float(periods_per_year)
+    columns = ['sharpe', 'sortino', 'cagr', 'max_drawdown', 'max_drawdown_duration',
+               'hit_rate', 'turnover', 'trades']
+    result = np.empty((n_configs, len(columns)))
+
+    step = max(1, max_cells // max(n_bars, 1))
+    for start in range(0, n_configs, step):
+        block = slice(start, start + step)
+        curve = equity[:, block]
+        returns = simple_returns(curve)
+        max_drawdown, duration = drawdowns(curve)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cagr = (curve[-1] / curve[0]) ** (1.0 / years) - 1.0
+
+        if positions is None:
+            active = returns != 0.0
+            turnover = np.full(curve.shape[1], np.nan)
+            trades = np.full(curve.shape[1], np.nan)
+        else:
+            held = positions[:, block]
+            active = held[:-1] != 0.0
+            traded = np.abs(np.diff(held, axis=0))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                turnover = traded.sum(axis=0) / np.abs(held).mean(axis=0) / years
+            trades = np.count_nonzero(traded, axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            hit_rate = np.sum(active & (returns > 0.0), axis=0) / np.sum(active, axis=0)
+
+        result[block] = np.column_stack([sharpe_ratio(returns, periods_per_year, risk_free),
+                                         sortino_ratio(returns, periods_per_year, risk_free),
+                                         cagr, max_drawdown, duration, hit_rate, turnover, trades])
+
+    return pd.DataFrame(result, index=labels, columns=columns)
@@ -0,0 +1,93 @@
+# monte_carlo.py
+
+import numpy as np
+import pandas as pd
+
+from parallel import map_tasks, seeded_chunks
+
+
+def random_signal_paths(rng, n_paths, n_bars):
+    """Draws an (n_paths x n_bars) matrix of random long/short signals
+    the way RandomForecastingStrategy does, with the first five bars of
+    every path set to zero."""
+    signals = np.sign(rng.standard_normal((n_paths, n_bars)))
+    signals[:, 0:5] = 0.0
+    return signals
+
+
+def backtest_signal_paths(open_prices, signals, shares=100, initial_capital=100000.0):
+    """Batched MarketOnOpenPortfolio.backtest_portfolio arithmetic,
+    holding shares * signal of the symbol on every bar and trading at
+    the open.
+
+    Requires:
+    open_prices - An array of open prices, one per bar.
+    signals - An (n_paths x n_bars) matrix of signals (1, 0, -1).
+    shares - The number of shares held long or short on a signal.
+    initial_capital - The amount in cash at the start of each path.
+
+    Returns the (n_paths x n_bars) matrix of total equity."""
+    positions = shares * signals
+    pos_diff = np.zeros_like(positions)
+    pos_diff[:, 1:] = np.diff(positions, axis=1)
+    holdings = positions * open_prices
+    cash = initial_capital - np.cumsum(pos_diff * open_prices, axis=1)
+    return cash + holdings
+
+
+def _summarise(total, initial_capital):
+    peak = np.maximum.accumulate(total, axis=1)
+    drawdown = 1.0 - total / peak
+    return np.column_stack([total[:, -1],
+                            total[:, -1] / initial_capital - 1.0,
+                            drawdown.max(axis=1)])
+
+
+def _run_chunk(args, task):
+    seed, n_paths = task
+    open_prices, shares, initial_capital = args
+    rng = np.random.default_rng(seed)
+    signals = random_signal_paths(rng, n_paths, len(open_prices))
+    total = backtest_signal_paths(open_prices, signals, shares, initial_capital)
+    return _summarise(total, initial_capital)
+
+
+def monte_carlo_random_forecast(bars, n_paths, seed=0, shares=100,
+                                initial_capital=100000.0, chunk_size=None,
+                                processes=None, max_cells=2 ** 22):
+    """Runs RandomForecastingStrategy with MarketOnOpenPortfolio over
+    n_paths random signal paths, giving a null distribution to compare
+    real strategies against.
+
+    Paths are drawn and backtested in chunks of chunk_size paths, each
+    chunk with its own generator spawned from seed, so the same seed
+    and chunk_size give the same results however many processes run
+    the chunks.
+
+    Requires:
+    bars - A DataFrame of bars with an 'Open' column.
+    n_paths - Number of random signal paths.
+    seed - Seed of the random draws.
+    shares - The number of shares held long or short on a signal.
+    initial_capital - The amount in cash at the start of each path.
+    chunk_size - Paths per chunk, by default as many as fit in
+        max_cells elements.
+    processes - Number of worker processes, None for one per core and
+        1 to run in this process.
+
+    Returns a DataFrame with the final equity, total return and maximum
+    drawdown of every path."""
+    if n_paths < 1:
+        raise ValueError("Need at least one path, got %d" % n_paths)
+    open_prices = np.asarray(bars['Open'], dtype=np.float64)
+    tasks = seeded_chunks(n_paths, seed, len(open_prices), chunk_size, max_cells)
+    chunks = map_tasks(_run_chunk, tasks, (open_prices, shares, float(initial_capital)), processes)
+    return pd.DataFrame(np.concatenate(chunks), columns=['final_equity', 'total_return', 'max_drawdown'])
+
+
+if __name__ == "__main__":
+    from benchmark import synthetic_bars
+
+    bars = synthetic_bars(2500, seed=1, freq='D')
+    results = monte_carlo_random_forecast(bars, 10000, seed=42)
+    print(results.describe())
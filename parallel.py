@@ -0,0 +1,67 @@
+# parallel.py
+
+import multiprocessing
+
+import numpy as np
+
+
+# The function and arguments every worker runs its tasks with, handed
+# to each worker once when it starts instead of being pickled along
+# with every task
+_worker_func = None
+_worker_args = None
+
+
+def _init_worker(func, args):
+    global _worker_func, _worker_args
+    _worker_func = func
+    _worker_args = args
+
+
+def _run_task(task):
+    return _worker_func(_worker_args, task)
+
+
+def map_tasks(func, tasks, args=None, processes=None, chunksize=None):
+    """Runs func(args, task) for every task on a pool of worker
+    processes. args, typically the arrays all tasks read, reaches every
+    worker once, while only the (small) tasks are sent one by one.
+
+    Requires:
+    func - A module level function func(args, task).
+    tasks - A list of tasks.
+    args - The arguments shared by all tasks.
+    processes - Number of worker processes, None for one per core and
+        1 to run in this process, as is also done for a single task.
+    chunksize - Tasks handed to a worker at once, see Pool.map.
+
+    Returns the results of the tasks in order."""
+    if processes == 1 or len(tasks) <= 1:
+        return [func(args, task) for task in tasks]
+    pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(func, args))
+    try:
+        return pool.map(_run_task, tasks, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def seeded_chunks(n_draws, seed=0, draw_size=1, chunk_size=None, max_cells=2 ** 22):
+    """Splits n_draws random draws (e.g. Monte Carlo paths or bootstrap
+    resamples) into map_tasks tasks, each with its own generator seed
+    spawned from seed, so the same seed and chunk_size give the same
+    draws however many processes run the chunks.
+
+    Requires:
+    n_draws - Number of draws.
+    seed - Seed of the random draws.
+    draw_size - Number of elements of one draw, e.g. its bars.
+    chunk_size - Draws per chunk, by default as many as fit in
+        max_cells elements.
+
+    Returns a list of (SeedSequence, number of draws) tasks."""
+    if chunk_size is None:
+        chunk_size = max(1, max_cells // max(draw_size, 1))
+    n_chunks = -(-n_draws // chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    return [(seeds[i], min(chunk_size, n_draws - i * chunk_size)) for i in range(n_chunks)]
@@ -1,5 +1,7 @@
 from abc import ABCMeta, abstractmethod
 
+from profiling import instrument_methods
+
 class Portfolio(object):
     """An abstract base class representing a portfolio of
     positions (including both instruments and cash), determined
@@ -7,6 +9,13 @@ class Portfolio(object):
 
     __metaclass__ = ABCMeta
 
+    def __init_subclass__(cls, **kwargs):
+        """Times the position and portfolio construction of every
+        subclass with the profiler."""
+        super(Portfolio, cls).__init_subclass__(**kwargs)
+        instrument_methods(cls, ('generate_positions', 'generate_portfolio',
+                                 'backtest_portfolio', 'generate_portfolio_detail'))
+
     @abstractmethod
     def generate_positions(self):
         """Provides the logic to determine how the portfolio
@@ -24,3 +33,9 @@ class Portfolio(object):
         Produces a portfolio object that can be examined by
         other classes/functions."""
         raise NotImplementedError("Should implement generate_portfolio()!")
+
+    def on_bar(self, bar, signal):
+        """Streaming counterpart of generate_portfolio. Receives one bar
+        and the strategy's row of signals for it, and returns that bar's
+        row of the portfolio after filling any order."""
+        raise NotImplementedError("Should implement on_bar()!")
@@ -0,0 +1,207 @@
+# profiling.py
+
+import functools
+import json
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+
+class _Stage(object):
+    """One timed call of a stage, see Profiler.stage."""
+
+    __slots__ = ('profiler', 'name', 'owner', 'rows', 'stack', 'wall', 'cpu',
+                 'memory', 'children_wall')
+
+    def __init__(self, profiler, name, owner, rows):
+        self.profiler = profiler
+        self.name = name
+        self.owner = owner
+        self.rows = rows
+        self.children_wall = 0.0
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        self.stack = ';'.join([stage.name for stage in stack] + [self.name])
+        stack.append(self)
+        self.memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        allocated = None
+        if self.memory is not None and tracemalloc.is_tracing():
+            allocated = tracemalloc.get_traced_memory()[0] - self.memory
+        stack = self.profiler._stack()
+        stack.pop()
+        if stack:
+            stack[-1].children_wall += wall
+        self.profiler._add(self.stack, self.owner, wall, wall - self.children_wall, cpu,
+                           self.rows, allocated)
+        return False
+
+
+class Profiler(object):
+    """Collects wall time, CPU time, rows processed and (while
+    tracemalloc is tracing) memory allocated per pipeline stage.
+
+    Calls are aggregated per (stage stack, owner), so the cost stays
+    constant however many runs are profiled. When disabled the
+    instrumented methods call straight through.
+
+    Requires:
+    enabled - Whether stages are recorded.
+    trace_memory - Whether to start tracemalloc, which makes the
+        memory figures available at a noticeable cost in speed. Tracing
+        started elsewhere is used as it is and left running."""
+
+    def __init__(self, enabled=True, trace_memory=False):
+        self.enabled = enabled
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Whether this profiler started tracemalloc, and so may stop it
+        self._tracing = False
+        if trace_memory:
+            self._start_tracing()
+
+    def _start_tracing(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+    def enable(self, trace_memory=False):
+        self.enabled = True
+        if trace_memory:
+            self._start_tracing()
+
+    def disable(self):
+        self.enabled = False
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def stage(self, name, owner=None, rows=None):
+        """Returns a context manager timing the enclosed block as stage
+        name. Its rows attribute may be set inside the block."""
+        return _Stage(self, name, owner, rows)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _add(self, stack, owner, wall, self_wall, cpu, rows, allocated):
+        with self._lock:
+            stats = self._stats.get((stack, owner))
+            if stats is None:
+                stats = self._stats[(stack, owner)] = {
+                    'calls': 0, 'wall': 0.0, 'self_wall': 0.0, 'cpu': 0.0,
+                    'rows': 0, 'allocated': None}
+            stats['calls'] += 1
+            stats['wall'] += wall
+            stats['self_wall'] += self_wall
+            stats['cpu'] += cpu
+            if rows is not None:
+                stats['rows'] += rows
+            if allocated is not None:
+                stats['allocated'] = (stats['allocated'] or 0) + allocated
+
+    def report(self):
+        """Returns the aggregated stages as a list of dicts, slowest first."""
+        with self._lock:
+            records = [dict(stats, stage=stack.split(';')[-1], stack=stack, owner=owner)
+                       for (stack, owner), stats in self._stats.items()]
+        return sorted(records, key=lambda record: -record['wall'])
+
+    def to_json(self, path=None):
+        """Returns the report as JSON, also writing it to path if given."""
+        text = json.dumps(self.report(), indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_folded(self, path=None):
+        """Returns the report in the folded stack format read by
+        flamegraph.pl and speedscope, one 'stack value' line per stage
+        with its self time in microseconds, also writing it to path if
+        given."""
+        folded = {}
+        for record in self.report():
+            folded[record['stack']] = folded.get(record['stack'], 0) + record['self_wall']
+        text = ''.join('%s %d\n' % (stack, round(seconds * 1e6))
+                       for stack, seconds in sorted(folded.items()))
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+
+# The profiler used by all instrumented stages
+profiler = Profiler()
+
+
+def _rows(result, instance=None):
+    # A method processes its instance's bars, whatever it returns, e.g.
+    # the few trade rows of generate_portfolio_detail
+    bars = getattr(instance, 'bars', None)
+    try:
+        return len(bars if bars is not None else result)
+    except TypeError:
+        return None
+
+
+def _owner(instance):
+    # Keyed by class, symbol and the plain parameters of the instance
+    # (e.g. the windows of a strategy), never by instance, so the stats
+    # grow with the parameter sets run and not with the number of runs
+    params = ['%s=%s' % (name, value) for name, value in sorted(vars(instance).items())
+              if name != 'symbol' and not name.startswith('_') and
+              isinstance(value, (bool, int, float, str, np.generic))]
+    symbol = getattr(instance, 'symbol', None)
+    if symbol is not None:
+        params.insert(0, str(symbol))
+    if not params:
+        return type(instance).__name__
+    return '%s(%s)' % (type(instance).__name__, ', '.join(params))
+
+
+def profiled(name=None, method=False):
+    """Decorator timing every call of a function as a stage, named after
+    the function unless name is given. For methods (method=True) the
+    instance's class, symbol and parameters are recorded as owner, and
+    the length of its bars as the rows processed."""
+    def decorate(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            with profiler.stage(stage_name, _owner(args[0]) if method else None) as stage:
+                result = func(*args, **kwargs)
+                stage.rows = _rows(result, args[0] if method else None)
+            return result
+        wrapper.__profiled__ = True
+        return wrapper
+    return decorate
+
+
+def instrument_methods(cls, names):
+    """Wraps the methods in names that cls itself defines with profiled,
+    used by the Strategy and Portfolio base classes on every subclass."""
+    for method_name in names:
+        func = cls.__dict__.get(method_name)
+        if callable(func) and not getattr(func, '__profiled__', False):
+            setattr(cls, method_name, profiled('%s.%s' % (cls.__name__, method_name), method=True)(func))
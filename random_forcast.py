@@ -2,9 +2,10 @@
 
 import numpy as np
 import pandas as pd
-import quandl  # Necessary for obtaining financial data easily
 
+from bar_store import BarStore
 from portfolio import Portfolio
+from results_store import get_or_run
 from strategy import Strategy
 
 
@@ -22,11 +23,12 @@ class RandomForecastingStrategy(Strategy):
     def generate_signals(self):
         """Creates a pandas DataFrame of random signals."""
         signals = pd.DataFrame(index=self.bars.index)
-        signals['signal'] = np.sign(np.random.randn(len(signals)))
+        signal = np.sign(np.random.randn(len(signals)))
 
         # The first five elements are set to zero in order to minimise
         # upstream NaN errors in the forecaster.
-        signals['signal'][0:5] = 0.0
+        signal[0:5] = 0.0
+        signals['signal'] = signal
         return signals
 
 
@@ -55,8 +57,8 @@ class MarketOnOpenPortfolio(Portfolio):
         """Creates a 'positions' DataFrame that simply longs or shorts
         100 of the particular symbol based on the forecast signals of
         {1, 0, -1} from the signals DataFrame."""
-        positions = pd.DataFrame(index=signals.index).fillna(0.0)
-        positions[self.symbol] = 100 * signals['signal']
+        positions = pd.DataFrame(index=self.signals.index).fillna(0.0)
+        positions[self.symbol] = 100 * self.signals['signal']
         return positions
 
     def backtest_portfolio(self):
@@ -73,14 +75,14 @@ class MarketOnOpenPortfolio(Portfolio):
         # Construct the portfolio DataFrame to use the same index
         # as 'positions' and with a set of 'trading orders' in the
         # 'pos_diff' object, assuming market open prices.
-        portfolio = self.positions * self.bars['Open']
+        portfolio = self.positions.mul(self.bars['Open'], axis=0)
         pos_diff = self.positions.diff()
 
         # Create the 'holdings' and 'cash' series by running through
         # the trades and adding/subtracting the relevant quantity from
         # each column
-        portfolio['holdings'] = (self.positions * self.bars['Open']).sum(axis=1)
-        portfolio['cash'] = self.initial_capital - (pos_diff * self.bars['Open']).sum(axis=1).cumsum()
+        portfolio['holdings'] = self.positions.mul(self.bars['Open'], axis=0).sum(axis=1)
+        portfolio['cash'] = self.initial_capital - pos_diff.mul(self.bars['Open'], axis=0).sum(axis=1).cumsum()
 
         # Finalise the total and bar-based returns based on the 'cash'
         # and 'holdings' figures for the portfolio
@@ -90,17 +92,23 @@ class MarketOnOpenPortfolio(Portfolio):
 
 if __name__ == "__main__":
     # Obtain daily bars of SPY (ETF that generally
-    # follows the S&P500) from Quandl (requires 'pip install Quandl'
-    # on the command line)
+    # follows the S&P500) from Quandl through the local bar store
+    # (requires 'pip install Quandl' on the command line)
     symbol = 'SPY'
-    bars = quandl.get("WIKI/AAPL", collapse="daily")
+    bars = BarStore().get('WIKI/AAPL', 'quandl', frequency='daily')
 
-    # Create a set of random forecasting signals for SPY
-    rfs = RandomForecastingStrategy(symbol, bars)
-    signals = rfs.generate_signals()
+    # Create a set of random forecasting signals for SPY, seeded so
+    # that the stored run can be reproduced
+    seed = 0
 
-    # Create a portfolio of SPY
-    portfolio = MarketOnOpenPortfolio(symbol, bars, signals, initial_capital=100000.0)
-    returns = portfolio.backtest_portfolio()
+    def backtest():
+        np.random.seed(seed)
+        rfs = RandomForecastingStrategy(symbol, bars)
+        signals = rfs.generate_signals()
 
-    print(returns.tail(10))
\ No newline at end of file
+        # Create a portfolio of SPY
+        portfolio = MarketOnOpenPortfolio(symbol, bars, signals, initial_capital=100000.0)
+        return portfolio.backtest_portfolio()
+
+    run = get_or_run('random_forecast', symbol, bars, {'seed': seed, 'initial_capital': 100000.0}, backtest)
+    print('run %d: sharpe %.3f, total return %.2f%%' % (run['id'], run['sharpe'], 100.0 * run['total_return']))
\ No newline at end of file
@@ -1,8 +1,9 @@
 import numpy as np
 import pandas as pd
-import quandl
 
+from bar_store import BarStore
 from portfolio import Portfolio
+from results_store import get_or_run
 from strategy import Strategy
 
 
@@ -63,7 +64,7 @@ class MarketOnOpenPortfolio(Portfolio):
         # Construct the portfolio DataFrame to use the same index
         # as 'positions' and with a set of 'trading orders' in the
         # 'pos_diff' object, assuming market open prices.
-        portfolio = self.positions*self.bars['Open']
+        portfolio = self.positions.mul(self.bars['Open'], axis=0)
         # diff() means subtract previous element, so if position looks like 100, 0, -100
         # diff() will return -100, -100, that means there are two sell execution of quantity 100
         pos_diff = self.positions.diff()
@@ -71,8 +72,8 @@ class MarketOnOpenPortfolio(Portfolio):
         # Create the 'holdings' and 'cash' series by running through
         # the trades and adding/subtracting the relevant quantity from
         # each column
-        portfolio['holdings'] = (self.positions * self.bars['Open']).sum(axis=1)  # 沿着y轴相加， 合并时间
-        portfolio['cash'] = self.initial_capital - (pos_diff * self.bars['Open']).sum(axis=1).cumsum()  # pos_diff * "price" = total notional amount for all executions
+        portfolio['holdings'] = self.positions.mul(self.bars['Open'], axis=0).sum(axis=1)  # 沿着y轴相加， 合并时间
+        portfolio['cash'] = self.initial_capital - pos_diff.mul(self.bars['Open'], axis=0).sum(axis=1).cumsum()  # pos_diff * "price" = total notional amount for all executions
 
         portfolio['total'] = portfolio['cash'] + portfolio['holdings']
         portfolio['returns'] = portfolio['total'].pct_change()
@@ -85,14 +86,19 @@ if __name__ == "__main__":
     # Obtain daily bars of SPY (ETF that generally
     # follows the S&P500)     # Obtain daily bars of SPY (ETF that generally
     #     # follows the S&P500)
-    bars = quandl.get("WIKI/AAPL", collapse="daily", start_date="2017-03-23")
+    bars = BarStore().get('WIKI/AAPL', 'quandl', '2017-03-23', frequency='daily')
 
-    rfs = RandomForcastingStrategy(symbol, bars)
-    signals = rfs.generate_signals()
+    # Seeded, so that the stored run can be reproduced
+    seed = 0
 
-    portfolio = MarketOnOpenPortfolio(symbol, bars, signals, initial_capital=100000.0)
-    returns = portfolio.backtest_portfolio()
+    def backtest():
+        np.random.seed(seed)
+        rfs = RandomForcastingStrategy(symbol, bars)
+        signals = rfs.generate_signals()
+        portfolio = MarketOnOpenPortfolio(symbol, bars, signals, initial_capital=100000.0)
+        return portfolio.backtest_portfolio()
 
-    print(returns.tail(10))
+    run = get_or_run('random_forcasting', symbol, bars, {'seed': seed, 'initial_capital': 100000.0}, backtest)
+    print('run %d: sharpe %.3f, total return %.2f%%' % (run['id'], run['sharpe'], 100.0 * run['total_return']))
 
 
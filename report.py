@@ -0,0 +1,137 @@
+# report.py
+
+import os
+import sys
+
+import numpy as np
+
+from parallel import map_tasks
+from profiling import profiled
+
+
+def lttb(y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Picks n_out of the points of y (taken at x = 0, 1, 2, ...) that
+    best preserve the visual shape of the line: the first and last
+    points are always kept, and from each bucket in between the point
+    forming the largest triangle with the previously kept point and the
+    average of the next bucket.
+
+    Returns the sorted indices of the kept points."""
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 2 < len(edges):
+            next_x = (edges[i + 1] + edges[i + 2] - 1) / 2.0
+            next_y = np.nanmean(y[edges[i + 1]:edges[i + 2]])
+        else:
+            next_x, next_y = n - 1, y[-1]
+        x = np.arange(lo, hi)
+        area = np.abs((previous - next_x) * (y[lo:hi] - y[previous]) -
+                      (previous - x) * (next_y - y[previous]))
+        previous = lo + int(np.nanargmax(area)) if np.isfinite(area).any() else lo
+        kept[i + 1] = previous
+    return kept
+
+
+def thin(series, n_out, keep=None):
+    """Returns series reduced to about n_out points with lttb, always
+    including the positions in keep (e.g. the bars carrying a trade)."""
+    indices = lttb(series.values, n_out)
+    if keep is not None:
+        indices = np.union1d(indices, keep)
+    return series.iloc[indices]
+
+
+def headless():
+    """Returns whether there is no display to show a figure on, e.g. in
+    a batch job or an ssh session, so plots should go to a file."""
+    if sys.platform in ('win32', 'darwin'):
+        return False
+    return not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+
+def new_figure(figsize=(12, 8)):
+    """Returns a Figure drawn by the Agg canvas, without going through
+    pyplot, so no GUI backend is loaded and the process-wide backend is
+    left as it is."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    fig.patch.set_facecolor('white')  # Set the outer colour to white
+    return fig
+
+
+@profiled('render_report')
+def render_report(path, bars, signals, portfolio, title=None, max_points=2000,
+                  short_key='short_mavg', long_key='long_mavg', dpi=100):
+    """Renders the ma_cross plot (price with moving averages and trades
+    above, equity curve with trades below) to an image file without a
+    display.
+
+    Every line is thinned to about max_points points while the buy and
+    sell markers are drawn at every trade from the full data.
+
+    Requires:
+    path - Image file to write, its extension selects the format.
+    bars - A DataFrame of bars with a 'Close' column.
+    signals - The strategy signals, with moving average and 'positions'
+        columns.
+    portfolio - The portfolio DataFrame with a 'total' column."""
+    positions = signals['positions'].values
+    buys = np.flatnonzero(positions == 1.0)
+    sells = np.flatnonzero(positions == -1.0)
+    trades = np.union1d(buys, sells)
+
+    fig = new_figure()
+    ax1 = fig.add_subplot(311, ylabel='Price in $')
+    if title:
+        ax1.set_title(title)
+
+    # Plot the closing price overlaid with the moving averages
+    for series, color in ((bars['Close'], 'b'), (signals[short_key], 'g'), (signals[long_key], 'r')):
+        line = thin(series, max_points, trades)
+        ax1.plot(line.index, line.values, color=color, lw=2., label=series.name)
+    ax1.legend()
+
+    # Plot the "buy" and "sell" trades against the short moving average
+    ax1.plot(signals.index[buys], signals[short_key].values[buys], '^', markersize=10, color='m')
+    ax1.plot(signals.index[sells], signals[short_key].values[sells], 'v', markersize=10, color='k')
+
+    # Plot the equity curve in dollars with the trades against it
+    ax2 = fig.add_subplot(313, ylabel='Portfolio value in $')
+    line = thin(portfolio['total'], max_points, trades)
+    ax2.plot(line.index, line.values, lw=2.)
+    ax2.plot(signals.index[buys], portfolio['total'].values[buys], '^', markersize=10, color='m')
+    ax2.plot(signals.index[sells], portfolio['total'].values[sells], 'v', markersize=10, color='k')
+
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+def _render(args, kwargs):
+    return render_report(**kwargs)
+
+
+def render_reports(reports, processes=None):
+    """Renders many reports in parallel worker processes.
+
+    Requires:
+    reports - A list of dicts of render_report keyword arguments.
+    processes - Number of worker processes, None for one per core and
+        1 to render in this process.
+
+    Returns the list of written paths."""
+    return map_tasks(_render, reports, processes=processes)
@@ -0,0 +1,246 @@
+# resample.py
+
+import numpy as np
+import pandas as pd
+
+from bars import Bars
+
+
+# How each bar field is aggregated, any other field keeps its last value
+AGGREGATES = {
+    'Open': 'first',
+    'High': 'max',
+    'Low': 'min',
+    'Close': 'last',
+    'Adj Close': 'last',
+    'Volume': 'sum',
+}
+
+# NaN-skipping reducers, as resample's max, min and sum skip missing
+# values
+_REDUCERS = {'max': np.fmax, 'min': np.fmin, 'sum': np.add}
+
+
+def _first_present(values, starts, last):
+    """Returns the first non-NaN value of every bucket, NaN where a
+    bucket has none. starts and last are its first and last rows."""
+    if not np.isnan(values).any():
+        return values[starts]
+    position = np.where(np.isnan(values), len(values), np.arange(len(values)))
+    chosen = np.minimum.reduceat(position, starts)
+    found = chosen <= last
+    return np.where(found, values[np.where(found, chosen, 0)], np.nan)
+
+
+def _last_present(values, starts, last):
+    """Returns the last non-NaN value of every bucket, see
+    _first_present."""
+    if not np.isnan(values).any():
+        return values[last]
+    position = np.where(np.isnan(values), -1, np.arange(len(values)))
+    chosen = np.maximum.reduceat(position, starts)
+    found = chosen >= starts
+    return np.where(found, values[np.where(found, chosen, 0)], np.nan)
+
+
+def aggregate(timestamps, fields, width):
+    """Aggregates bars into buckets of width nanoseconds, aligned to the
+    epoch as pandas resample does for widths dividing a day, in a single
+    reduceat pass per field. Buckets without any bar are left out. Like
+    resample, the aggregates skip NaN values: first and last take the
+    first and last value present, and a sum over NaNs alone is 0.
+
+    Requires:
+    timestamps - Sorted int64 nanosecond timestamps of the bars.
+    fields - A dict of field name to array of values.
+    width - The bucket width in nanoseconds.
+
+    Returns (timestamps, fields) of the buckets, labelled by their start."""
+    if not len(timestamps):
+        return timestamps, dict((name, values[:0]) for name, values in fields.items())
+    bucket = timestamps // width
+    starts = np.flatnonzero(np.diff(bucket, prepend=bucket[0] - 1))
+    last = np.append(starts[1:], len(bucket)) - 1
+    aggregated = {}
+    for name, values in fields.items():
+        how = AGGREGATES.get(name, 'last')
+        if how == 'first':
+            aggregated[name] = _first_present(values, starts, last)
+        elif how == 'last':
+            aggregated[name] = _last_present(values, starts, last)
+        elif how == 'sum':
+            aggregated[name] = np.add.reduceat(np.where(np.isnan(values), 0.0, values), starts)
+        else:
+            aggregated[name] = _REDUCERS[how].reduceat(values, starts)
+    return bucket[starts] * width, aggregated
+
+
+def _merge(old, new, how):
+    """Combines the trailing partial bucket old with the same bucket's
+    aggregate over newly arrived bars."""
+    if how == 'first':
+        return new if np.isnan(old) else old
+    if how == 'last':
+        return old if np.isnan(new) else new
+    return _REDUCERS[how](old, new)
+
+
+class _Columns(object):
+    """Growable arrays of timestamps and fields, doubling their capacity
+    so that appending stays proportional to the appended rows."""
+
+    __slots__ = ('size', 'timestamps', 'fields')
+
+    def __init__(self, timestamps, fields):
+        self.size = len(timestamps)
+        self.timestamps = np.array(timestamps, dtype=np.int64)
+        self.fields = dict((name, np.array(values)) for name, values in fields.items())
+
+    def extend(self, timestamps, fields):
+        needed = self.size + len(timestamps)
+        if needed > len(self.timestamps):
+            capacity = max(needed, 2 * len(self.timestamps))
+            self.timestamps = self._grow(self.timestamps, capacity)
+            self.fields = dict((name, self._grow(values, capacity)) for name, values in self.fields.items())
+        self.timestamps[self.size:needed] = timestamps
+        for name, values in fields.items():
+            self.fields[name][self.size:needed] = values
+        self.size = needed
+
+    def _grow(self, values, capacity):
+        grown = np.empty(capacity, dtype=values.dtype)
+        grown[:self.size] = values[:self.size]
+        return grown
+
+    def bars(self, symbol=None):
+        return Bars(self.timestamps[:self.size],
+                    dict((name, values[:self.size]) for name, values in self.fields.items()),
+                    symbol)
+
+
+class MultiTimeframeBars(object):
+    """Bars of one symbol at several timeframes, all aggregated from the
+    same base bars (e.g. minute bars) and cached.
+
+    Timeframes are pandas offsets of fixed width dividing a day or a
+    whole number of days, e.g. '5min', '1h' or '1D'. Buckets are aligned
+    to UTC midnight, also for bars with a timezone. Each is built once,
+    from the coarsest already built timeframe it is a multiple of, so
+    building several costs little more than one pass over the base bars.
+    Appending base bars only touches the trailing, partial bar of every
+    cached timeframe and the bars after it.
+
+    Requires:
+    bars - A DataFrame of base bars indexed by timestamp.
+    timeframes - Timeframes to build up front, others are built on their
+        first request.
+    symbol - Optionally the symbol, set on the Bars returned."""
+
+    def __init__(self, bars, timeframes=(), symbol=None):
+        self.symbol = symbol
+        self.tz = getattr(bars.index, 'tz', None)
+        self.columns = list(bars.columns)
+        self.base = _Columns(bars.index.values.astype('datetime64[ns]').view(np.int64),
+                             dict((name, np.asarray(bars[name].values, dtype=np.float64))
+                                  for name in self.columns))
+        self._timeframes = {}
+        self._frames = {}
+        for timeframe in sorted(timeframes, key=self._width):
+            self._build(timeframe)
+
+    @staticmethod
+    def _width(timeframe):
+        width = pd.Timedelta(timeframe).value
+        day = pd.Timedelta('1D').value
+        if width <= 0 or (width < day and day % width) or (width > day and width % day):
+            raise ValueError("Timeframe %r does not divide a day evenly" % timeframe)
+        return width
+
+    def _build(self, timeframe):
+        width = self._width(timeframe)
+        # Aggregate from the coarsest cached timeframe width is a multiple of
+        source = self.base
+        source_width = 0
+        for other, columns in self._timeframes.items():
+            other_width = self._width(other)
+            if width % other_width == 0 and other_width > source_width:
+                source, source_width = columns, other_width
+        timestamps, fields = aggregate(source.timestamps[:source.size],
+                                       dict((name, values[:source.size])
+                                            for name, values in source.fields.items()), width)
+        self._timeframes[timeframe] = _Columns(timestamps, fields)
+        return self._timeframes[timeframe]
+
+    def timeframes(self):
+        """Returns the cached timeframes."""
+        return sorted(self._timeframes, key=self._width)
+
+    def get_bars(self, timeframe=None):
+        """Returns the bars of timeframe (the base bars for None) as a
+        bars.Bars viewing the cached arrays, building them if needed."""
+        if timeframe is None:
+            return self.base.bars(self.symbol)
+        columns = self._timeframes.get(timeframe)
+        if columns is None:
+            columns = self._build(timeframe)
+        return columns.bars(self.symbol)
+
+    def get(self, timeframe=None):
+        """Returns the bars of timeframe (the base bars for None) as a
+        DataFrame, as the strategies take them. The DataFrame is cached
+        until the next append."""
+        frame = self._frames.get(timeframe)
+        if frame is None:
+            bars = self.get_bars(timeframe)
+            index = pd.DatetimeIndex(bars.timestamps.view('datetime64[ns]'), name='Date')
+            if self.tz is not None:
+                index = index.tz_localize('UTC').tz_convert(self.tz)
+            frame = self._frames[timeframe] = pd.DataFrame(bars.fields, index=index, columns=self.columns)
+        return frame
+
+    def append(self, bars):
+        """Adds base bars later than the last one held, updating every
+        cached timeframe from the new bars alone."""
+        timestamps = bars.index.values.astype('datetime64[ns]').view(np.int64)
+        if not len(timestamps):
+            return
+        if self.base.size and timestamps[0] <= self.base.timestamps[self.base.size - 1]:
+            raise ValueError("Appended bars must follow the last bar held")
+        fields = dict((name, np.asarray(bars[name].values, dtype=np.float64)) for name in self.columns)
+        self.base.extend(timestamps, fields)
+        self._frames = {}
+
+        for timeframe, columns in self._timeframes.items():
+            new_timestamps, new_fields = aggregate(timestamps, fields, self._width(timeframe))
+            last = columns.size - 1
+            if last >= 0 and new_timestamps[0] == columns.timestamps[last]:
+                # The first new bucket continues the trailing partial bar
+                for name, values in new_fields.items():
+                    columns.fields[name][last] = _merge(columns.fields[name][last], values[0],
+                                                        AGGREGATES.get(name, 'last'))
+                new_timestamps = new_timestamps[1:]
+                new_fields = dict((name, values[1:]) for name, values in new_fields.items())
+            columns.extend(new_timestamps, new_fields)
+
+
+if __name__ == "__main__":
+    import time
+
+    from benchmark import synthetic_bars
+
+    # A year of minute bars at four timeframes, then a day of appends
+    bars = synthetic_bars(525600 + 1440, seed=9)
+    history, live = bars.iloc[:525600], bars.iloc[525600:]
+    rules = ['5min', '15min', '1h', '1D']
+
+    t0 = time.perf_counter()
+    multi = MultiTimeframeBars(history, rules)
+    t1 = time.perf_counter()
+    for start in range(0, len(live), 60):
+        multi.append(live.iloc[start:start + 60])
+    t2 = time.perf_counter()
+    agg = dict((name, AGGREGATES[name]) for name in bars.columns)
+    for rule in rules:
+        bars.resample(rule).agg(agg).dropna()
+    t3 = time.perf_counter()
+    print('build: %.3fs, 24 hourly appends: %.4fs, pandas resample: %.3fs' % (t1 - t0, t2 - t1, t3 - t2))
@@ -0,0 +1,220 @@
+# results_store.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicator_cache import fingerprint
+from metrics import performance_metrics
+
+
+# Summary columns stored per run, the ones queries may rank by
+METRICS = ['final_equity', 'total_return', 'sharpe', 'sortino', 'cagr', 'max_drawdown',
+           'max_drawdown_duration', 'hit_rate', 'turnover', 'trades']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    run_key TEXT NOT NULL UNIQUE,
+    data_fingerprint TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    symbol TEXT,
+    params TEXT NOT NULL,
+    bars INTEGER NOT NULL,
+    created REAL NOT NULL,
+    %s);
+CREATE INDEX IF NOT EXISTS runs_strategy ON runs (strategy, symbol, params);
+CREATE INDEX IF NOT EXISTS runs_symbol ON runs (symbol, strategy);
+%s
+CREATE TABLE IF NOT EXISTS run_params (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    name TEXT NOT NULL,
+    value,
+    PRIMARY KEY (run_id, name));
+CREATE INDEX IF NOT EXISTS run_params_value ON run_params (name, value, run_id);
+""" % (',\n    '.join('%s REAL' % metric for metric in METRICS),
+       '\n'.join('CREATE INDEX IF NOT EXISTS runs_%s ON runs (%s);\n'
+                 'CREATE INDEX IF NOT EXISTS runs_symbol_%s ON runs (symbol, %s);' % ((metric,) * 4)
+                 for metric in METRICS))
+
+
+def _native(value):
+    # numpy scalars, e.g. windows taken from a sweep grid, as the Python
+    # ones they equal, so np.int64(5) keys and queries like 5
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _params_text(params):
+    return json.dumps(dict((name, _native(value)) for name, value in params.items()),
+                      sort_keys=True, default=float)
+
+
+def run_key(data_fingerprint, strategy, params):
+    """Returns the key identifying a run of strategy with params on the
+    bars with the given fingerprint, identical runs sharing it."""
+    text = '\n'.join([data_fingerprint, strategy, _params_text(params)])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class ResultsStore(object):
+    """A persistent, queryable store of backtest runs.
+
+    Each run's strategy, symbol, parameters and summary metrics are kept
+    in an indexed SQLite table, so ranking runs (e.g. the top 50 by
+    Sharpe for one symbol) or finding a configuration never scans every
+    run. Its portfolio curves are written column by column to one .npz
+    file per run, read back only when that run's curve is loaded.
+
+    Runs are keyed by (data fingerprint, strategy, parameters), so a run
+    that was already stored is found again instead of being recomputed.
+
+    Requires:
+    root - Directory holding the store, by default $BACKTESTER_RESULTS
+        or ~/.back_tester/results."""
+
+    def __init__(self, root=None):
+        if root is None:
+            root = os.environ.get('BACKTESTER_RESULTS',
+                                  os.path.join(os.path.expanduser('~'), '.back_tester', 'results'))
+        self.root = root
+        if not os.path.isdir(os.path.join(root, 'curves')):
+            os.makedirs(os.path.join(root, 'curves'))
+        self.db = sqlite3.connect(os.path.join(root, 'runs.sqlite'), timeout=60.0)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _curve_path(self, key):
+        return os.path.join(self.root, 'curves', key[:2], key + '.npz')
+
+    def find(self, data_fingerprint, strategy, params):
+        """Returns the summary dict of a stored identical run, or None."""
+        return self._summary('run_key = ?', (run_key(data_fingerprint, strategy, params),))
+
+    def _summary(self, where, args):
+        cursor = self.db.execute('SELECT * FROM runs WHERE %s' % where, args)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        summary = dict(zip([column[0] for column in cursor.description], row))
+        summary['params'] = json.loads(summary['params'])
+        return summary
+
+    def add(self, strategy, symbol, data_fingerprint, params, portfolio, periods_per_year=252):
+        """Stores a run, unless an identical one is stored already.
+
+        Requires:
+        strategy - Name of the strategy (and portfolio), e.g. 'ma_cross'.
+        symbol - The symbol traded.
+        data_fingerprint - indicator_cache.fingerprint of the bars.
+        params - A dict of the run's parameters, JSON serialisable once
+            numpy scalars are taken as Python ones.
+        portfolio - The portfolio DataFrame with a 'total' column, and
+            optionally 'positions'. All its numeric columns are stored.
+        periods_per_year - Number of bars per year, for the metrics.
+
+        Returns the summary dict of the stored run."""
+        key = run_key(data_fingerprint, strategy, params)
+        existing = self._summary('run_key = ?', (key,))
+        if existing is not None:
+            return existing
+
+        total = np.asarray(portfolio['total'], dtype=np.float64)
+        positions = portfolio['positions'] if 'positions' in portfolio else None
+        metrics = performance_metrics(total, positions, periods_per_year).iloc[0].to_dict()
+        metrics['final_equity'] = total[-1] if len(total) else np.nan
+        metrics['total_return'] = total[-1] / total[0] - 1.0 if len(total) else np.nan
+
+        # The curve goes to disk before its row, so every stored run has one
+        names = [name for name in portfolio.columns
+                 if np.issubdtype(np.asarray(portfolio[name]).dtype, np.number)]
+        columns = dict(('column_%d' % i, np.asarray(portfolio[name])) for i, name in enumerate(names))
+        tz = getattr(portfolio.index, 'tz', None)
+        path = self._curve_path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, index=portfolio.index.values.astype('datetime64[ns]').view(np.int64),
+                     tz=np.array('' if tz is None else str(tz)),
+                     names=np.array([str(name) for name in names]), **columns)
+        os.replace(path + '.tmp', path)
+
+        with self.db:
+            cursor = self.db.execute(
+                'INSERT OR IGNORE INTO runs (run_key, data_fingerprint, strategy, symbol, params, bars, '
+                'created, %s) VALUES (%s)' % (', '.join(METRICS), ', '.join('?' * (7 + len(METRICS)))),
+                [key, data_fingerprint, strategy, symbol, _params_text(params), len(total), time.time()] +
+                [float(metrics[metric]) for metric in METRICS])
+            if cursor.rowcount:
+                self.db.executemany('INSERT INTO run_params VALUES (?, ?, ?)',
+                                    [(cursor.lastrowid, name, _native(value))
+                                     for name, value in sorted(params.items())])
+        return self._summary('run_key = ?', (key,))
+
+    def get_or_run(self, strategy, symbol, bars, params, run, periods_per_year=252):
+        """Returns the stored summary of running strategy with params on
+        bars, calling run() for the portfolio DataFrame only when no
+        identical run is stored yet. The summary's 'cached' entry tells
+        which happened."""
+        data_fingerprint = fingerprint(bars)
+        summary = self.find(data_fingerprint, strategy, params)
+        cached = summary is not None
+        if not cached:
+            summary = self.add(strategy, symbol, data_fingerprint, params, run(), periods_per_year)
+        summary['cached'] = cached
+        return summary
+
+    def top(self, metric='sharpe', n=50, symbol=None, strategy=None, ascending=False, **params):
+        """Returns the n best runs by metric as a DataFrame, optionally
+        only those of symbol, of strategy and with the given parameter
+        values, e.g. top('sharpe', 50, symbol='AAPL', short_window=50)."""
+        if metric not in METRICS:
+            raise ValueError("Unknown metric %r" % metric)
+        where = ['%s IS NOT NULL' % metric]
+        args = []
+        if symbol is not None:
+            where.append('symbol = ?')
+            args.append(symbol)
+        if strategy is not None:
+            where.append('strategy = ?')
+            args.append(strategy)
+        for name, value in sorted(params.items()):
+            where.append('id IN (SELECT run_id FROM run_params WHERE name = ? AND value = ?)')
+            args.extend([name, _native(value)])
+        query = 'SELECT * FROM runs WHERE %s ORDER BY %s %s LIMIT ?' % (
+            ' AND '.join(where), metric, 'ASC' if ascending else 'DESC')
+        runs = pd.read_sql_query(query, self.db, params=args + [int(n)])
+        runs['params'] = [json.loads(text) for text in runs['params']]
+        return runs
+
+    def load_curve(self, run):
+        """Returns the stored portfolio DataFrame of a run, given its id,
+        run_key or summary dict."""
+        if isinstance(run, dict):
+            key = run['run_key']
+        elif isinstance(run, str):
+            key = run
+        else:
+            key = self.db.execute('SELECT run_key FROM runs WHERE id = ?', (int(run),)).fetchone()[0]
+        with np.load(self._curve_path(key)) as curve:
+            names = [str(name) for name in curve['names']]
+            index = pd.DatetimeIndex(curve['index'].view('datetime64[ns]'))
+            if str(curve['tz']):
+                index = index.tz_localize('UTC').tz_convert(str(curve['tz']))
+            return pd.DataFrame(dict((name, curve['column_%d' % i]) for i, name in enumerate(names)),
+                                index=index, columns=names)
+
+
+def get_or_run(strategy, symbol, bars, params, run, store=None):
+    """ResultsStore.get_or_run on the default store (or store), for the
+    __main__ blocks of the scripts: run() is only called to backtest a
+    run that is not stored yet."""
+    store = ResultsStore() if store is None else store
+    return store.get_or_run(strategy, symbol, bars, params, run)
@@ -0,0 +1,170 @@
+# shared_bars.py
+
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from bars import Bars
+from parallel import map_tasks
+from MarketOnClosePortfolio import MarketOnClosePortfolio
+from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+
+
+# Arrays start on cache line boundaries within the shared block
+_ALIGN = 64
+
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class SharedBars(object):
+    """Publishes the bars of many symbols once into a single shared
+    memory block, so worker processes attach zero-copy views instead of
+    receiving a pickled copy of every DataFrame. Only the small layout
+    (block name and array offsets) is sent to the workers, and memory
+    stays flat however many of them attach.
+
+    A SharedBars pickles as its layout alone and attaches to the block
+    again when unpickled, so it can be passed to worker processes as it
+    is. Use it as a context manager, or call close() to release the
+    block, which only the creating process removes.
+
+    Requires:
+    bars_by_symbol - A dict of symbol to DataFrame of bars or Bars.
+    dtype - The dtype the price fields are stored as, e.g. np.float32
+        to halve the block. None keeps the dtype of Bars and stores
+        DataFrames as float64.
+    columns - Optionally the only fields to publish, e.g. ['Close']."""
+
+    def __init__(self, bars_by_symbol, dtype=None, columns=None):
+        converted = {}
+        for symbol, bars in bars_by_symbol.items():
+            if not isinstance(bars, Bars):
+                bars = Bars.from_frame(bars, np.float64 if dtype is None else dtype, columns, symbol)
+            converted[symbol] = bars
+
+        # Lay every timestamp and field array out one after another
+        layout = {}
+        size = 0
+        for symbol, bars in converted.items():
+            names = bars.columns if columns is None else columns
+            fields = []
+            for name in names:
+                values = bars[name] if dtype is None else bars[name].astype(dtype, copy=False)
+                fields.append((name, values.dtype.str, size))
+                size = _aligned(size + values.nbytes)
+            layout[symbol] = (len(bars), size, fields)
+            size = _aligned(size + bars.timestamps.nbytes)
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.layout = (self.shm.name, layout)
+        self._owner = True
+        self._views = None
+        for symbol, (n_bars, offset, fields) in layout.items():
+            bars = converted[symbol]
+            np.ndarray(n_bars, np.int64, self.shm.buf, offset)[:] = bars.timestamps
+            for name, dtype_str, field_offset in fields:
+                np.ndarray(n_bars, dtype_str, self.shm.buf, field_offset)[:] = bars[name]
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    def bars(self):
+        """Returns the dict of symbol to Bars viewing the shared block in
+        this process."""
+        if self._views is None:
+            self._views = _views(self.shm, self.layout[1])
+        return self._views
+
+    def close(self):
+        """Releases the shared block, and removes it in the process that
+        created it."""
+        if self.shm is not None:
+            self._views = None
+            self.shm.close()
+            if self._owner:
+                self.shm.unlink()
+            self.shm = None
+
+    def __getstate__(self):
+        return {'layout': self.layout}
+
+    def __setstate__(self, state):
+        self.layout = state['layout']
+        self.shm = shared_memory.SharedMemory(name=self.layout[0])
+        self._owner = False
+        self._views = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def _views(shm, layout):
+    bars = {}
+    for symbol, (n_bars, offset, fields) in layout.items():
+        bars[symbol] = Bars(np.ndarray(n_bars, np.int64, shm.buf, offset),
+                            dict((name, np.ndarray(n_bars, dtype_str, shm.buf, field_offset))
+                                 for name, dtype_str, field_offset in fields),
+                            symbol)
+    return bars
+
+
+def _run_task(args, task):
+    shared, func = args
+    symbol, params = task
+    return func(shared.bars()[symbol], **params)
+
+
+def run_shared(shared, func, tasks, processes=None):
+    """Runs func over the shared bars on a pool of worker processes,
+    every worker attaching to the block once.
+
+    Requires:
+    shared - A SharedBars.
+    func - A module level function func(bars, **params), bars being the
+        task symbol's Bars, e.g. ma_cross_task.
+    tasks - A list of (symbol, params dict) tuples.
+    processes - Number of worker processes, None for one per core and
+        1 to run in this process.
+
+    Returns the results of the tasks in order."""
+    # Hand out the tasks in batches so dispatch costs little per task
+    chunksize = max(1, len(tasks) // (4 * (processes or multiprocessing.cpu_count())))
+    return map_tasks(_run_task, tasks, (shared, func), processes, chunksize)
+
+
+def ma_cross_task(bars, short_window=100, long_window=400, initial_capital=100000.0):
+    """MovingAverageCrossStrategy traded through MarketOnClosePortfolio
+    on the arrays of bars, for run_shared.
+
+    Returns the final equity and the number of orders."""
+    strategy = MovingAverageCrossStrategy(bars.symbol, bars, short_window, long_window, lazy=True)
+    signals = strategy.generate_signal_arrays()
+    portfolio = MarketOnClosePortfolio(bars.symbol, bars, signals, initial_capital, lazy=True)
+    total = portfolio.generate_portfolio_arrays()['total']
+    return total[-1], int(np.count_nonzero(np.nan_to_num(signals['positions'])))
+
+
+if __name__ == "__main__":
+    import time
+
+    from benchmark import synthetic_bars
+
+    # A universe of 50 symbols of 100k minute bars, 8 window pairs each
+    universe = dict(('SYM%02d' % i, synthetic_bars(100000, seed=i)) for i in range(50))
+    tasks = [(symbol, {'short_window': short_window, 'long_window': long_window})
+             for symbol in universe for short_window in (20, 50) for long_window in (100, 200, 300, 400)]
+
+    with SharedBars(universe, columns=['Close']) as shared:
+        print('shared block: %.1f MB' % (shared.nbytes / 1e6))
+        for processes in (1, 2):
+            t0 = time.perf_counter()
+            results = run_shared(shared, ma_cross_task, tasks, processes)
+            print('%d process(es): %d tasks in %.2fs' % (processes, len(tasks), time.perf_counter() - t0))
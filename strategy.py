@@ -1,5 +1,7 @@
 from abc import ABCMeta, abstractmethod
 
+from profiling import instrument_methods
+
 
 class Strategy(object):
     """Strategy is an abstract base class providing an interface for
@@ -12,8 +14,20 @@ class Strategy(object):
 
     __metaclass__ = ABCMeta
 
+    def __init_subclass__(cls, **kwargs):
+        """Times generate_signals of every subclass with the profiler."""
+        super(Strategy, cls).__init_subclass__(**kwargs)
+        instrument_methods(cls, ('generate_signals',))
+
     @abstractmethod
     def generate_signals(self):
         """An implementation is required to return the DataFrame of symbols
         containing the signals to go long, short or hold (1, -1 or 0)."""
         raise NotImplementedError("Should implement generate_signals()!")
+
+    def on_bar(self, bar):
+        """Streaming counterpart of generate_signals. Receives one bar
+        (a mapping of field to value, e.g. bar['Close']) at a time and
+        returns that bar's row of signals, updating any state needed for
+        the next bar incrementally."""
+        raise NotImplementedError("Should implement on_bar()!")
@@ -0,0 +1,43 @@
+# streaming.py
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from MarketOnClosePortfolio import MarketOnClosePortfolio
+from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+
+
+def replay(strategy, portfolio, bars):
+    """Feeds a DataFrame of bars one bar at a time through
+    strategy.on_bar and portfolio.on_bar, the way a live or paper
+    trading feed would, yielding (timestamp, signal row, portfolio row)
+    for every bar."""
+    columns = list(bars.columns)
+    values = zip(*[bars[column].values for column in columns])
+    for timestamp, row in zip(bars.index, values):
+        bar = dict(zip(columns, row))
+        signal = strategy.on_bar(bar)
+        yield timestamp, signal, portfolio.on_bar(bar, signal)
+
+
+if __name__ == "__main__":
+    # Replay a synthetic random walk through the streaming interface and
+    # check it against the batch run bar for bar
+    n_bars = 200000
+    rng = np.random.default_rng(7)
+    bars = pd.DataFrame({'Close': 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.001, n_bars)))},
+                        index=pd.date_range('2010-01-01', periods=n_bars, freq='min'))
+
+    mac = MovingAverageCrossStrategy('SYN', bars, short_window=50, long_window=200)
+    batch = MarketOnClosePortfolio('SYN', bars, mac.get_signals()).generate_portfolio()
+
+    strategy = MovingAverageCrossStrategy('SYN', None, short_window=50, long_window=200)
+    portfolio = MarketOnClosePortfolio('SYN', None, None)
+    t0 = time.perf_counter()
+    totals = [row['total'] for timestamp, signal, row in replay(strategy, portfolio, bars)]
+    elapsed = time.perf_counter() - t0
+
+    print('%.2f us per bar' % (elapsed / n_bars * 1e6))
+    print('max equity difference: %g' % np.max(np.abs(np.array(totals) - batch['total'].values)))
@@ -0,0 +1,120 @@
+# sweep.py
+
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicators import sma_matrix
+from portfolio_engine import all_in_portfolio
+
+
+def crossover_orders(short_mavg, long_mavg, short_window, first_bar=0):
+    """Batched version of the MovingAverageCrossStrategy signal logic.
+
+    Requires:
+    short_mavg - A (bars x configs) block of short moving averages.
+    long_mavg - A (bars x configs) block of long moving averages.
+    short_window - The short window of each config column, no signal
+        is generated before that many bars have passed.
+    first_bar - Position of the first row in the full history, when
+        the block is a slice of it.
+
+    Returns the (signal, positions) blocks, positions holding the
+    trading orders (1, 0, -1) with zero on the first bar."""
+    signal = np.where(short_mavg > long_mavg, 1.0, 0.0)
+    bar = first_bar + np.arange(len(signal))[:, np.newaxis]
+    signal[bar < np.asarray(short_window)] = 0.0
+    positions = np.zeros_like(signal)
+    positions[1:] = np.diff(signal, axis=0)
+    return signal, positions
+
+
+def evaluate_pairs(close, means, windows, pairs, initial_capital=100000.0,
+                   first_bar=0, max_cells=2 ** 22):
+    """Backtests (short_window, long_window) pairs from precomputed
+    moving averages, in (bars x pairs) blocks of at most max_cells
+    elements.
+
+    Requires:
+    close - An array of close prices.
+    means - The (bars x windows) matrix of moving averages of close,
+        rows aligned with close.
+    windows - The window of every column of means.
+    pairs - An (n x 2) array of (short_window, long_window) pairs.
+    initial_capital - The amount in cash at the start of each portfolio.
+    first_bar - Position of close[0] in the full history, when close
+        and means are a slice of it.
+
+    Returns the arrays of final equity and trade count per pair."""
+    column = dict((window, j) for j, window in enumerate(windows))
+    final_equity = np.empty(len(pairs))
+    trades = np.empty(len(pairs), dtype=np.int64)
+
+    step = max(1, max_cells // max(len(close), 1))
+    for start in range(0, len(pairs), step):
+        chunk = pairs[start:start + step]
+        short_cols = [column[s] for s in chunk[:, 0]]
+        long_cols = [column[l] for l in chunk[:, 1]]
+        signal, positions = crossover_orders(means[:, short_cols], means[:, long_cols],
+                                             chunk[:, 0], first_bar)
+        portfolio = all_in_portfolio(close, positions, initial_capital)
+        final_equity[start:start + step] = portfolio['total'][-1]
+        trades[start:start + step] = np.count_nonzero(positions, axis=0)
+    return final_equity, trades
+
+
+def window_pairs(short_windows, long_windows):
+    """Returns the (n x 2) array of grid pairs with short below long."""
+    return np.array([(s, l) for s in short_windows for l in long_windows if s < l],
+                    dtype=np.int64).reshape(-1, 2)
+
+
+def sweep_moving_average_cross(bars, short_windows, long_windows,
+                               initial_capital=100000.0, max_cells=2 ** 22):
+    """Evaluates MovingAverageCrossStrategy with MarketOnClosePortfolio
+    for every (short_window, long_window) pair of the grid.
+
+    Each moving average is computed once and shared by all pairs, and
+    the pairs are backtested together in (bars x pairs) blocks of at
+    most max_cells elements to bound memory.
+
+    Requires:
+    bars - A DataFrame of bars, or an array of close prices.
+    short_windows - Lookback periods for the short moving average.
+    long_windows - Lookback periods for the long moving average.
+    initial_capital - The amount in cash at the start of each portfolio.
+
+    Returns a DataFrame with one row per pair, holding its final equity,
+    total return and number of trades. Pairs with short_window not
+    below long_window are skipped."""
+    close = np.asarray(bars['Close'] if isinstance(bars, pd.DataFrame) else bars,
+                       dtype=np.float64)
+    windows = sorted(set(short_windows) | set(long_windows))
+    means = sma_matrix(close, windows)
+    pairs = window_pairs(short_windows, long_windows)
+    final_equity, trades = evaluate_pairs(close, means, windows, pairs, initial_capital,
+                                          max_cells=max_cells)
+
+    results = pd.DataFrame({'short_window': pairs[:, 0],
+                            'long_window': pairs[:, 1],
+                            'final_equity': final_equity,
+                            'total_return': final_equity / float(initial_capital) - 1.0,
+                            'trades': trades})
+    return results
+
+
+if __name__ == "__main__":
+    # Sweep a 200 x 200 grid of windows over ten years of daily bars
+    from bar_store import BarStore
+
+    symbol = 'AAPL'
+    start_date = datetime.datetime(2010, 1, 1)
+    end_date = datetime.datetime(2020, 1, 1)
+    bars = BarStore().get(symbol, 'yahoo', start_date, end_date)
+
+    t0 = time.perf_counter()
+    results = sweep_moving_average_cross(bars, range(1, 201), range(2, 402, 2))
+    print('%d pairs in %.2fs' % (len(results), time.perf_counter() - t0))
+    print(results.sort_values('final_equity', ascending=False).head(10))
@@ -0,0 +1,339 @@
+# sweep_runner.py
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BarStore
+from indicators import sma_matrix
+from sweep import evaluate_pairs, window_pairs
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    short_window INTEGER NOT NULL,
+    long_window INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    UNIQUE (symbol, short_window, long_window));
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_until);
+CREATE TABLE IF NOT EXISTS results (
+    task_id INTEGER PRIMARY KEY REFERENCES tasks (id),
+    symbol TEXT NOT NULL,
+    short_window INTEGER NOT NULL,
+    long_window INTEGER NOT NULL,
+    final_equity REAL NOT NULL,
+    total_return REAL NOT NULL,
+    trades INTEGER NOT NULL,
+    worker TEXT,
+    finished REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS results_symbol ON results (symbol, total_return);
+CREATE INDEX IF NOT EXISTS results_return ON results (total_return);
+"""
+
+
+class SweepQueue(object):
+    """A durable queue of (symbol, short_window, long_window) tasks of a
+    MovingAverageCrossStrategy sweep, with their results, in one SQLite
+    file.
+
+    Workers claim batches of tasks under a lease. A task whose worker
+    died is handed out again once its lease expires, finished tasks are
+    never rerun, so an interrupted sweep resumes where it stopped. Any
+    number of processes, or machines sharing the file over a file
+    system with working locks, may work on the same queue.
+
+    Requires:
+    path - The SQLite database file, created if missing."""
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=60.0, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # Take the write lock up front, so concurrent claims never see
+        # the same tasks as runnable
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.db
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+    def set_config(self, **config):
+        """Stores the settings every worker needs, e.g. the data source
+        and date range of the bars."""
+        with self._transaction():
+            self.db.executemany('INSERT OR REPLACE INTO config VALUES (?, ?)',
+                                [(key, json.dumps(value)) for key, value in config.items()])
+
+    def config(self):
+        return dict((key, json.loads(value)) for key, value in
+                    self.db.execute('SELECT key, value FROM config'))
+
+    def add_tasks(self, symbols, short_windows, long_windows):
+        """Queues every grid pair (short below long) of every symbol.
+        Tasks already queued are left as they are, so adding the same
+        sweep again is a no-op.
+
+        Returns the number of new tasks."""
+        pairs = window_pairs(short_windows, long_windows).tolist()
+        before = self.db.total_changes
+        with self._transaction():
+            for symbol in symbols:
+                self.db.executemany('INSERT OR IGNORE INTO tasks (symbol, short_window, long_window) '
+                                    'VALUES (?, ?, ?)', [(symbol, s, l) for s, l in pairs])
+        return self.db.total_changes - before
+
+    def claim(self, worker, batch=256, lease=600.0):
+        """Leases up to batch runnable tasks to worker, all of the same
+        symbol so they share its bars and moving averages. Pending tasks
+        past their retry delay and tasks whose lease has expired are
+        runnable.
+
+        Returns a list of (task id, symbol, short_window, long_window)."""
+        now = time.time()
+        tasks = []
+        runnable = "(status IN ('pending', 'running') AND COALESCE(lease_until, 0) <= ?)"
+        with self._transaction():
+            row = self.db.execute('SELECT symbol FROM tasks WHERE ' + runnable + ' LIMIT 1', (now,)).fetchone()
+            if row is not None:
+                tasks = self.db.execute('SELECT id, symbol, short_window, long_window FROM tasks '
+                                        'WHERE symbol = ? AND ' + runnable + ' LIMIT ?',
+                                        (row[0], now, batch)).fetchall()
+                self.db.executemany("UPDATE tasks SET status = 'running', worker = ?, lease_until = ?, "
+                                    "attempts = attempts + 1 WHERE id = ?",
+                                    [(worker, now + lease, task[0]) for task in tasks])
+        return tasks
+
+    def next_runnable(self):
+        """Returns the time (as time.time()) at which the next task not
+        yet done or failed becomes runnable, when its lease or retry
+        delay runs out, or None when no such task is left."""
+        row = self.db.execute("SELECT COUNT(*), MIN(COALESCE(lease_until, 0)) FROM tasks "
+                              "WHERE status IN ('pending', 'running')").fetchone()
+        return row[1] if row[0] else None
+
+    def complete(self, worker, tasks, final_equity, trades, initial_capital):
+        """Stores the results of claimed tasks and marks them done, in
+        one transaction."""
+        now = time.time()
+        rows = [(task[0], task[1], task[2], task[3], float(equity),
+                 float(equity) / initial_capital - 1.0, int(count), worker, now)
+                for task, equity, count in zip(tasks, final_equity, trades)]
+        with self._transaction():
+            self.db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.db.executemany("UPDATE tasks SET status = 'done', lease_until = NULL WHERE id = ?",
+                                [(task[0],) for task in tasks])
+
+    def fail(self, tasks, error, max_attempts=3, backoff=30.0):
+        """Returns claimed tasks to the queue after an error, or marks
+        them failed once they have been tried max_attempts times. A
+        returned task is only runnable again after backoff,
+        2 * backoff, 4 * backoff, ... seconds for its first, second,
+        third, ... attempt, so a failing data source is not hammered."""
+        now = time.time()
+        with self._transaction():
+            self.db.executemany("UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' "
+                                "ELSE 'pending' END, error = ?, "
+                                "lease_until = CASE WHEN attempts >= ? THEN NULL "
+                                "ELSE ? * (1 << (attempts - 1)) + ? END WHERE id = ?",
+                                [(max_attempts, error, max_attempts, backoff, now, task[0])
+                                 for task in tasks])
+
+    def progress(self):
+        """Returns the number of tasks per status."""
+        return dict(self.db.execute('SELECT status, COUNT(*) FROM tasks GROUP BY status'))
+
+    def results(self, symbol=None, top=None):
+        """Returns the stored results as a DataFrame, best total return
+        first, optionally only those of symbol and only the top rows."""
+        query = 'SELECT symbol, short_window, long_window, final_equity, total_return, trades FROM results'
+        params = []
+        if symbol is not None:
+            query += ' WHERE symbol = ?'
+            params.append(symbol)
+        query += ' ORDER BY total_return DESC'
+        if top is not None:
+            query += ' LIMIT ?'
+            params.append(int(top))
+        return pd.read_sql_query(query, self.db, params=params)
+
+
+def run_worker(path, worker=None, batch=256, lease=600.0, poll=5.0, backoff=30.0):
+    """Works through the queue in path until every task is done or
+    failed.
+
+    Bars are read through the BarStore configured on the queue, and the
+    moving averages of a symbol are kept while consecutive batches
+    belong to it. While the only tasks left are leased by other workers
+    or wait to be retried, the worker checks back every poll seconds,
+    or when the first lease or retry delay runs out if that is sooner,
+    and takes over the tasks of a worker that died. Failed batches are
+    retried after backoff seconds, see SweepQueue.fail.
+
+    Returns the number of tasks this worker completed."""
+    worker = worker or '%s:%d' % (socket.gethostname(), os.getpid())
+    queue = SweepQueue(path)
+    config = queue.config()
+    store = BarStore(config.get('store'))
+    initial_capital = float(config.get('initial_capital', 100000.0))
+    completed = 0
+    symbol = close = None
+    means = {}
+    try:
+        while True:
+            tasks = queue.claim(worker, batch, lease)
+            if not tasks:
+                wake = queue.next_runnable()
+                if wake is None:
+                    return completed
+                time.sleep(min(max(wake - time.time(), 0.0), poll))
+                continue
+            try:
+                if tasks[0][1] != symbol:
+                    symbol = tasks[0][1]
+                    bars = store.get(symbol, config.get('source', 'yahoo'), config.get('start'),
+                                     config.get('end'), config.get('frequency', 'daily'))
+                    close = np.asarray(bars['Close'], dtype=np.float64)
+                    means = {}
+                pairs = np.array([task[2:] for task in tasks], dtype=np.int64)
+                missing = sorted(set(pairs.ravel()) - set(means))
+                if missing:
+                    means.update(zip(missing, sma_matrix(close, missing).T))
+                windows = sorted(set(pairs.ravel()))
+                final_equity, trades = evaluate_pairs(close, np.column_stack([means[w] for w in windows]),
+                                                      windows, pairs, initial_capital)
+            except Exception as error:
+                symbol = None
+                queue.fail(tasks, repr(error), backoff=backoff)
+                continue
+            queue.complete(worker, tasks, final_equity, trades, initial_capital)
+            completed += len(tasks)
+    finally:
+        queue.close()
+
+
+def run_sweep(path, symbols, short_windows, long_windows, processes=None, batch=256,
+              lease=600.0, **config):
+    """Queues a MovingAverageCrossStrategy sweep in path and works it
+    off with local worker processes. Rerunning it after an interruption
+    only runs the tasks that were not finished, and workers on other
+    machines may join with 'python sweep_runner.py work <path>'.
+
+    Requires:
+    path - The SQLite queue file.
+    symbols - The symbols to sweep.
+    short_windows - Lookback periods for the short moving average.
+    long_windows - Lookback periods for the long moving average.
+    processes - Number of worker processes, None for one per core and
+        1 to work in this process.
+    batch - Tasks claimed at once by a worker.
+    lease - Seconds before an unfinished claim is handed out again.
+    config - Settings for the workers: store, source, start, end,
+        frequency and initial_capital.
+
+    Returns the results DataFrame, best total return first."""
+    queue = SweepQueue(path)
+    try:
+        if config:
+            queue.set_config(**config)
+        queue.add_tasks(symbols, short_windows, long_windows)
+        config = queue.config()
+    finally:
+        queue.close()
+
+    # Cache every symbol's bars once up front, rather than have workers
+    # starting on the same symbol all fetch and write it at once
+    store = BarStore(config.get('store'))
+    for symbol in sorted(set(symbols)):
+        try:
+            store.get(symbol, config.get('source', 'yahoo'), config.get('start'),
+                      config.get('end'), config.get('frequency', 'daily'))
+        except Exception:
+            # Left to the workers, which record the error on its tasks
+            pass
+
+    processes = processes or multiprocessing.cpu_count()
+    if processes == 1:
+        run_worker(path, batch=batch, lease=lease)
+    else:
+        workers = [multiprocessing.Process(target=run_worker, args=(path, None, batch, lease))
+                   for _ in range(processes)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+
+    queue = SweepQueue(path)
+    try:
+        return queue.results()
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Resumable MovingAverageCrossStrategy sweeps '
+                                                 'on a SQLite work queue.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='queue a sweep')
+    add.add_argument('path')
+    add.add_argument('--symbols', nargs='+', required=True)
+    add.add_argument('--short', type=int, nargs=3, metavar=('START', 'STOP', 'STEP'), required=True,
+                     help='range of short windows')
+    add.add_argument('--long', type=int, nargs=3, metavar=('START', 'STOP', 'STEP'), required=True,
+                     help='range of long windows')
+    add.add_argument('--source', default='yahoo')
+    add.add_argument('--start')
+    add.add_argument('--end')
+    add.add_argument('--store', help='BarStore root directory')
+    add.add_argument('--initial-capital', type=float, default=100000.0)
+    work = commands.add_parser('work', help='work off queued tasks')
+    work.add_argument('path')
+    work.add_argument('--processes', type=int, default=1)
+    work.add_argument('--batch', type=int, default=256)
+    status = commands.add_parser('status', help='show progress and the best results')
+    status.add_argument('path')
+    status.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        queue = SweepQueue(args.path)
+        queue.set_config(source=args.source, start=args.start, end=args.end, store=args.store,
+                         initial_capital=args.initial_capital)
+        print('%d tasks added' % queue.add_tasks(args.symbols, range(*args.short), range(*args.long)))
+    elif args.command == 'work':
+        t0 = time.perf_counter()
+        workers = [multiprocessing.Process(target=run_worker, args=(args.path, None, args.batch))
+                   for _ in range(args.processes)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        print('done in %.2fs' % (time.perf_counter() - t0))
+    else:
+        queue = SweepQueue(args.path)
+        print(queue.progress())
+        print(queue.results(top=args.top))
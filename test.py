@@ -1,13 +1,26 @@
-import pandas_datareader as pdr
 import datetime
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+
+from bar_store import BarStore
+from indicator_cache import moving_average
+from report import headless, new_figure, render_report, thin
 
 pd.set_option('display.max_colwidth', -1)  # or 199
 
 def plot_close(bars, symbol):
     close = bars['Close']
+    if headless():
+        # No display, draw the thinned closes to an image instead
+        fig = new_figure()
+        ax = fig.add_subplot(111, title=symbol)
+        line = thin(close, 2000)
+        ax.plot(line.index, line.values)
+        fig.savefig('%s_close.png' % symbol)
+        return
+
+    import matplotlib.pyplot as plt
+
     close.plot(title=symbol)
     plt.show()
 
@@ -20,14 +33,14 @@ if __name__ == "__main__":
     end_date = datetime.datetime(2020, 1, 1)
     initial_capital = 50000
 
-    bars = pdr.DataReader(symbol, "yahoo", start_date, end_date)
+    bars = BarStore().get(symbol, 'yahoo', start_date, end_date)
     # plot_close(bars, symbol)
 
     signal = pd.DataFrame(index=bars.index)
     signal['signal'] = 0.0
     signal['Close'] = bars['Close']
-    signal['short_mavg'] = bars['Close'].rolling(window=short_window, min_periods=1).mean()
-    signal['long_mavg'] = bars['Close'].rolling(window=long_window, min_periods=1).mean()
+    signal['short_mavg'] = moving_average(bars['Close'], short_window)
+    signal['long_mavg'] = moving_average(bars['Close'], long_window)
 
     signal['signal'][short_window:] = \
         np.where(signal['short_mavg'][short_window:] > signal['long_mavg'][short_window:], 1, 0)
@@ -43,6 +56,12 @@ if __name__ == "__main__":
     portfolio['total'] = portfolio['holdings'] + portfolio['cash']
     portfolio['returns'] = portfolio['total'].pct_change().fillna(0.0)
 
+    if headless():
+        render_report('%s.png' % symbol, bars, signal, portfolio, title=symbol)
+        raise SystemExit
+
+    import matplotlib.pyplot as plt
+
     fig = plt.figure()
     fig.patch.set_facecolor('white')
     # ax1 = fig.add_subplot(221, ylabel='Price in $')  # first graph in a 2 x 2 grid
@@ -0,0 +1,67 @@
+# reference.py
+
+"""Straightforward reimplementations of the original strategy and
+portfolio logic, which the fast paths are checked against."""
+
+import numpy as np
+import pandas as pd
+
+from benchmark import synthetic_bars
+
+# Window orders the crossover checks run for, including a short window
+# above the long one and equal windows
+WINDOWS = [(50, 200), (200, 50), (5, 5), (1, 30)]
+
+
+def reference_signals(bars, short_window, long_window):
+    """The original MovingAverageCrossStrategy.generate_signals."""
+    signals = pd.DataFrame(index=bars.index)
+    signals['signal'] = 0.0
+    signals['short_mavg'] = bars['Close'].rolling(window=short_window, min_periods=1).mean()
+    signals['long_mavg'] = bars['Close'].rolling(window=long_window, min_periods=1).mean()
+    signal = signals['signal'].values.copy()
+    signal[short_window:] = np.where(
+        signals['short_mavg'].values[short_window:] > signals['long_mavg'].values[short_window:], 1.0, 0.0)
+    signals['signal'] = signal
+    signals['positions'] = signals['signal'].diff()
+    return signals
+
+
+def reference_portfolio(close, orders, initial_capital=100000.0):
+    """The original all-in MarketOnClosePortfolio accounting, stepped
+    through every bar: a buy spends all cash on whole shares at the
+    close, a sell liquidates the holding.
+
+    Returns the (positions, cash, total) arrays."""
+    close = np.asarray(close, dtype=np.float64)
+    orders = np.nan_to_num(np.asarray(orders, dtype=np.float64))
+    current_position = 0.0
+    current_capital = float(initial_capital)
+    positions = np.empty(len(close))
+    cash = np.empty(len(close))
+    for i, (price, order) in enumerate(zip(close.tolist(), orders.tolist())):
+        if order == 1:
+            shares_to_buy = np.floor(current_capital / price)
+            current_capital -= shares_to_buy * price
+            current_position = shares_to_buy
+        elif order == -1:
+            current_capital += current_position * price
+            current_position = 0.0
+        positions[i] = current_position
+        cash[i] = current_capital
+    return positions, cash, positions * close + cash
+
+
+def plateau_bars(n_bars=3000, seed=7, length=120):
+    """Synthetic daily bars whose closes are held flat for length bars
+    around each point where their running sum crosses a power of two,
+    the flat runs on which prefix-sum moving averages round differently
+    from one window to the next."""
+    bars = synthetic_bars(n_bars, seed=seed, freq='D', volatility=0.01)
+    close = bars['Close'].values.copy()
+    for power in range(1, 64):
+        bar = np.searchsorted(np.cumsum(close), 2.0 ** power)
+        if length < bar < n_bars - length:
+            close[bar - length // 2:bar + length // 2] = close[bar - length // 2 - 1]
+    bars['Close'] = close
+    return bars
@@ -0,0 +1,150 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_store import BarStore
+from benchmark import synthetic_bars
+
+
+class FakeSource(object):
+    """A vendor serving fixed bars, recording every fetch."""
+
+    def __init__(self, bars):
+        self.bars = bars
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, symbol, start, end, frequency):
+        with self.lock:
+            self.calls.append((symbol, start, end))
+        index = self.bars.index
+        lo = 0 if start is None else index.searchsorted(start, side='left')
+        return self.bars.iloc[lo:index.searchsorted(end, side='right')]
+
+
+@pytest.fixture
+def bars():
+    bars = synthetic_bars(2000, seed=2, freq='D')
+    bars.index.name = 'Date'
+    return bars
+
+
+def test_round_trip(tmp_path, bars):
+    source = FakeSource(bars)
+    store = BarStore(str(tmp_path), {'fake': source})
+    loaded = store.get('SYM', 'fake', '2000-01-01', '2005-06-30')
+    expected = bars.loc['2000-01-01':'2005-06-30']
+    np.testing.assert_array_equal(loaded.values, expected.values)
+    assert list(loaded.columns) == list(expected.columns)
+    assert (loaded.index == expected.index).all() and loaded.index.name == 'Date'
+
+    # Cached bars are read back without another fetch, also by a new store
+    reread = BarStore(str(tmp_path), {'fake': source}).get('SYM', 'fake', '2001-01-01', '2002-01-01')
+    assert len(source.calls) == 1
+    np.testing.assert_array_equal(reread.values, bars.loc['2001-01-01':'2002-01-01'].values)
+
+    timestamps, columns = store.load_arrays('SYM', 'fake')
+    assert len(timestamps) == len(expected)
+    for name in bars.columns:
+        np.testing.assert_array_equal(columns[name], expected[name].values)
+
+
+def test_wider_range_fetches_only_the_missing_part(tmp_path, bars):
+    source = FakeSource(bars)
+    store = BarStore(str(tmp_path), {'fake': source})
+    store.get('SYM', 'fake', '2002-01-01', '2003-01-01')
+    loaded = store.get('SYM', 'fake', '2001-01-01', '2004-01-01')
+    assert [call[1:] for call in source.calls[1:]] == [
+        (pd.Timestamp('2001-01-01'), pd.Timestamp('2002-01-01')),
+        (pd.Timestamp('2003-01-01'), pd.Timestamp('2004-01-01'))]
+    np.testing.assert_array_equal(loaded.values, bars.loc['2001-01-01':'2004-01-01'].values)
+
+
+def test_concurrent_first_writes(tmp_path, bars):
+    source = FakeSource(bars)
+    errors = []
+
+    def load():
+        try:
+            BarStore(str(tmp_path), {'fake': source}).get('SYM', 'fake', end='2005-01-01')
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    loaded = BarStore(str(tmp_path)).get('SYM', 'fake', end='2005-01-01')
+    np.testing.assert_array_equal(loaded.values, bars.loc[:'2005-01-01'].values)
+    assert not list(tmp_path.rglob('*.tmp'))
+
+
+def versions(tmp_path):
+    return sorted(path.name for path in tmp_path.rglob('v*') if path.is_dir())
+
+
+def test_current_bar_is_returned_but_not_cached(tmp_path):
+    today = pd.Timestamp.today().normalize()
+    bars = synthetic_bars(300, seed=3, start=today - pd.Timedelta(days=299), freq='D')
+    source = FakeSource(bars)
+    store = BarStore(str(tmp_path), {'fake': source})
+    loaded = store.get('SYM', 'fake', bars.index[0])
+    np.testing.assert_array_equal(loaded.values, bars.values)
+    timestamps, _ = store.load_arrays('SYM', 'fake')
+    assert len(timestamps) == len(bars) - 1
+    written = versions(tmp_path)
+
+    # Today's bar is fetched again with its latest values, the cached
+    # bars are left as they are
+    bars.iloc[-1, bars.columns.get_loc('Close')] += 1.0
+    loaded = store.get('SYM', 'fake', bars.index[0])
+    np.testing.assert_array_equal(loaded.values, bars.values)
+    assert len(source.calls) == 2 and source.calls[1][1] < today
+    assert versions(tmp_path) == written
+
+
+def test_failed_write_keeps_the_cached_bars(tmp_path, bars, monkeypatch):
+    source = FakeSource(bars)
+    store = BarStore(str(tmp_path), {'fake': source})
+    store.get('SYM', 'fake', '2001-01-01', '2002-01-01')
+    written = versions(tmp_path)
+
+    saves = []
+    save = np.save
+
+    def failing_save(file, values):
+        saves.append(file)
+        if len(saves) == 3:
+            raise IOError('disk full')
+        save(file, values)
+
+    monkeypatch.setattr(np, 'save', failing_save)
+    with pytest.raises(IOError):
+        store.get('SYM', 'fake', '2001-01-01', '2003-01-01')
+    monkeypatch.setattr(np, 'save', save)
+    assert versions(tmp_path) == written
+
+    loaded = store.get('SYM', 'fake', '2001-01-01', '2002-01-01')
+    np.testing.assert_array_equal(loaded.values, bars.loc['2001-01-01':'2002-01-01'].values)
+    assert len(source.calls) == 2
+    loaded = store.get('SYM', 'fake', '2001-01-01', '2003-01-01')
+    np.testing.assert_array_equal(loaded.values, bars.loc['2001-01-01':'2003-01-01'].values)
+    # Only the last two versions are kept
+    store.get('SYM', 'fake', '2000-06-01', '2003-01-01')
+    assert len(versions(tmp_path)) == 2
+
+
+def test_files_not_matching_their_meta_are_fetched_again(tmp_path, bars):
+    source = FakeSource(bars)
+    store = BarStore(str(tmp_path), {'fake': source})
+    store.get('SYM', 'fake', '2001-01-01', '2002-01-01')
+    column = next(tmp_path.rglob('column_1.npy'))
+    np.save(str(column), np.load(str(column))[:-5])
+
+    loaded = store.get('SYM', 'fake', '2001-01-01', '2002-01-01')
+    np.testing.assert_array_equal(loaded.values, bars.loc['2001-01-01':'2002-01-01'].values)
+    assert len(source.calls) == 2
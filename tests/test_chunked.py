@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from benchmark import synthetic_bars
+from checkpoint import load_results, update_backtest
+from chunked import ChunkedBacktest
+from MarketOnClosePortfolio import MarketOnClosePortfolio
+from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+from reference import WINDOWS, plateau_bars
+
+BARS = {'gbm': lambda: synthetic_bars(3000, seed=11), 'plateaus': plateau_bars}
+
+
+def in_memory(bars, short_window, long_window):
+    mac = MovingAverageCrossStrategy('SYN', bars, short_window=short_window, long_window=long_window)
+    return MarketOnClosePortfolio('SYN', bars, mac.get_signals()).generate_portfolio()
+
+
+@pytest.mark.parametrize('kind', sorted(BARS))
+@pytest.mark.parametrize('short_window, long_window', WINDOWS + [(20, 50), (5, 100)])
+@pytest.mark.parametrize('chunk_size', [37, 1000, 5000])
+def test_chunked_matches_in_memory(kind, short_window, long_window, chunk_size):
+    bars = BARS[kind]()
+    expected = in_memory(bars, short_window, long_window)
+
+    backtest = ChunkedBacktest(short_window, long_window)
+    close = bars['Close'].values
+    totals = [backtest.process(close[start:start + chunk_size])['total']
+              for start in range(0, len(close), chunk_size)]
+    np.testing.assert_array_equal(np.concatenate(totals), expected['total'].values)
+
+
+@pytest.mark.parametrize('kind', sorted(BARS))
+@pytest.mark.parametrize('short_window, long_window', WINDOWS + [(20, 50), (5, 100)])
+def test_checkpointed_updates_match_in_memory(tmp_path, kind, short_window, long_window):
+    bars = BARS[kind]()
+    # 2818 resumes near the end of a flat run of the plateau bars
+    for stop in (300, 1100, 2818, 3000):
+        update_backtest(str(tmp_path), bars.iloc[:stop], short_window, long_window)
+    expected = in_memory(bars, short_window, long_window)
+    np.testing.assert_array_equal(load_results(str(tmp_path))['total'].values, expected['total'].values)
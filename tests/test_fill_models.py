@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from benchmark import synthetic_bars
+from fill_models import FillModel, evaluate_fill_models
+from MarketOnClosePortfolio import MarketOnClosePortfolio
+from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+from random_forcast import MarketOnOpenPortfolio, RandomForecastingStrategy
+
+MODELS = [FillModel('close'),
+          FillModel('next_open', 'next_open', slippage=0.01, commission=1.0),
+          FillModel('vwap', 'vwap', slippage_bps=5.0, commission_bps=10.0),
+          FillModel('costly', 'close', slippage=0.02, slippage_bps=2.0, commission=5.0, commission_bps=3.0)]
+
+
+@pytest.fixture(scope='module')
+def bars():
+    return synthetic_bars(2000, seed=13, freq='D', volatility=0.01)
+
+
+def all_in_loop(bars, signal, model, initial_capital=100000.0):
+    """Bar by bar all-in accounting of one fill model, the reference of
+    the all_in sizing."""
+    close = bars['Close'].values
+    base = {'close': close, 'open': bars['Open'].values, 'next_open': bars['Open'].values,
+            'vwap': (bars['High'].values + bars['Low'].values + close) / 3.0}[model.price]
+    long = np.nan_to_num(np.asarray(signal, dtype=np.float64)) > 0
+    if model.price == 'next_open':
+        long = np.concatenate(([False], long[:-1]))
+    shares, cash, totals = 0.0, initial_capital, []
+    for i in range(len(close)):
+        order = float(long[i]) - float(long[i - 1]) if i else float(long[i])
+        fill = base[i] + np.sign(order) * (model.slippage + base[i] * model.slippage_bps / 1e4)
+        if order > 0:
+            cash -= model.commission
+            shares = np.floor(cash / (fill * (1.0 + model.commission_bps / 1e4)))
+            cash -= shares * fill * (1.0 + model.commission_bps / 1e4)
+        elif order < 0:
+            cash += shares * fill * (1.0 - model.commission_bps / 1e4)
+            cash -= model.commission
+            shares = 0.0
+        totals.append(shares * close[i] + cash)
+    return np.array(totals)
+
+
+def test_same_open_without_costs_matches_market_on_open(bars):
+    np.random.seed(3)
+    signals = RandomForecastingStrategy('SYN', bars).generate_signals()
+    portfolio = MarketOnOpenPortfolio('SYN', bars, signals)
+    expected = portfolio.backtest_portfolio()
+    result = evaluate_fill_models(bars, portfolio.generate_positions(),
+                                  [FillModel('open', 'open')], mark='open')['open']
+    for name in ('holdings', 'cash', 'total', 'returns'):
+        np.testing.assert_array_equal(result[name].values, expected[name].values)
+
+
+def test_all_in_at_close_without_costs_matches_market_on_close(bars):
+    signals = MovingAverageCrossStrategy('SYN', bars, 20, 100).get_signals()
+    expected = MarketOnClosePortfolio('SYN', bars, signals).generate_portfolio()
+    result = evaluate_fill_models(bars, signals['signal'], [FillModel('close')], sizing='all_in')['close']
+    for name in ('positions', 'cash', 'total'):
+        np.testing.assert_array_equal(result[name].values, expected[name].values)
+
+
+def test_all_in_models_match_loop(bars):
+    signals = MovingAverageCrossStrategy('SYN', bars, 10, 50).get_signals()
+    result = evaluate_fill_models(bars, signals['signal'], MODELS, sizing='all_in')
+    for model in MODELS:
+        np.testing.assert_allclose(result[model.name]['total'].values,
+                                   all_in_loop(bars, signals['signal'], model), rtol=1e-12)
+    # Costs only ever take away from the cost-free run
+    finals = result.xs('total', axis=1, level=1).iloc[-1]
+    assert finals['costly'] < finals['close']
+
+
+def test_returns_of_an_emptied_account_are_not_warnings(bars):
+    positions = np.zeros(len(bars))
+    with np.errstate(all='raise'):
+        result = evaluate_fill_models(bars, positions, [FillModel('close')], initial_capital=0.0)
+    assert np.isnan(result['close']['returns'].values).all()
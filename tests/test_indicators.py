@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import synthetic_bars
+from indicators import RollingEma, RollingMean, ema_matrix, rolling_mean, rolling_std, sma_matrix, var_matrix
+from kernels import set_backend
+
+WINDOWS = [2, 3, 5, 20, 200]
+
+
+def exact_var(close, window, ddof=1):
+    # Two-pass variance of every full window in extended precision
+    values = np.lib.stride_tricks.sliding_window_view(close.astype(np.longdouble), window)
+    deviations = values - values.mean(axis=1, keepdims=True)
+    return ((deviations * deviations).sum(axis=1) / (window - ddof)).astype(np.float64)
+
+
+def best_time(func, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+    return min(timings)
+
+
+def test_rolling_mean_matches_pandas():
+    close = synthetic_bars(5000, seed=1)['Close'].values
+    for window in WINDOWS:
+        expected = pd.Series(close).rolling(window, min_periods=1).mean().values
+        np.testing.assert_allclose(rolling_mean(close, window), expected, rtol=1e-12)
+    np.testing.assert_array_equal(sma_matrix(close, WINDOWS)[:, 2], rolling_mean(close, 5))
+
+
+@pytest.mark.parametrize('ddof', [0, 1])
+def test_var_matrix_matches_pandas(ddof):
+    close = synthetic_bars(5000, seed=2, freq='D', volatility=0.02)['Close'].values
+    variances = var_matrix(close, WINDOWS, ddof)
+    for j, window in enumerate(WINDOWS):
+        # pandas' online update itself drifts by up to ~1e-6 on small windows
+        expected = pd.Series(close).rolling(window, min_periods=1).var(ddof=ddof).values
+        np.testing.assert_allclose(variances[:, j], expected, rtol=1e-5)
+        np.testing.assert_allclose(variances[window - 1:, j], exact_var(close, window, ddof), rtol=1e-13)
+    std = pd.Series(close).rolling(3, min_periods=1).std(ddof=ddof).values
+    np.testing.assert_allclose(rolling_std(close, 3, ddof), std, rtol=1e-5)
+
+
+def test_var_matrix_small_windows_over_long_history():
+    # Minute bars have variances far below the rounding of their prices'
+    # sums, which prefix-sum formulas lose entirely
+    close = synthetic_bars(200000, seed=3)['Close'].values
+    variances = var_matrix(close, [2, 3, 5])
+    for j, window in enumerate([2, 3, 5]):
+        expected = exact_var(close, window)
+        actual = variances[window - 1:, j]
+        assert np.all((actual > 0) == (expected > 0))
+        np.testing.assert_allclose(actual, expected, rtol=1e-12)
+
+
+def test_var_matrix_of_constant_windows_is_zero():
+    close = np.array([1.0, 0.1, 0.1, 0.1, 0.1, 2.0])
+    variances = var_matrix(close, [1, 3])
+    assert np.isnan(variances[:, 0]).all()
+    np.testing.assert_array_equal(variances[3:5, 1], 0.0)
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'numba'])
+def test_var_matrix_backends_identical(backend):
+    pytest.importorskip('numba')
+    close = synthetic_bars(3000, seed=4)['Close'].values
+    set_backend('numpy')
+    expected = var_matrix(close, WINDOWS)
+    set_backend(backend)
+    try:
+        np.testing.assert_array_equal(var_matrix(close, WINDOWS), expected)
+    finally:
+        set_backend('auto')
+
+
+def test_ema_matrix_matches_pandas_and_rolling_ema():
+    close = synthetic_bars(3000, seed=5)['Close'].values
+    means = ema_matrix(close, WINDOWS)
+    for j, span in enumerate(WINDOWS):
+        expected = pd.Series(close).ewm(span=span, adjust=False).mean().values
+        np.testing.assert_allclose(means[:, j], expected, rtol=1e-12)
+        ema = RollingEma(span)
+        np.testing.assert_array_equal([ema.update(value) for value in close], means[:, j])
+
+
+def test_rolling_mean_streaming_matches_batch():
+    close = synthetic_bars(3000, seed=6)['Close'].values
+    for window in WINDOWS:
+        mean = RollingMean(window)
+        np.testing.assert_allclose([mean.update(value) for value in close], rolling_mean(close, window),
+                                   rtol=1e-12)
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'numba'])
+def test_many_windows_cost_one_pass_each(backend):
+    if backend == 'numba':
+        pytest.importorskip('numba')
+    close = synthetic_bars(50000, seed=7)['Close'].values
+    series = pd.Series(close)
+    windows = list(range(2, 202, 2))
+    set_backend(backend)
+    try:
+        # Compiles the numba kernels outside the timings
+        var_matrix(close[:500], windows)
+        ema_matrix(close[:500], windows)
+
+        variances = best_time(lambda: var_matrix(close, windows))
+        # Long windows cost no more than the shortest, as each is one pass
+        assert variances < 2.0 * best_time(lambda: var_matrix(close, [2] * len(windows)))
+        assert variances < 3.0 * best_time(lambda: [series.rolling(window, min_periods=1).var()
+                                                    for window in windows])
+        assert best_time(lambda: ema_matrix(close, windows)) < \
+            3.0 * best_time(lambda: [series.ewm(span=span, adjust=False).mean() for span in windows])
+    finally:
+        set_backend('auto')
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import kernels
+from kernels import all_in_orders, ema_recurrence, rolling_var, set_backend, stop_loss_signal
+
+BACKENDS = ['numpy', pytest.param('numba', marks=pytest.mark.skipif(not kernels.numba_available(),
+                                                                   reason='numba is not installed'))]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    set_backend(request.param)
+    yield request.param
+    set_backend('auto')
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    rng = np.random.default_rng(3)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, 3000)))
+    signal = (np.sin(np.arange(3000) / 40.0) > 0).astype(np.float64)
+    orders = np.diff(signal, prepend=0.0)
+    rows = np.flatnonzero(orders)
+    configs = np.repeat(orders[rows, np.newaxis], 8, axis=1) * (rng.random((len(rows), 8)) > 0.2)
+    return close, signal, rows, orders[rows], configs
+
+
+# The loops, called directly, are the plain Python reference of every kernel
+
+def test_all_in_orders_match_loop(backend, inputs):
+    close, signal, rows, orders, configs = inputs
+    prices = close[rows, np.newaxis]
+    for block in (orders[:, np.newaxis], configs):
+        for fees in (np.zeros(block.shape), np.full(block.shape, 4.5)):
+            shares, cash = all_in_orders(block, prices, 0.0, 100000.0, fees)
+            expected_shares, expected_cash = kernels._all_in_loop(block, prices, fees, 0.0, 100000.0)
+            np.testing.assert_array_equal(shares, expected_shares)
+            np.testing.assert_array_equal(cash, expected_cash)
+
+
+def test_stop_loss_signal_matches_loop(backend, inputs):
+    close, signal = inputs[:2]
+    for stop in (0.01, 0.05, 0.5):
+        np.testing.assert_array_equal(stop_loss_signal(close, signal, stop),
+                                      kernels._stop_loss_loop(close, signal, stop))
+
+
+def test_ema_recurrence_matches_loop(backend, inputs):
+    close = inputs[0]
+    alphas = 2.0 / (np.array([2.0, 5.0, 50.0, 400.0]) + 1.0)
+    np.testing.assert_array_equal(ema_recurrence(close, alphas), kernels._ema_loop(close, alphas))
+
+
+def test_rolling_var_matches_loop(backend, inputs):
+    close = inputs[0][:500]
+    windows = np.array([1, 2, 3, 20, 100])
+    for ddof in (0, 1):
+        np.testing.assert_array_equal(rolling_var(close, windows, ddof),
+                                      kernels._rolling_var_loop(close, windows, ddof))
+
+
+def test_empty_inputs(backend):
+    empty = np.empty(0)
+    assert ema_recurrence(empty, np.array([0.5])).shape == (0, 1)
+    assert rolling_var(empty, [5]).shape == (0, 1)
+    assert stop_loss_signal(empty, empty, 0.05).shape == (0,)
+    shares, cash = all_in_orders(np.empty((0, 2)), np.empty((0, 1)))
+    np.testing.assert_array_equal(cash, [[100000.0, 100000.0]])
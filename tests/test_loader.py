@@ -0,0 +1,142 @@
+import http.server
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+import pandas as pd
+import pytest
+
+from benchmark import synthetic_bars
+from loader import RateLimiter, http_csv_source, load_symbols, retrying
+
+BARS = synthetic_bars(50, seed=4, freq='D')
+
+
+class BarHandler(http.server.BaseHTTPRequestHandler):
+    # '/SYM.csv' serves BARS, '/FLAKY.csv' fails with a 503 on the first
+    # two requests and '/UP.csv' answers with its query parameters. Every
+    # request path is recorded
+    requests = []
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        self.requests.append(url.path)
+        if url.path == '/FLAKY.csv' and self.requests.count(url.path) <= 2:
+            self.send_error(503)
+            return
+        if url.path in ('/SYM.csv', '/FLAKY.csv'):
+            body = BARS.to_csv().encode()
+        elif url.path == '/UP.csv':
+            body = pd.DataFrame(dict(urllib.parse.parse_qsl(url.query)), index=['2020-01-01']).to_csv().encode()
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    BarHandler.requests = []
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), BarHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d/' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_load_symbols_yields_every_symbol_with_bounded_concurrency():
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def load(symbol):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.01 * (hash(symbol) % 3))
+        with lock:
+            running[0] -= 1
+        if symbol.startswith('BAD'):
+            raise IOError(symbol)
+        return symbol.lower()
+
+    symbols = ['SYM%02d' % i for i in range(20)] + ['BAD1', 'BAD2']
+    results = list(load_symbols(symbols, load, max_workers=4))
+    assert sorted(symbol for symbol, _ in results) == sorted(symbols)
+    assert dict(results[:20]) == dict((symbol, symbol.lower()) for symbol in symbols[:20])
+    assert [symbol for symbol, error in results[20:]] in (['BAD1', 'BAD2'], ['BAD2', 'BAD1'])
+    assert all(isinstance(error, IOError) for _, error in results[20:])
+    assert running[1] <= 4
+
+
+def test_retrying_and_rate_limiter():
+    attempts = []
+
+    def flaky(symbol):
+        attempts.append(symbol)
+        if len(attempts) < 3:
+            raise ConnectionResetError('try again')
+        return symbol
+
+    assert retrying(flaky, retries=3, backoff=0.001)('SYM') == 'SYM'
+    assert len(attempts) == 3
+
+    def down(symbol):
+        attempts.append(symbol)
+        raise ConnectionRefusedError('down')
+
+    with pytest.raises(ConnectionRefusedError):
+        retrying(down, retries=1, backoff=0.001)('SYM')
+    assert len(attempts) == 5
+
+    limiter = RateLimiter(200.0)
+    t0 = time.monotonic()
+    for _ in range(5):
+        limiter.wait()
+    assert time.monotonic() - t0 >= 4 / 200.0 - 1e-3
+
+
+def test_http_csv_source_reads_bars(server):
+    fetch = http_csv_source(server)
+    bars = fetch('SYM', None, None, 'daily')
+    pd.testing.assert_frame_equal(bars, BARS, check_freq=False)
+    query = fetch('UP', '2020-01-01', '2021-01-01', 'daily')
+    assert query.iloc[0].to_dict() == {'start': '2020-01-01', 'end': '2021-01-01', 'frequency': 'daily'}
+
+
+def test_http_csv_source_retries_server_errors_only(server):
+    fetch = retrying(http_csv_source(server), retries=3, backoff=0.001)
+    pd.testing.assert_frame_equal(fetch('FLAKY', None, None, 'daily'), BARS, check_freq=False)
+    assert BarHandler.requests.count('/FLAKY.csv') == 3
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        fetch('MISSING', None, None, 'daily')
+    assert error.value.code == 404
+    assert BarHandler.requests.count('/MISSING.csv') == 1
+
+    # Refused connections are retried, then raised
+    attempts = []
+    refused = http_csv_source('http://127.0.0.1:%d' % find_closed_port())
+
+    def counted(*args):
+        attempts.append(args)
+        return refused(*args)
+
+    with pytest.raises(urllib.error.URLError):
+        retrying(counted, retries=2, backoff=0.001)('SYM', None, None, 'daily')
+    assert len(attempts) == 3
+
+
+def find_closed_port():
+    httpd = http.server.HTTPServer(('127.0.0.1', 0), BarHandler)
+    port = httpd.server_address[1]
+    httpd.server_close()
+    return port
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from metrics import performance_metrics
+
+PERIODS = 252
+
+
+def reference_metrics(equity, risk_free=0.0):
+    """The metrics of one equity curve, computed with plain pandas."""
+    equity = pd.Series(equity)
+    returns = equity.pct_change().iloc[1:]
+    excess = returns - risk_free / PERIODS
+    sortino_risk = np.sqrt((excess.clip(upper=0.0) ** 2).mean())
+    underwater = equity < equity.cummax()
+    with np.errstate(divide='ignore'):
+        sortino = excess.mean() / sortino_risk * np.sqrt(PERIODS)
+    return {'sharpe': excess.mean() / returns.std() * np.sqrt(PERIODS),
+            'sortino': sortino,
+            'cagr': (equity.iloc[-1] / equity.iloc[0]) ** (PERIODS / (len(equity) - 1.0)) - 1.0,
+            'max_drawdown': (1.0 - equity / equity.cummax()).max(),
+            'max_drawdown_duration': underwater.groupby((~underwater).cumsum()).sum().max()}
+
+
+@pytest.fixture(scope='module')
+def curves():
+    rng = np.random.default_rng(17)
+    returns = rng.normal(0.0003, 0.01, (1500, 6))
+    returns[:, 1] -= 0.001
+    # A curve that gains every bar never draws down
+    returns[:, 2] = np.abs(returns[:, 2])
+    return pd.DataFrame(100000.0 * np.cumprod(1.0 + returns, axis=0), columns=list('abcdef'))
+
+
+@pytest.mark.parametrize('risk_free', [0.0, 0.03])
+def test_metrics_match_pandas(curves, risk_free):
+    # Small blocks run the columns through several passes
+    for max_cells in (2 ** 24, 2000):
+        metrics = performance_metrics(curves, periods_per_year=PERIODS, risk_free=risk_free,
+                                      max_cells=max_cells)
+        assert list(metrics.index) == list(curves.columns)
+        for name in curves:
+            expected = reference_metrics(curves[name].values, risk_free)
+            for metric, value in expected.items():
+                assert metrics.loc[name, metric] == pytest.approx(value, rel=1e-9, abs=1e-12), (name, metric)
+
+
+def test_trades_and_turnover_need_positions(curves):
+    metrics = performance_metrics(curves)
+    assert metrics['trades'].isna().all() and metrics['turnover'].isna().all()
+
+    positions = np.zeros(curves.shape)
+    positions[100:400] = 100.0
+    positions[700:900] = 50.0
+    metrics = performance_metrics(curves, positions)
+    assert (metrics['trades'] == 4).all()
+    expected = (100.0 * 2 + 50.0 * 2) / np.abs(positions[:, 0]).mean() / ((len(curves) - 1) / 252.0)
+    np.testing.assert_allclose(metrics['turnover'], expected)
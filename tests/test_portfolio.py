@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import synthetic_bars
+from kernels import _stop_loss_loop
+from MarketOnClosePortfolio import MarketOnClosePortfolio
+from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+from portfolio_engine import all_in_portfolio
+from reference import WINDOWS, plateau_bars, reference_portfolio, reference_signals
+from sweep import sweep_moving_average_cross
+from universe import UniverseMovingAverageCrossStrategy, align_universe
+
+
+@pytest.fixture(scope='module', params=['gbm', 'plateaus'])
+def bars(request):
+    if request.param == 'plateaus':
+        return plateau_bars()
+    return synthetic_bars(3000, seed=21, freq='D', volatility=0.01)
+
+
+@pytest.mark.parametrize('short_window, long_window', WINDOWS)
+def test_signals_match_reference(bars, short_window, long_window):
+    signals = MovingAverageCrossStrategy('SYN', bars, short_window, long_window).get_signals()
+    expected = reference_signals(bars, short_window, long_window)
+    pd.testing.assert_frame_equal(signals[expected.columns], expected)
+
+
+@pytest.mark.parametrize('short_window, long_window', WINDOWS)
+def test_stop_loss_exits_reference_trades(bars, short_window, long_window):
+    signals = MovingAverageCrossStrategy('SYN', bars, short_window, long_window, stop_loss=0.03).get_signals()
+    expected = reference_signals(bars, short_window, long_window)['signal'].values
+    np.testing.assert_array_equal(signals['signal'].values,
+                                  _stop_loss_loop(bars['Close'].values, expected, 0.03))
+    np.testing.assert_array_equal(signals['positions'].values[1:], np.diff(signals['signal'].values))
+
+
+@pytest.mark.parametrize('stop_loss', [None, 0.03])
+@pytest.mark.parametrize('short_window, long_window', WINDOWS)
+def test_signal_arrays_match_signals(bars, short_window, long_window, stop_loss):
+    strategy = MovingAverageCrossStrategy('SYN', bars, short_window, long_window, stop_loss=stop_loss)
+    signals = strategy.get_signals()
+    arrays = strategy.generate_signal_arrays()
+    for name in ('signal', 'positions'):
+        np.testing.assert_array_equal(arrays[name], signals[name].values)
+    for name in ('short_mavg', 'long_mavg'):
+        np.testing.assert_allclose(arrays[name], signals[name].values, rtol=1e-12)
+
+
+@pytest.mark.parametrize('short_window, long_window', WINDOWS)
+def test_portfolio_matches_reference(bars, short_window, long_window):
+    signals = reference_signals(bars, short_window, long_window)
+    portfolio = MarketOnClosePortfolio('SYN', bars, signals).generate_portfolio()
+    positions, cash, total = reference_portfolio(bars['Close'].values, signals['positions'].values)
+    np.testing.assert_array_equal(portfolio['positions'].values, positions)
+    np.testing.assert_array_equal(portfolio['cash'].values, cash)
+    np.testing.assert_array_equal(portfolio['total'].values, total)
+
+    arrays = MarketOnClosePortfolio('SYN', bars, signals).generate_portfolio_arrays()
+    np.testing.assert_array_equal(arrays['total'], total)
+
+
+def test_all_in_portfolio_blocks_match_single_runs(bars):
+    close = bars['Close'].values
+    orders = np.column_stack([reference_signals(bars, s, l)['positions'].values for s, l in WINDOWS])
+    block = all_in_portfolio(close, orders)
+    for j in range(len(WINDOWS)):
+        np.testing.assert_array_equal(block['total'][:, j], reference_portfolio(close, orders[:, j])[2])
+
+
+def test_sweep_matches_single_runs(bars):
+    results = sweep_moving_average_cross(bars, [1, 5, 20, 50, 200], [5, 30, 50, 200], max_cells=5000)
+    assert len(results) == 11
+    for row in results.itertuples():
+        signals = reference_signals(bars, row.short_window, row.long_window)
+        total = reference_portfolio(bars['Close'].values, signals['positions'].values)[2]
+        assert row.final_equity == pytest.approx(total[-1], rel=1e-12)
+        assert row.trades == np.count_nonzero(np.nan_to_num(signals['positions'].values))
+
+
+@pytest.mark.parametrize('short_window, long_window', WINDOWS + [(5, 100)])
+def test_universe_matches_single_symbols(short_window, long_window):
+    universe = dict(('SYM%d' % i, synthetic_bars(1000, seed=i, freq='D', volatility=0.01)) for i in range(3))
+    universe['FLAT'] = plateau_bars()
+    # A symbol listed later than the others
+    universe['LATE'] = synthetic_bars(600, seed=9, start='2001-05-01', freq='D', volatility=0.01)
+    prices = align_universe(universe)
+    signals = UniverseMovingAverageCrossStrategy(prices, short_window, long_window).signals
+    for symbol, symbol_bars in universe.items():
+        expected = reference_signals(symbol_bars, short_window, long_window)['signal']
+        np.testing.assert_array_equal(signals[symbol].loc[expected.index].values, expected.values)
@@ -0,0 +1,27 @@
+import numpy as np
+
+from benchmark import synthetic_bars
+from MarketOnClosePortfolio import MarketOnClosePortfolio
+from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+from profiling import profiler
+
+
+def test_stages_are_owned_per_parameter_set_and_count_bars():
+    bars = synthetic_bars(1500, seed=9)
+    profiler.reset()
+    for short_window in (10, 20, np.int64(20)):
+        mac = MovingAverageCrossStrategy('SYN', bars, short_window, 100)
+        MarketOnClosePortfolio('SYN', bars, mac.get_signals()).generate_portfolio_detail()
+    records = profiler.report()
+    profiler.reset()
+
+    signals = dict((record['owner'], record) for record in records
+                   if record['stage'] == 'MovingAverageCrossStrategy.generate_signals')
+    assert sorted(signals) == ['MovingAverageCrossStrategy(SYN, long_window=100, short_window=10)',
+                               'MovingAverageCrossStrategy(SYN, long_window=100, short_window=20)']
+    assert signals['MovingAverageCrossStrategy(SYN, long_window=100, short_window=20)']['calls'] == 2
+
+    detail = [record for record in records
+              if record['stack'] == 'MarketOnClosePortfolio.generate_portfolio_detail']
+    assert len(detail) == 1
+    assert detail[0]['calls'] == 3 and detail[0]['rows'] == 3 * len(bars)
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('matplotlib')
+
+from benchmark import synthetic_bars
+from MarketOnClosePortfolio import MarketOnClosePortfolio
+from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+from report import lttb
+
+
+def test_lttb_keeps_the_ends_and_the_extremes():
+    y = np.sin(np.linspace(0.0, 20.0, 10000))
+    y[1234] = 5.0
+    kept = lttb(y, 200)
+    assert len(kept) == 200 and kept[0] == 0 and kept[-1] == len(y) - 1
+    assert np.all(np.diff(kept) > 0)
+    assert 1234 in kept
+
+
+def test_render_report_leaves_pyplot_and_backend_alone(tmp_path):
+    # A fresh interpreter, as pyplot may be imported by other tests here
+    path = str(tmp_path / 'report.png')
+    script = '\n'.join([
+        'import sys',
+        'import matplotlib',
+        'matplotlib.use("svg")',
+        'from benchmark import synthetic_bars',
+        'from MarketOnClosePortfolio import MarketOnClosePortfolio',
+        'from MovingAverageCrossStrategy import MovingAverageCrossStrategy',
+        'from report import render_report',
+        'bars = synthetic_bars(5000, seed=2)',
+        'signals = MovingAverageCrossStrategy("SYN", bars, 20, 100).get_signals()',
+        'portfolio = MarketOnClosePortfolio("SYN", bars, signals).generate_portfolio()',
+        'render_report(%r, bars, signals, portfolio, title="SYN")' % path,
+        'assert "matplotlib.pyplot" not in sys.modules',
+        'assert matplotlib.get_backend() == "svg", matplotlib.get_backend()',
+    ])
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', script], cwd=root, check=True)
+    with open(path, 'rb') as f:
+        assert f.read(8) == b'\x89PNG\r\n\x1a\n'
+
+
+def test_headless_plot_renders_the_report(tmp_path, monkeypatch):
+    import ma_cross
+
+    monkeypatch.delenv('DISPLAY', raising=False)
+    monkeypatch.delenv('WAYLAND_DISPLAY', raising=False)
+    monkeypatch.setattr(sys, 'platform', 'linux')
+    bars = synthetic_bars(3000, seed=6)
+    mac = MovingAverageCrossStrategy('SYN', bars, 20, 100)
+    portfolio = MarketOnClosePortfolio('SYN', bars, mac.get_signals()).generate_portfolio()
+    path = str(tmp_path / 'plot.png')
+    ma_cross.plot(mac, portfolio, path)
+    assert os.path.getsize(path) > 0
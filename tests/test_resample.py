@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import synthetic_bars
+from resample import AGGREGATES, MultiTimeframeBars
+
+RULES = ['5min', '15min', '1h', '1D']
+
+
+def minute_bars(n_bars=6000, nans=False, seed=9):
+    bars = synthetic_bars(n_bars, seed=seed)
+    rng = np.random.default_rng(seed)
+    # Gaps leave some buckets without any bar
+    bars = bars.drop(bars.index[1000:1400])
+    if nans:
+        for name in bars.columns:
+            bars.loc[rng.random(len(bars)) < 0.05, name] = np.nan
+        # A whole 5 minute bucket without a close, volume or high
+        bars.loc['2000-01-01 02:00':'2000-01-01 02:04', ['Close', 'Volume', 'High']] = np.nan
+    return bars
+
+
+def expected(bars, rule):
+    """pandas resample of bars, without the buckets holding no bar."""
+    resampled = bars.resample(rule)
+    frame = resampled.agg(dict((name, AGGREGATES.get(name, 'last')) for name in bars.columns))
+    return frame[resampled.size() > 0]
+
+
+def assert_matches(frame, expected):
+    # The bars are held at nanosecond resolution, whatever the input's
+    expected = expected.set_axis(expected.index.as_unit('ns'))
+    pd.testing.assert_frame_equal(frame, expected, check_freq=False, check_names=False)
+
+
+@pytest.mark.parametrize('nans', [False, True])
+def test_timeframes_match_pandas_resample(nans):
+    bars = minute_bars(nans=nans)
+    multi = MultiTimeframeBars(bars, RULES)
+    for rule in RULES + ['30min', '2h']:
+        assert_matches(multi.get(rule), expected(bars, rule))
+
+
+@pytest.mark.parametrize('nans', [False, True])
+@pytest.mark.parametrize('chunk', [1, 7, 60, 1000])
+def test_appends_match_a_full_build(nans, chunk):
+    bars = minute_bars(nans=nans)
+    multi = MultiTimeframeBars(bars.iloc[:3000], RULES)
+    for start in range(3000, len(bars), chunk):
+        multi.append(bars.iloc[start:start + chunk])
+        if start % 1000 < chunk:
+            # Frames read in between are dropped by the next append
+            multi.get('1h')
+    for rule in RULES:
+        assert_matches(multi.get(rule), expected(bars, rule))
+
+
+def test_trailing_partial_bar_merges_each_append():
+    bars = minute_bars(nans=True)
+    # An hour whose first opens and last closes are missing
+    hour = bars.loc['2000-01-01 05:00':'2000-01-01 05:59'].copy()
+    hour.iloc[:3, hour.columns.get_loc('Open')] = np.nan
+    hour.iloc[-3:, hour.columns.get_loc('Close')] = np.nan
+    history = bars.loc[:'2000-01-01 04:59']
+    multi = MultiTimeframeBars(history, ['15min', '1h'])
+    for i in range(len(hour)):
+        multi.append(hour.iloc[i:i + 1])
+        so_far = pd.concat([history, hour.iloc[:i + 1]])
+        for rule in ('15min', '1h'):
+            assert_matches(multi.get(rule).iloc[-1:], expected(so_far, rule).iloc[-1:])
+
+
+def test_append_rejects_bars_not_after_the_last():
+    bars = minute_bars()
+    multi = MultiTimeframeBars(bars.iloc[:100], ['5min'])
+    with pytest.raises(ValueError):
+        multi.append(bars.iloc[99:120])
+    multi.append(bars.iloc[:0])
+    assert len(multi.get('5min')) == 20
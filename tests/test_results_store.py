@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from benchmark import synthetic_bars
+from MarketOnClosePortfolio import MarketOnClosePortfolio
+from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+from results_store import ResultsStore, get_or_run
+
+
+def test_get_or_run_stores_each_run_once(tmp_path):
+    store = ResultsStore(str(tmp_path))
+    bars = synthetic_bars(1000, seed=1, freq='D', volatility=0.01)
+    calls = []
+
+    def backtest(short_window, long_window):
+        calls.append((short_window, long_window))
+        mac = MovingAverageCrossStrategy('SYN', bars, short_window, long_window)
+        return MarketOnClosePortfolio('SYN', bars, mac.get_signals()).generate_portfolio()
+
+    grid = [(short_window, long_window) for short_window in (5, 10, 20) for long_window in (50, 100)]
+    for _ in range(2):
+        runs = [get_or_run('ma_cross', 'SYN', bars, {'short_window': s, 'long_window': l},
+                           lambda s=s, l=l: backtest(s, l), store) for s, l in grid]
+    assert calls == grid
+    assert all(run['cached'] for run in runs)
+
+    top = store.top('sharpe', 3, symbol='SYN')
+    assert len(top) == 3 and top['sharpe'].is_monotonic_decreasing
+    assert (store.top('sharpe', 10, short_window=10)['params'].map(lambda p: p['short_window']) == 10).all()
+    with pytest.raises(ValueError):
+        store.top('unknown')
+
+    best = top['params'][0]
+    expected = backtest(best['short_window'], best['long_window'])
+    curve = store.load_curve(int(top['id'][0]))
+    np.testing.assert_array_equal(curve['total'].values, expected['total'].values)
+    assert (curve.index == expected.index).all()
+    store.close()
+
+
+def test_numpy_params_key_and_query_like_python_ones(tmp_path):
+    store = ResultsStore(str(tmp_path))
+    bars = synthetic_bars(500, seed=2, freq='D', volatility=0.01)
+    calls = []
+
+    def backtest():
+        calls.append(1)
+        mac = MovingAverageCrossStrategy('SYN', bars, 5, 50)
+        return MarketOnClosePortfolio('SYN', bars, mac.get_signals()).generate_portfolio()
+
+    # Windows as a sweep grid hands them out, then as plain ints
+    get_or_run('ma_cross', 'SYN', bars, {'short_window': np.int64(5), 'long_window': np.int32(50),
+                                         'stop': np.float64(0.05)}, backtest, store)
+    run = get_or_run('ma_cross', 'SYN', bars, {'short_window': 5, 'long_window': 50, 'stop': 0.05},
+                     backtest, store)
+    assert run['cached'] and len(calls) == 1
+    assert run['params'] == {'short_window': 5, 'long_window': 50, 'stop': 0.05}
+    assert len(store.top('sharpe', short_window=5)) == 1
+    assert len(store.top('sharpe', short_window=np.int64(5), stop=np.float64(0.05))) == 1
+    store.close()
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from benchmark import synthetic_bars
+from MarketOnClosePortfolio import MarketOnClosePortfolio
+from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+from reference import WINDOWS, plateau_bars
+from shared_bars import SharedBars, ma_cross_task, run_shared
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_run_shared_matches_dataframe_path(processes):
+    universe = {'GBM': synthetic_bars(3000, seed=4, freq='D', volatility=0.01), 'FLAT': plateau_bars()}
+    tasks = [(symbol, {'short_window': short_window, 'long_window': long_window})
+             for symbol in sorted(universe) for short_window, long_window in WINDOWS + [(5, 100)]]
+    with SharedBars(universe, columns=['Close']) as shared:
+        results = run_shared(shared, ma_cross_task, tasks, processes)
+
+    for (symbol, params), (final_equity, orders) in zip(tasks, results):
+        bars = universe[symbol]
+        signals = MovingAverageCrossStrategy(symbol, bars, **params).get_signals()
+        total = MarketOnClosePortfolio(symbol, bars, signals).generate_portfolio()['total']
+        assert final_equity == total.iloc[-1]
+        assert orders == np.count_nonzero(np.nan_to_num(signals['positions'].values))
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from benchmark import synthetic_bars
+from ExponentialMovingAverageCrossStrategy import ExponentialMovingAverageCrossStrategy
+from MarketOnClosePortfolio import MarketOnClosePortfolio
+from MovingAverageCrossStrategy import MovingAverageCrossStrategy
+from reference import WINDOWS, plateau_bars
+from streaming import replay
+
+
+@pytest.mark.parametrize('stop_loss', [None, 0.03])
+@pytest.mark.parametrize('plateaus', [False, True])
+@pytest.mark.parametrize('strategy_class', [MovingAverageCrossStrategy, ExponentialMovingAverageCrossStrategy])
+@pytest.mark.parametrize('short_window, long_window', WINDOWS + [(5, 100)])
+def test_on_bar_matches_batch(strategy_class, short_window, long_window, plateaus, stop_loss):
+    bars = plateau_bars() if plateaus else synthetic_bars(3000, seed=8)
+    batch_strategy = strategy_class('SYN', bars, short_window, long_window, stop_loss=stop_loss)
+    signals = batch_strategy.get_signals()
+    batch = MarketOnClosePortfolio('SYN', bars, signals).generate_portfolio()
+
+    strategy = strategy_class('SYN', None, short_window, long_window, stop_loss=stop_loss)
+    portfolio = MarketOnClosePortfolio('SYN', None, None)
+    rows = list(replay(strategy, portfolio, bars))
+    for name in ('signal', 'positions'):
+        np.testing.assert_array_equal([signal[name] for _, signal, _ in rows], signals[name].values)
+    for name in ('short_mavg', 'long_mavg'):
+        np.testing.assert_allclose([signal[name] for _, signal, _ in rows], signals[name].values, rtol=1e-12)
+    np.testing.assert_array_equal([row['total'] for _, _, row in rows], batch['total'].values)
+
+    # Resetting replays the same bars from scratch
+    strategy.reset_stream()
+    portfolio.reset_stream()
+    again = [row['total'] for _, _, row in replay(strategy, portfolio, bars)]
+    np.testing.assert_array_equal(again, batch['total'].values)
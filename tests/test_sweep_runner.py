@@ -0,0 +1,147 @@
+import multiprocessing
+import time
+
+import numpy as np
+import pytest
+
+import sweep_runner
+from bar_store import BarStore
+from benchmark import synthetic_bars
+from sweep_runner import SweepQueue, run_worker
+
+SYMBOLS = ['AAA', 'BBB']
+SHORT = [5, 10, 20]
+LONG = [30, 50, 100]
+CONFIG = {'source': 'synthetic', 'start': '2000-01-01', 'end': '2005-12-31'}
+
+
+def synthetic_source(symbol, start, end, frequency):
+    bars = synthetic_bars(3000, seed=SYMBOLS.index(symbol), freq='D', volatility=0.01)
+    return bars.loc[start:end]
+
+
+@pytest.fixture
+def path(tmp_path):
+    # Workers build their own BarStore, so the bars are cached up front
+    store = BarStore(str(tmp_path / 'bars'), {'synthetic': synthetic_source})
+    for symbol in SYMBOLS:
+        store.get(symbol, 'synthetic', CONFIG['start'], CONFIG['end'])
+    path = str(tmp_path / 'sweep.sqlite')
+    queue = SweepQueue(path)
+    queue.set_config(store=str(tmp_path / 'bars'), **CONFIG)
+    assert queue.add_tasks(SYMBOLS, SHORT, LONG) == 18
+    assert queue.add_tasks(SYMBOLS, SHORT, LONG) == 0
+    queue.close()
+    return path
+
+
+def expected_results(path, tmp_path):
+    # The same sweep worked off in one go by a single worker
+    reference = str(tmp_path / 'reference.sqlite')
+    queue = SweepQueue(reference)
+    queue.set_config(**SweepQueue(path).config())
+    queue.add_tasks(SYMBOLS, SHORT, LONG)
+    assert run_worker(reference) == 18
+    return queue.results().sort_values(['symbol', 'short_window', 'long_window']).reset_index(drop=True)
+
+
+def sorted_results(queue):
+    return queue.results().sort_values(['symbol', 'short_window', 'long_window']).reset_index(drop=True)
+
+
+def claim_all(queue, worker):
+    tasks = []
+    while True:
+        batch = queue.claim(worker, batch=100, lease=60.0)
+        if not batch:
+            return tasks
+        tasks += batch
+
+
+def test_claim_leases_batches_of_one_symbol(path):
+    queue = SweepQueue(path)
+    first = queue.claim('w1', batch=4, lease=60.0)
+    second = queue.claim('w2', batch=100, lease=60.0)
+    third = queue.claim('w3', batch=100, lease=60.0)
+    assert len(first) == 4 and len(set(task[1] for task in first)) == 1
+    assert len(set(task[1] for task in second)) == 1
+    assert queue.claim('w4', batch=100, lease=60.0) == []
+    claimed = [task[0] for task in first + second + third]
+    assert len(claimed) == len(set(claimed)) == 18
+    assert queue.progress() == {'running': 18}
+    assert queue.next_runnable() > time.time() + 50.0
+
+
+def test_expired_leases_are_claimed_again(path):
+    queue = SweepQueue(path)
+    stale = queue.claim('dead', batch=5, lease=0.2)
+    assert len(claim_all(queue, 'w1')) == 13
+    assert queue.claim('w2', batch=100, lease=60.0) == []
+    time.sleep(0.3)
+    taken = queue.claim('w2', batch=100, lease=60.0)
+    assert sorted(taken) == sorted(stale)
+    attempts = dict(queue.db.execute('SELECT id, attempts FROM tasks WHERE worker = ?', ('w2',)))
+    assert set(attempts.values()) == {2}
+
+
+def test_failed_tasks_back_off_then_fail(path):
+    queue = SweepQueue(path)
+    tasks = queue.claim('w1', batch=2)
+    queue.fail(tasks, 'boom', max_attempts=2, backoff=0.2)
+    assert queue.progress()['pending'] == 18
+    # Still backing off, other tasks are handed out first
+    others = claim_all(queue, 'w1')
+    assert len(others) == 16 and not set(others) & set(tasks)
+    time.sleep(0.25)
+    again = queue.claim('w1', batch=100)
+    assert sorted(again) == sorted(tasks)
+    queue.fail(again, 'boom again', max_attempts=2, backoff=0.2)
+    assert queue.progress()['failed'] == 2
+    assert set(row[0] for row in queue.db.execute("SELECT error FROM tasks WHERE status = 'failed'")) == \
+        {'boom again'}
+
+
+def test_resume_after_interruption(path, tmp_path):
+    queue = SweepQueue(path)
+    tasks = queue.claim('w1', batch=4)
+    queue.complete('w1', tasks, [1.0] * 4, [0] * 4, 100000.0)
+    queue.close()
+
+    # Finished tasks are never rerun, the others are worked off
+    assert run_worker(path) == 14
+    queue = SweepQueue(path)
+    assert queue.progress() == {'done': 18}
+    rerun = sorted_results(queue).set_index(['symbol', 'short_window', 'long_window'])
+    expected = expected_results(path, tmp_path).set_index(['symbol', 'short_window', 'long_window'])
+    finished = [task[1:] for task in tasks]
+    assert (rerun.loc[finished, 'final_equity'] == 1.0).all()
+    np.testing.assert_array_equal(rerun.drop(finished)['final_equity'],
+                                  expected.drop(finished)['final_equity'])
+
+
+def stalled_worker(path):
+    # Claims a batch and never finishes it, until killed
+    def evaluate_forever(*args):
+        time.sleep(3600)
+    sweep_runner.evaluate_pairs = evaluate_forever
+    run_worker(path, worker='stalled', batch=4, lease=1.0)
+
+
+def test_killed_worker_is_taken_over(path, tmp_path):
+    process = multiprocessing.Process(target=stalled_worker, args=(path,))
+    process.start()
+    queue = SweepQueue(path)
+    deadline = time.time() + 30.0
+    while queue.progress().get('running', 0) < 4 and time.time() < deadline:
+        time.sleep(0.02)
+    process.kill()
+    process.join()
+    assert queue.progress() == {'pending': 14, 'running': 4}
+
+    # A new worker waits for the dead worker's lease rather than exit
+    assert run_worker(path, poll=0.1) == 18
+    assert queue.progress() == {'done': 18}
+    stalled = queue.db.execute("SELECT attempts FROM tasks WHERE attempts > 1").fetchall()
+    assert stalled == [(2,)] * 4
+    np.testing.assert_array_equal(sorted_results(queue)['final_equity'],
+                                  expected_results(path, tmp_path)['final_equity'])
@@ -0,0 +1,131 @@
+# universe.py
+
+import numpy as np
+import pandas as pd
+
+from indicators import run_lengths
+from portfolio import Portfolio
+from strategy import Strategy
+
+
+def align_universe(bars_by_symbol, field='Close'):
+    """Aligns one price field of many symbols into a single
+    (time x symbol) DataFrame backed by one float64 block, so the
+    strategy and portfolio work on the whole universe as a single array.
+
+    The union of all dates is used as index, gaps after a symbol's first
+    bar are forward filled and dates before it are left as NaN.
+
+    Requires:
+    bars_by_symbol - A mapping of symbol to its DataFrame of bars.
+    field - The bar column to align, e.g. 'Close' or 'Open'."""
+    prices = pd.concat(dict((symbol, bars[field]) for symbol, bars in bars_by_symbol.items()),
+                       axis=1).sort_index().ffill()
+    return pd.DataFrame(prices.values.astype(np.float64),
+                        index=prices.index, columns=prices.columns)
+
+
+def _rolling_mean(prefix, counts, window, values, runs):
+    """Moving average over the time axis from the prefix sums of a
+    (time x symbol) block and of its listed bars, skipping the NaN bars
+    before each listing like rolling(window=window, min_periods=1).mean()
+    does on every column. Windows holding a single repeated price, by
+    the run_lengths of values, average to it exactly as they do there."""
+    end = np.arange(1, len(prefix))
+    start = np.maximum(end - window, 0)
+    observations = counts[end] - counts[start]
+    with np.errstate(invalid='ignore'):
+        means = (prefix[end] - prefix[start]) / observations
+    np.copyto(means, values, where=runs >= observations)
+    return means
+
+
+class UniverseMovingAverageCrossStrategy(Strategy):
+    """The moving average crossover for a whole universe of symbols at
+    once, each column of prices getting the same signal logic as
+    MovingAverageCrossStrategy.
+
+    Requires:
+    prices - A (time x symbol) DataFrame of close prices, as built by
+        align_universe.
+    short_window - Lookback period for short moving average.
+    long_window - Lookback period for long moving average."""
+
+    def __init__(self, prices, short_window=100, long_window=400):
+        self.prices = prices
+        self.short_window = short_window
+        self.long_window = long_window
+        self.signals = self.generate_signals()
+
+    def generate_signals(self):
+        """Returns a (time x symbol) DataFrame of signals to be invested
+        or not (1 or 0), which are only set once a symbol has more than
+        short_window bars of history."""
+        values = self.prices.values
+        listed = ~np.isnan(values)
+
+        # Prefix sums of prices and of the number of listed bars, and the
+        # runs of equal prices, shared by both moving averages
+        prefix = np.zeros((len(values) + 1, values.shape[1]))
+        np.cumsum(np.where(listed, values, 0.0), axis=0, out=prefix[1:])
+        counts = np.zeros((len(values) + 1, values.shape[1]))
+        np.cumsum(listed, axis=0, out=counts[1:])
+        runs = run_lengths(values)
+
+        short_mavg = _rolling_mean(prefix, counts, self.short_window, values, runs)
+        long_mavg = _rolling_mean(prefix, counts, self.long_window, values, runs)
+        signal = np.where(short_mavg > long_mavg, 1.0, 0.0)
+        signal[counts[1:] <= self.short_window] = 0.0
+        return pd.DataFrame(signal, index=self.prices.index, columns=self.prices.columns)
+
+    def get_positions(self):
+        """Returns the trading orders (1, 0, -1) per symbol."""
+        return self.signals.diff().fillna(0.0)
+
+
+class UniverseMarketOnClosePortfolio(Portfolio):
+    """Holds a fixed number of shares of every symbol whose signal is
+    set, filled at the close, with all symbols drawing on one cash
+    account.
+
+    Requires:
+    prices - A (time x symbol) DataFrame of close prices.
+    signals - A (time x symbol) DataFrame of signals (1 or 0).
+    shares - The number of shares bought per symbol on a signal.
+    initial_capital - The amount in cash at the start of the portfolio."""
+
+    def __init__(self, prices, signals, shares=100, initial_capital=100000.0):
+        self.prices = prices
+        self.signals = signals
+        self.shares = shares
+        self.initial_capital = float(initial_capital)
+        self.positions = self.generate_positions()
+
+    def generate_positions(self):
+        return self.shares * self.signals
+
+    def _cash_flows(self):
+        # Signals are always zero before a listing, so unlisted prices
+        # can be treated as zero
+        prices = np.nan_to_num(self.prices.values)
+        positions = self.positions.values
+        pos_diff = np.zeros_like(positions)
+        pos_diff[1:] = np.diff(positions, axis=0)
+        return positions * prices, np.cumsum(pos_diff * prices, axis=0)
+
+    def generate_symbol_equity(self):
+        """Returns a (time x symbol) DataFrame of the profit or loss each
+        symbol contributed to the shared account."""
+        holdings, spent = self._cash_flows()
+        return pd.DataFrame(holdings - spent, index=self.prices.index,
+                            columns=self.prices.columns)
+
+    def generate_portfolio(self):
+        """Returns the aggregate holdings, shared cash, total and returns."""
+        holdings, spent = self._cash_flows()
+        portfolio = pd.DataFrame(index=self.prices.index)
+        portfolio['holdings'] = holdings.sum(axis=1)
+        portfolio['cash'] = self.initial_capital - spent.sum(axis=1)
+        portfolio['total'] = portfolio['holdings'] + portfolio['cash']
+        portfolio['returns'] = portfolio['total'].pct_change()
+        return portfolio